@@ -0,0 +1,244 @@
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+"""
+Hooks that are told about every request the miniclient performs, with
+its timings, and a hook that keeps latency histograms per endpoint.
+
+A hook is an object with on_request_start(info) and on_request_end(info)
+methods, which are passed the same RequestInfo. They are called in the
+thread that performs the request, which for asynchronous requests is
+the RequestReactor thread, so they should be quick and thread safe.
+Errors raised by hooks are printed and otherwise ignored.
+"""
+
+from __future__ import with_statement
+import bisect, pycurl, time, traceback, urlparse
+from threading import Lock
+
+hooksLock = Lock()
+hooks = ()
+
+def addRequestHook(hook):
+    """
+    Have hook told about all requests made from now on.
+    """
+    global hooks
+    with hooksLock:
+        hooks = hooks + (hook,)
+
+def removeRequestHook(hook):
+    global hooks
+    with hooksLock:
+        hooks = tuple(h for h in hooks if h is not hook)
+
+def requestHooks():
+    return hooks
+
+# pycurl only has APPCONNECT_TIME when built against libcurl 7.19 or later.
+_APPCONNECT_TIME = getattr(pycurl, 'APPCONNECT_TIME', None)
+
+class RequestInfo(object):
+    """
+    What the hooks are told about a request. method, url and path (of
+    the url, without the query) are known at the start. At the end,
+    status is the HTTP status, or None if no response was received, in
+    which case error is the exception the request failed with. error is
+    also set when a response could not be decoded.
+
+    bytesUp and bytesDown count the bytes of the request and response
+    bodies. The times are in seconds: startTime is a time.time(), and
+    nameLookupTime, connectTime, appConnectTime (the end of the SSL
+    handshake, 0 for plain HTTP), preTransferTime, startTransferTime
+    (the first byte of the response) and totalTime are measured from
+    the start of the request, as curl reports them. decodeTime is the
+    time spent decoding the response once it was received, which is
+    not included in totalTime.
+    """
+    def __init__(self, hooks, method, url):
+        self.hooks = hooks
+        self.method = method
+        self.url = url
+        self.path = urlparse.urlsplit(url)[2]
+        self.status = None
+        self.error = None
+        self.bytesUp = self.bytesDown = 0
+        self.nameLookupTime = self.connectTime = self.appConnectTime = 0.0
+        self.preTransferTime = self.startTransferTime = self.totalTime = 0.0
+        self.decodeTime = 0.0
+        self.startTime = time.time()
+        self._call('on_request_start')
+
+    def _measure(self, curl):
+        """
+        Read the timings and sizes of the request from its curl handle,
+        which must not have been reused yet.
+        """
+        getinfo = curl.getinfo
+        self.nameLookupTime = getinfo(pycurl.NAMELOOKUP_TIME)
+        self.connectTime = getinfo(pycurl.CONNECT_TIME)
+        if _APPCONNECT_TIME is not None:
+            self.appConnectTime = getinfo(_APPCONNECT_TIME)
+        self.preTransferTime = getinfo(pycurl.PRETRANSFER_TIME)
+        self.startTransferTime = getinfo(pycurl.STARTTRANSFER_TIME)
+        self.totalTime = getinfo(pycurl.TOTAL_TIME)
+        self.bytesUp = int(getinfo(pycurl.SIZE_UPLOAD))
+        self.bytesDown = int(getinfo(pycurl.SIZE_DOWNLOAD))
+
+    def _end(self, status=None, error=None):
+        self.status = status
+        if error is not None:
+            self.error = error
+        self._call('on_request_end')
+
+    def _call(self, method):
+        for hook in self.hooks:
+            try:
+                getattr(hook, method)(self)
+            except Exception:
+                traceback.print_exc()
+
+    def phases(self):
+        """
+        Return the time spent in each phase of the request as a
+        dictionary: dns, connect, ssl, wait (from sending the request to
+        the first byte of the response, which includes the time the
+        server took), transfer (of the rest of the response) and decode.
+        A reused connection takes no time to look up or connect.
+        """
+        sent = max(self.preTransferTime, self.appConnectTime, self.connectTime)
+        started = self.startTransferTime or self.totalTime
+        return {'dns': self.nameLookupTime,
+                'connect': max(self.connectTime - self.nameLookupTime, 0.0),
+                'ssl': max(self.appConnectTime - self.connectTime, 0.0),
+                'wait': max(started - sent, 0.0),
+                'transfer': max(self.totalTime - started, 0.0),
+                'decode': self.decodeTime}
+
+PHASES = ('dns', 'connect', 'ssl', 'wait', 'transfer', 'decode')
+
+# Upper bounds in seconds of the histogram buckets; the last bucket
+# holds everything slower.
+DEFAULT_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+                  1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+def endpoint(info):
+    """
+    The default key requests are grouped under: the method and the path.
+    """
+    return "%s %s" % (info.method, info.path)
+
+class _Histogram(object):
+    def __init__(self, bounds):
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytesUp = 0
+        self.bytesDown = 0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+
+class HistogramCollector(object):
+    """
+    A request hook that keeps a histogram of the latency (totalTime plus
+    decodeTime) of the requests to each endpoint, together with their
+    number, errors, bytes and the total time spent in each phase (see
+    RequestInfo.phases). Requests are grouped by key(info), the method
+    and path by default.
+
+    Install it with addRequestHook(collector); stats() and report()
+    show what it has collected so far.
+    """
+    def __init__(self, bounds=DEFAULT_BOUNDS, key=endpoint):
+        self.bounds = tuple(bounds)
+        self.key = key
+        self.lock = Lock()
+        self.histograms = {}
+
+    def on_request_start(self, info):
+        pass
+
+    def on_request_end(self, info):
+        latency = info.totalTime + info.decodeTime
+        phases = info.phases()
+        key = self.key(info)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram(self.bounds)
+            histogram.counts[bisect.bisect_left(self.bounds, latency)] += 1
+            histogram.count += 1
+            if info.error is not None or info.status is None or info.status >= 400:
+                histogram.errors += 1
+            histogram.total += latency
+            histogram.max = max(histogram.max, latency)
+            histogram.bytesUp += info.bytesUp
+            histogram.bytesDown += info.bytesDown
+            for phase, seconds in phases.iteritems():
+                histogram.phases[phase] += seconds
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def _percentile(self, histogram, fraction):
+        """
+        The upper bound of the bucket the given fraction of the requests
+        falls in, or the maximum for the last bucket.
+        """
+        rank = fraction * histogram.count
+        seen = 0
+        for bound, count in zip(self.bounds, histogram.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, histogram.max)
+        return histogram.max
+
+    def stats(self):
+        """
+        Return a dictionary mapping each key to a dictionary with the
+        count, errors, mean, max and (bucket bound) p50, p90 and p99
+        latency, the bytes sent and received, the mean time of each
+        phase, and the bucket counts as (upper bound, count) pairs.
+        """
+        with self.lock:
+            result = {}
+            for key, histogram in self.histograms.iteritems():
+                count = histogram.count
+                result[key] = {
+                    'count': count,
+                    'errors': histogram.errors,
+                    'mean': histogram.total / count,
+                    'max': histogram.max,
+                    'p50': self._percentile(histogram, 0.5),
+                    'p90': self._percentile(histogram, 0.9),
+                    'p99': self._percentile(histogram, 0.99),
+                    'bytesUp': histogram.bytesUp,
+                    'bytesDown': histogram.bytesDown,
+                    'phases': dict((phase, seconds / count)
+                                   for phase, seconds in histogram.phases.iteritems()),
+                    'buckets': zip(self.bounds + (None,), histogram.counts)}
+            return result
+
+    def report(self):
+        """
+        Return the stats as a table, in milliseconds, busiest endpoint
+        first.
+        """
+        stats = self.stats()
+        lines = ["%-50s %7s %5s %8s %8s %8s %8s  %s" % (
+            "endpoint", "count", "err", "mean", "p50", "p99", "max",
+            " ".join("%8s" % phase for phase in PHASES))]
+        for key in sorted(stats, key=lambda key: -stats[key]['count']):
+            s = stats[key]
+            lines.append("%-50s %7d %5d %8.1f %8.1f %8.1f %8.1f  %s" % (
+                key, s['count'], s['errors'], s['mean'] * 1000, s['p50'] * 1000,
+                s['p99'] * 1000, s['max'] * 1000,
+                " ".join("%8.1f" % (s['phases'][phase] * 1000) for phase in PHASES)))
+        return "\n".join(lines)
@@ -7,13 +7,19 @@
 ###############################################################################
 
 from __future__ import with_statement
-import time, cjson, math, operator, re, threading, urllib
+import copy, time, cjson, heapq, itertools, math, operator, os, re, threading, urllib, weakref
 from contextlib import contextmanager
 from request import *
+from request import _invalidateQueryCache, _jsonResult, _threadBatches
 
 class Service(object):
     def __init__(self, url, user=None, password=None, cainfo=None, sslcert=None,
-        verifyhost=None, verifypeer=None):
+        verifyhost=None, verifypeer=None, compressRequests=False, compressThreshold=16384):
+        """compressRequests asks for the statements sent by
+        addStatements, deleteStatements, loadData and loadFile to be
+        gzip-compressed when they are at least compressThreshold bytes.
+        It is switched off again if the server turns out not to accept
+        compressed requests."""
         self.url = url
         self.user = user
         self.password = password
@@ -22,15 +28,96 @@ class Service(object):
         self.sslcert = sslcert
         self.verifyhost = verifyhost
         self.verifypeer = verifypeer
+        self.compressRequests = compressRequests
+        self.compressThreshold = compressThreshold
+        self.queryCache = None
 
     def _instanceFromUrl(self, constructor, url):
-        return constructor(url, self.user, self.password)
+        instance = constructor(url, self.user, self.password)
+        instance.compressRequests = self.compressRequests
+        instance.compressThreshold = self.compressThreshold
+        return instance
+
+    def asynchronous(self):
+        """
+        Return a copy of this object whose requests are performed in the
+        background by the RequestReactor. Methods that return the
+        server's response as is (see batch) return Futures instead of
+        blocking until the response is in.
+        """
+        service = copy.copy(self)
+        service._batch = RequestReactor.instance()
+        return service
+
+    @contextmanager
+    def batch(self, maxConnections=8):
+        """
+        Queue the requests made through this object within the with
+        statement, and perform them concurrently, over at most
+        maxConnections connections, when it exits. Within the with
+        statement calls return Futures instead of results. Only methods
+        that return the server's response as is (such as getStatements
+        and evalSparqlQuery) can be batched; callbacks and saveResponse
+        are not affected.
+
+        Only the requests of the calling thread are queued; other threads
+        using this object go on as before. A nested batch is performed
+        when its own with statement exits.
+        """
+        batch = RequestBatch(maxConnections)
+        batches = _threadBatches.__dict__.setdefault('batches', {})
+        outer = batches.get(id(self))
+        batches[id(self)] = batch
+        try:
+            yield batch
+        finally:
+            if outer is None:
+                del batches[id(self)]
+            else:
+                batches[id(self)] = outer
+        batch.execute()
     
     def toBaseClient(self):
         url = re.match("^https?://[^/]+", self.url).group(0)
         return self._instanceFromUrl(Client, url)
 
 
+class _ProgressReader(object):
+    """File-like wrapper that reports how much of fileobj has been
+    read to progress(bytes, lines). fileno, tell and seek are those of
+    fileobj, so that its size can be told and it can be rewound."""
+    def __init__(self, fileobj, progress):
+        self.fileobj = fileobj
+        self.progress = progress
+        self.bytes = 0
+        self.lines = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        if data: self.advance(len(data), data.count("\n"))
+        return data
+
+    def fileno(self):
+        return self.fileobj.fileno()
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Only rewinding is expected: what was read is to be read again.
+        position = self.fileobj.tell()
+        self.fileobj.seek(offset, whence)
+        if self.fileobj.tell() != position:
+            self.bytes = max(self.bytes - (position - self.fileobj.tell()), 0)
+            if self.bytes == 0: self.lines = 0
+            if self.progress: self.progress(self.bytes, self.lines)
+
+    def advance(self, bytes, lines):
+        self.bytes += bytes
+        self.lines += lines
+        if self.progress: self.progress(self.bytes, self.lines)
+
+
 class Catalog(Service):
     def listRepositories(self):
         """Returns the names of repositories in the catalog."""
@@ -207,6 +294,9 @@ class Client(Catalog):
 
 class Repository(Service):
     sessionAlive = None
+    # Set by the SessionKeeper when a ping of the session fails, which
+    # means that the server has most likely expired it.
+    sessionLost = False
     
     def getSize(self, context=None):
         """Returns the amount of triples in the repository."""
@@ -218,36 +308,88 @@ class Repository(Service):
 
     def evalSparqlQuery(self, query, infer=False, context=None, namedContext=None, callback=None,
                         bindings=None, planner=None, checkVariables=None, count=False, accept=None, analyze=False,
-                        analysisTechnique=None, analysisTimeout=None, update=False):
+                        analysisTechnique=None, analysisTimeout=None, update=False, stream=False,
+                        limit=None, offset=None, raw=False):
         """Execute a SPARQL query. Context can be None or a list of
         contexts -- strings in "http://foo.com" form or "null" for the
         default context. Return type depends on the query type. ASK
         gives a boolean, SELECT a {names, values} object containing
         lists of lists of terms. CONSTRUCT and DESCRIBE return a list
         of lists representing statements. Callback WILL NOT work on
-        ASK queries."""
+        ASK queries. When stream is true, a RowStream over the rows is
+        returned instead of the decoded response, and when raw is true
+        the response as it was received. Limit and offset select a range
+        of the results, as a query's LIMIT and OFFSET would."""
         if accept is None:
             accept="text/integer" if count else "application/json"
         if analyze:
             accept="text/plain"
-        if bindings is not None:
-            bindings = "".join(["&$" + urllib.quote(a) + "=" + urllib.quote(b.encode("utf-8")) for a, b in bindings.items()])
-        return jsonRequest(self, "POST" if update else "GET", self.url,
-                   urlenc(query=query, infer=infer, context=context, namedContext=namedContext,
-                       planner=planner, checkVariables=checkVariables,
-                       analyzeIndicesUsed=analyze, queryAnalysisTechnique=analysisTechnique,
-                       queryAnalysisTimeout=analysisTimeout) + (bindings or ""),
-                       rowreader=callback and RowReader(callback),
-                       accept=accept)
-
-    def evalPrologQuery(self, query, infer=False, callback=None, limit=None, count=False, accept=None):
-        """Execute a Prolog query. Returns a {names, values} object."""
+        params = Repository.encodeSparqlQuery(query, infer=infer, context=context, namedContext=namedContext,
+            planner=planner, checkVariables=checkVariables, analyze=analyze,
+            analysisTechnique=analysisTechnique, analysisTimeout=analysisTimeout, limit=limit, offset=offset)
+        return self.evalEncodedQuery(params, Repository.encodeBindings(bindings), callback=callback,
+                                     accept=accept, update=update, stream=stream, raw=raw)
+
+    @staticmethod
+    def encodeSparqlQuery(query, infer=False, context=None, namedContext=None, planner=None,
+                          checkVariables=None, analyze=False, analysisTechnique=None,
+                          analysisTimeout=None, limit=None, offset=None):
+        """Return the request parameters for a SPARQL query, as taken by
+        evalEncodedQuery. The arguments are those of evalSparqlQuery."""
+        return urlenc(query=query, infer=infer, context=context, namedContext=namedContext,
+                      planner=planner, checkVariables=checkVariables,
+                      analyzeIndicesUsed=analyze, queryAnalysisTechnique=analysisTechnique,
+                      queryAnalysisTimeout=analysisTimeout, limit=limit, offset=offset)
+
+    @staticmethod
+    def encodeBindings(bindings):
+        """Return the request parameters binding the variables of a query
+        to terms, given a dictionary of variable names to ntriples
+        strings."""
+        if not bindings:
+            return ""
+        return "".join(["&$" + urllib.quote(a) + "=" + urllib.quote(b.encode("utf-8")) for a, b in bindings.items()])
+
+    def evalEncodedQuery(self, params, bindings="", callback=None, accept="application/json",
+                         update=False, stream=False, raw=False):
+        """Execute a SPARQL query whose parameters were prepared by
+        encodeSparqlQuery and encodeBindings. Returns what
+        evalSparqlQuery does."""
+        return jsonRequest(self, "POST" if update else "GET", self.url, params + bindings,
+                           rowreader=callback and RowReader(callback),
+                           accept=accept, stream=stream, raw=raw)
+
+    def evalEncodedQueries(self, params, bindingsList, update=False, maxConnections=8):
+        """Execute a query prepared by encodeSparqlQuery once for each
+        of the encoded bindings in bindingsList, concurrently over at
+        most maxConnections connections, and return a Future for each
+        result. The requests go through a RequestBatch of their own,
+        so other requests made through this object are not affected."""
+        batch = RequestBatch(maxConnections)
+        finish = lambda status, body: _jsonResult(status, body, "application/json")
+        futures = [batch.add(self, "POST" if update else "GET", self.url, params + bindings,
+                             accept="application/json", contentType="application/x-www-form-urlencoded",
+                             finish=finish)
+                   for bindings in bindingsList]
+        try:
+            batch.execute()
+        finally:
+            if update:
+                _invalidateQueryCache(self)
+        return futures
+
+    def evalPrologQuery(self, query, infer=False, callback=None, limit=None, count=False, accept=None, stream=False,
+                        raw=False):
+        """Execute a Prolog query. Returns a {names, values} object,
+        or a RowStream over it when stream is true, or the response as
+        it was received when raw is true. Prolog queries are not taken to
+        modify the store (see jsonRequest)."""
         if accept is None:
             accept="text/integer" if count else "application/json"
         return jsonRequest(self, "POST", self.url,
                            urlenc(query=query, infer=infer, queryLn="prolog", limit=limit),
                            rowreader=callback and RowReader(callback),
-                           accept=accept)
+                           accept=accept, stream=stream, raw=raw, invalidates=False)
 
     def definePrologFunctors(self, definitions):
         """Add Prolog functors to the environment. Takes a string
@@ -275,16 +417,17 @@ class Repository(Service):
         self.runAsName = username
 
     def commit(self):
-        nullRequest(self, "POST", "/commit")
+        return nullRequest(self, "POST", "/commit")
 
     def rollback(self):
-        nullRequest(self, "POST", "/rollback")
+        return nullRequest(self, "POST", "/rollback")
 
     def getStatements(self, subj=None, pred=None, obj=None, context=None, infer=False, callback=None,
-                      limit=None, offset=None, tripleIDs=False, count=False):
+                      limit=None, offset=None, tripleIDs=False, count=False, stream=False):
         """Retrieve all statements matching the given constraints.
         Context can be None or a list of contexts, as in
-        evalSparqlQuery."""
+        evalSparqlQuery. When stream is true, a RowStream over the
+        statements is returned instead of a list."""
         if subj == [] or pred == [] or obj == [] or context == []: return []
         subjEnd, predEnd, objEnd = None, None, None
         if isinstance(subj, tuple): subj, subjEnd = subj
@@ -298,7 +441,7 @@ class Repository(Service):
             urlenc(subj=subj, subjEnd=subjEnd, pred=pred, predEnd=predEnd,
                 obj=obj, objEnd=objEnd, context=context, infer=infer,
                 limit=limit, offset=offset),
-            rowreader=callback and RowReader(callback), accept=accept)
+            rowreader=callback and RowReader(callback), accept=accept, stream=stream)
 
     def getStatementsById(self, ids, returnIDs=True):
         return jsonRequest(self, "GET", "/statements/id", urlenc(id=ids),
@@ -306,21 +449,26 @@ class Repository(Service):
 
     def addStatement(self, subj, pred, obj, context=None):
         """Add a single statement to the repository."""
-        nullRequest(self, "POST", "/statements", cjson.encode([[subj, pred, obj, context]]),
+        return nullRequest(self, "POST", "/statements", cjson.encode([[subj, pred, obj, context]]),
                     contentType="application/json")
 
     def deleteMatchingStatements(self, subj=None, pred=None, obj=None, context=None):
         """Delete all statements matching the constraints from the
         repository. Context can be None or a single graph name."""
-        nullRequest(self, "DELETE", "/statements",
+        return nullRequest(self, "DELETE", "/statements",
                     urlenc(subj=subj, pred=pred, obj=obj, context=context))
 
     def addStatements(self, quads, commitEvery=None):
         """Add a collection of statements to the repository. Quads
         should be an array of four-element arrays, where the fourth
         element, the graph name, may be None."""
-        nullRequest(self, "POST", "/statements?" + urlenc(commit=commitEvery),
-            cjson.encode(quads), contentType="application/json")
+        return self.addEncodedStatements(cjson.encode(quads), commitEvery)
+
+    def addEncodedStatements(self, body, commitEvery=None):
+        """Like addStatements, for quads that have already been
+        encoded as JSON."""
+        return nullRequest(self, "POST", "/statements?" + urlenc(commit=commitEvery),
+            body, contentType="application/json", compress=True)
 
     class UnsupportedFormatError(Exception):
         def __init__(self, format): self.format = format
@@ -332,29 +480,47 @@ class Repository(Service):
         else: raise Repository.UnsupportedFormatError(format)
 
     def loadData(self, data, format, baseURI=None, context=None, commitEvery=None):
-        nullRequest(self, "POST", "/statements?" + urlenc(context=context, baseURI=baseURI, commit=commitEvery),
-                    data.encode("utf-8"), contentType=self.checkFormat(format))
-
-    def loadFile(self, file, format, baseURI=None, context=None, serverSide=False, commitEvery=None):
+        return nullRequest(self, "POST", "/statements?" + urlenc(context=context, baseURI=baseURI, commit=commitEvery),
+                           data.encode("utf-8"), contentType=self.checkFormat(format), compress=True)
+
+    def loadFile(self, file, format, baseURI=None, context=None, serverSide=False, commitEvery=None,
+                 chunkSize=None, progress=None):
+        """Load a file into the repository. If serverSide is true, file
+        is a path on the server's file system. Otherwise it is a local
+        path or a file object, whose contents are streamed to the
+        server rather than read into memory. For ntriples, chunkSize
+        splits the file into requests of that many lines each. If
+        given, progress(bytes, lines) is called as the upload advances
+        with the number of bytes and lines sent so far."""
         mime = self.checkFormat(format)
-        body = ""
-        if not serverSide:
-            f = open(file)
-            body = f.read()
-            f.close()
-            file = None
-        params = urlenc(file=file, context=context, baseURI=baseURI, commit=commitEvery)
-        nullRequest(self, "POST", "/statements?" + params, body, contentType=mime)
+        if serverSide:
+            params = urlenc(file=file, context=context, baseURI=baseURI, commit=commitEvery)
+            return nullRequest(self, "POST", "/statements?" + params, "", contentType=mime)
+
+        params = urlenc(context=context, baseURI=baseURI, commit=commitEvery)
+        f = open(file, "rb") if isinstance(file, basestring) else file
+        try:
+            reader = _ProgressReader(f, progress)
+            if not (chunkSize and format == "ntriples"):
+                return nullRequest(self, "POST", "/statements?" + params, reader, contentType=mime, compress=True)
+            while True:
+                lines = list(itertools.islice(f, chunkSize))
+                if not lines: break
+                nullRequest(self, "POST", "/statements?" + params, "".join(lines), contentType=mime, compress=True)
+                reader.advance(sum(len(line) for line in lines), len(lines))
+        finally:
+            if f is not file: f.close()
 
     def getBlankNodes(self, amount=1):
-        return jsonRequest(self, "POST", "/blankNodes", urlenc(amount=amount))
+        return jsonRequest(self, "POST", "/blankNodes", urlenc(amount=amount), invalidates=False)
 
     def deleteStatements(self, quads):
         """Delete a collection of statements from the repository."""
-        nullRequest(self, "POST", "/statements/delete", cjson.encode(quads), contentType="application/json")
+        return nullRequest(self, "POST", "/statements/delete", cjson.encode(quads), contentType="application/json",
+                           compress=True)
 
     def deleteStatementsById(self, ids):
-        nullRequest(self, "POST", "/statements/delete?ids=true", cjson.encode(ids), contentType="application/json")
+        return nullRequest(self, "POST", "/statements/delete?ids=true", cjson.encode(ids), contentType="application/json")
 
     def evalFreeTextSearch(self, pattern, index=None, infer=False, callback=None, limit=None, offset=None):
         """Use free-text indices to search for the given pattern.
@@ -440,14 +606,14 @@ class Repository(Service):
         `reset` argument of `True` is passed, the user's namespaces are reset
         to the default set of namespaces, otherwise all namespaces are cleared.
         """
-        nullRequest(self, "DELETE", "/namespaces?" + urlenc(reset=reset))
+        return nullRequest(self, "DELETE", "/namespaces?" + urlenc(reset=reset))
 
     def addNamespace(self, prefix, uri):
-        nullRequest(self, "PUT", "/namespaces/" + urllib.quote(prefix),
+        return nullRequest(self, "PUT", "/namespaces/" + urllib.quote(prefix),
                     uri, contentType="text/plain")
 
     def deleteNamespace(self, prefix):
-        nullRequest(self, "DELETE", "/namespaces/" + urllib.quote(prefix))
+        return nullRequest(self, "DELETE", "/namespaces/" + urllib.quote(prefix))
 
     def listNamespaces(self):
         return jsonRequest(self, "GET", "/namespaces")
@@ -595,19 +761,15 @@ class Repository(Service):
         self._enableSession(lifetime)
 
     def _enableSession(self, lifetime):
-        alive = self.sessionAlive = threading.Event()
-        def pingSession():
-            while True:
-                stop = alive.wait(max(lifetime - 60, lifetime) if lifetime else 250)
-                if alive.isSet(): return
-                try: nullRequest(self, "GET", "/session/ping")
-                except Exception: return
-        threading.Thread(target=pingSession).start()
+        self.sessionAlive = threading.Event()
+        self.sessionLost = False
+        SessionKeeper.instance().add(self, max(lifetime - 60, lifetime / 2.0) if lifetime else 250)
 
     def closeSession(self):
         if not self.sessionAlive: return
         self.sessionAlive.set()
         self.sessionAlive = None
+        if keeper is not None: keeper.remove(self)
         try: nullRequest(self, "POST", "/session/close")
         except Exception: pass
         if hasattr(self, "oldUrl"): self.url = self.oldUrl
@@ -759,3 +921,133 @@ class Repository(Service):
         finally:
             del self._saveFile
             del self._saveAccept
+
+
+keeperLock = threading.Lock()
+keeper = None
+
+def _pingResult(status, body):
+    if status not in (200, 204):
+        raise RequestError(status, body)
+
+class SessionKeeper(object):
+    """
+    Keeps sessions alive by pinging them from a single thread, instead
+    of a thread per session. The pings that are due within 'window'
+    seconds of each other are sent together, over at most
+    maxConnections connections at a time. A session whose ping fails
+    is no longer pinged, and is marked as lost (sessionLost).
+
+    Sessions are held by weak references, so a session that is no
+    longer referenced is closed (by Repository.__del__) rather than
+    kept alive.
+    """
+    window = 10.0
+    maxConnections = 8
+
+    @staticmethod
+    def instance():
+        global keeper
+        with keeperLock:
+            if keeper is None or keeper.pid != os.getpid():
+                keeper = SessionKeeper()
+            return keeper
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = threading.Condition()
+        # id -> (weak reference, interval, time of the next ping)
+        self.sessions = {}
+        # (time of the next ping, id), possibly of sessions since removed
+        # or rescheduled, which are skipped.
+        self.schedule = []
+        self.thread = None
+
+    def add(self, rep, interval):
+        """
+        Ping rep every interval seconds until it is removed.
+        """
+        with self.lock:
+            self._schedule(id(rep), weakref.ref(rep), interval)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="SessionKeeper")
+                self.thread.setDaemon(True)
+                self.thread.start()
+            self.lock.notify()
+
+    def remove(self, rep):
+        with self.lock:
+            self.sessions.pop(id(rep), None)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def _schedule(self, key, ref, interval):
+        due = time.time() + interval
+        self.sessions[key] = (ref, interval, due)
+        heapq.heappush(self.schedule, (due, key))
+
+    def _due(self):
+        """
+        Wait for pings to fall due, and return the (key, reference,
+        interval, time due) of the sessions to ping.
+        """
+        with self.lock:
+            while True:
+                while self.schedule and not self._current(*self.schedule[0]):
+                    heapq.heappop(self.schedule)
+                if not self.schedule:
+                    self.lock.wait()
+                    continue
+                now = time.time()
+                if self.schedule[0][0] <= now:
+                    break
+                self.lock.wait(self.schedule[0][0] - now)
+            due = []
+            while self.schedule and self.schedule[0][0] <= now + self.window:
+                when, key = heapq.heappop(self.schedule)
+                if self._current(when, key):
+                    ref, interval = self.sessions[key][:2]
+                    due.append((key, ref, interval, when))
+            return due
+
+    def _current(self, when, key):
+        """
+        Whether the ping of session key at when is still wanted.
+        """
+        entry = self.sessions.get(key)
+        return entry is not None and entry[2] == when
+
+    def _run(self):
+        while True:
+            pings = []
+            batch = RequestBatch(self.maxConnections)
+            for key, ref, interval, when in self._due():
+                rep = ref()
+                future = None
+                if rep is not None and rep.sessionAlive:
+                    future = batch.add(rep, "GET", "/session/ping", accept="application/json", finish=_pingResult)
+                pings.append((key, ref, interval, when, future))
+                del rep
+            try:
+                batch.execute()
+            except Exception:
+                pass
+            with self.lock:
+                for key, ref, interval, when, future in pings:
+                    if not self._current(when, key):
+                        continue
+                    if future is None:
+                        # The session is gone or was closed.
+                        del self.sessions[key]
+                        continue
+                    try:
+                        future.result()
+                    except Exception:
+                        del self.sessions[key]
+                        rep = ref()
+                        if rep is not None:
+                            rep.sessionLost = True
+                        del rep
+                    else:
+                        self._schedule(key, ref, interval)
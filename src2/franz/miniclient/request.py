@@ -6,12 +6,35 @@
 # http://www.eclipse.org/legal/epl-v10.html
 ###############################################################################
 
-import StringIO, errno, pycurl, urllib, cjson, locale, re, os, time
-from threading import Lock
+from __future__ import with_statement
+import StringIO, errno, pycurl, urllib, urlparse, cjson, locale, re, os, select, stat, time, traceback, zlib
+from collections import deque
+from threading import Condition, Event, Lock, Thread, local
+from instrument import RequestInfo, addRequestHook, removeRequestHook, requestHooks
+from tabular import decodeCSV, decodeTSV
 
 curlPool = None
 
 class Pool:
+    """
+    Pool of curl handles, partitioned by scheme, host, port and
+    credentials so that a handle (and the connection it keeps alive)
+    is only reused for requests it can serve.
+
+    At most maxSize handles exist at a time; get() blocks for up to
+    waitTimeout seconds when they are all in use, and then creates one
+    anyway rather than deadlock a thread that already holds a handle,
+    or returns None at once if wait is false.
+    At most maxIdle handles are kept per partition, and idle handles
+    are closed after idleTimeout seconds or when their connection is
+    found to have been closed by the server. These are class attributes
+    and may be changed at any time.
+    """
+    maxSize = 64
+    maxIdle = 16
+    idleTimeout = 60.0
+    waitTimeout = 30.0
+
     @staticmethod
     def instance():
         global curlPool
@@ -29,33 +52,188 @@ class Pool:
     def __init__(self, create, pid):
         self.create = create
         self.pid = pid
-        self.lock = Lock()
-        self.pool = []
+        self.lock = Condition(Lock())
+        # partition key -> list of (handle, time it was put back),
+        # most recently used last.
+        self.idle = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.creations = 0
+        self.evictions = 0
 
-    def get(self):
-        self.lock.acquire()
-        try:
-            value = self.pool.pop()
-        except IndexError:
-            value = None
-        finally:
-            self.lock.release()
+    def get(self, key=None, wait=True):
+        """
+        Return a handle for the given partition key, reusing an idle
+        one when possible, or None if wait is false and there is none
+        to be had.
+        """
+        with self.lock:
+            deadline = None
+            while True:
+                idle = self.idle.get(key)
+                now = time.time()
+                while idle:
+                    value, since = idle.pop()
+                    if now - since > self.idleTimeout or not self._alive(value):
+                        self._evict(value)
+                        continue
+                    self.hits += 1
+                    return value
+                if self.size < self.maxSize or self._evictOldest():
+                    break
+                if not wait:
+                    return None
+                if deadline is None:
+                    deadline = now + self.waitTimeout
+                elif now >= deadline:
+                    break
+                self.lock.wait(deadline - now)
+            self.misses += 1
+            self.size += 1
 
         # Create new ones outside the lock
-        return value or self.create()
+        try:
+            value = self.create()
+        except:
+            self.discard(None)
+            raise
+        with self.lock:
+            self.creations += 1
+        return value
 
-    def put(self, value):
+    def put(self, value, key=None):
+        """
+        Return a handle that completed its request cleanly to the pool.
+        """
         # We could call value.reset() here before returning the curl object
         # to the pool for pycurl version >= 7.19.0 if the C code for reset
         # actually incremented the reference on the returned None object.
         # As the C code is now, if called, the refcount on None eventually
         # goes to zero after enough requests and the Python interpretor
-        # dies a quick death.
-        self.lock.acquire()
+        # dies a quick death. Partitioning by credentials means the options
+        # that are left behind are the ones the next user would set anyway.
+        with self.lock:
+            if self.size > self.maxSize:
+                self._evict(value)
+            else:
+                idle = self.idle.setdefault(key, [])
+                idle.append((value, time.time()))
+                if len(idle) > self.maxIdle:
+                    self._evict(idle.pop(0)[0])
+            self.lock.notify()
+
+    def discard(self, value):
+        """
+        Close a handle that is not fit for reuse, for example because
+        its request failed or was aborted.
+        """
+        with self.lock:
+            self.size -= 1
+            self.lock.notify()
+        if value is not None:
+            value.close()
+
+    def stats(self):
+        """
+        Return a dictionary of counters describing the use of the pool.
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "creations": self.creations, "evictions": self.evictions,
+                    "size": self.size,
+                    "idle": sum(len(idle) for idle in self.idle.itervalues())}
+
+    def _evict(self, value):
+        self.size -= 1
+        self.evictions += 1
+        value.close()
+
+    def _evictOldest(self):
+        oldest = None
+        for key, idle in self.idle.iteritems():
+            if idle and (oldest is None or idle[0][1] < self.idle[oldest][0][1]):
+                oldest = key
+        if oldest is None:
+            return False
+        self._evict(self.idle[oldest].pop(0)[0])
+        return True
+
+    @staticmethod
+    def _alive(value):
+        # An idle keep-alive connection has nothing to read; if its
+        # socket is readable the server has closed it (or sent something
+        # we can not make sense of).
+        # poll rather than select, which can not take descriptors of
+        # FD_SETSIZE (1024) or more.
         try:
-            self.pool.append(value)
-        finally:
-            self.lock.release()
+            sock = value.getinfo(pycurl.LASTSOCKET)
+            if sock == -1:
+                return True
+            poller = select.poll()
+            poller.register(sock, select.POLLIN | select.POLLPRI)
+            return not poller.poll(0)
+        except (pycurl.error, select.error, ValueError):
+            return False
+
+def _poolKey(obj, url):
+    """
+    The Pool partition a request to url on behalf of obj belongs to.
+    """
+    if not url.startswith("http:") and not url.startswith("https:"): url = obj.url + url
+    parts = urlparse.urlsplit(url)
+    return (parts.scheme, parts.netloc, obj.user, obj.password, obj.sslcert)
+
+def _remainingSize(fileobj):
+    """
+    The number of bytes left to read from fileobj, or -1 if that can
+    not be told.
+    """
+    try:
+        info = os.fstat(fileobj.fileno())
+        if stat.S_ISREG(info.st_mode):
+            return info.st_size - fileobj.tell()
+    except (AttributeError, EnvironmentError, ValueError):
+        pass
+    return -1
+
+# libcurl's return values for SEEKFUNCTION and IOCTLFUNCTION.
+_SEEKFUNC_OK, _SEEKFUNC_CANTSEEK = 0, 2
+_IOE_OK, _IOE_UNKNOWNCMD, _IOE_FAILRESTART = 0, 1, 2
+_IOCMD_RESTARTREAD = 1
+
+def _rewinder(body):
+    """
+    Return a function that rewinds the file-like body to where it is
+    now, returning whether it could, or None if it can not be rewound.
+    """
+    start = _tell(body)
+    if start is None:
+        return None
+    def rewind():
+        try:
+            body.seek(start)
+            return True
+        except (AttributeError, EnvironmentError, ValueError):
+            return False
+    return rewind
+
+def _setRewind(curl, rewind):
+    if hasattr(pycurl, "SEEKFUNCTION"):
+        def seek(offset, origin):
+            if rewind and offset == 0 and origin == os.SEEK_SET and rewind():
+                return _SEEKFUNC_OK
+            return _SEEKFUNC_CANTSEEK
+        curl.setopt(pycurl.SEEKFUNCTION, seek)
+    elif hasattr(pycurl, "IOCTLFUNCTION"):
+        def ioctl(command):
+            if command != _IOCMD_RESTARTREAD:
+                return _IOE_UNKNOWNCMD
+            return _IOE_OK if rewind and rewind() else _IOE_FAILRESTART
+        curl.setopt(pycurl.IOCTLFUNCTION, ioctl)
+
+def _ignoreHeader(string):
+    return len(string)
 
 class RequestError(Exception):
     code = None
@@ -92,9 +270,10 @@ def urlenc(**args):
         encval(name, val)
     return "&".join(buf)
 
-def makeRequest(obj, method, url, body=None, accept="*/*", contentType=None, callback=None, errCallback=None, headers=None):
-    curl = Pool.instance().get()
-
+def _setupCurl(curl, obj, method, url, body=None, accept="*/*", contentType=None, headers=None):
+    """
+    Set the options on curl for a single request.
+    """
     # Uncomment these 5 lines to see pycurl debug output
     ## def report(debug_type, debug_msg):
     ##     if debug_type != 3:
@@ -121,14 +300,24 @@ def makeRequest(obj, method, url, body=None, accept="*/*", contentType=None, cal
     if not url.startswith("http:") and not url.startswith("https:"): url = obj.url + url
 
     postbody = method == "POST" or method == "PUT"
+    # A file-like body is streamed rather than read into memory.
+    upload = postbody and hasattr(body, "read")
     curl.setopt(pycurl.POSTFIELDS, "")
-    if body:
+    if body and not upload:
         if postbody:
             curl.setopt(pycurl.POSTFIELDS, body)
         else:
             url = url + "?" + body
 
-    curl.setopt(pycurl.POST, (postbody and 1) or 0)
+    curl.setopt(pycurl.POST, (postbody and not upload and 1) or 0)
+    curl.setopt(pycurl.UPLOAD, (upload and 1) or 0)
+    if upload:
+        curl.setopt(pycurl.READFUNCTION, body.read)
+        # With an unknown size (-1) the body is sent chunked.
+        curl.setopt(pycurl.INFILESIZE_LARGE, _remainingSize(body))
+    # Lets curl rewind the body when it has to send it again, as after
+    # a redirect. Pooled handles may have the one of an earlier request.
+    _setRewind(curl, upload and _rewinder(body))
     curl.setopt(pycurl.CUSTOMREQUEST, method)
     curl.setopt(pycurl.URL, url)
 
@@ -138,11 +327,66 @@ def makeRequest(obj, method, url, body=None, accept="*/*", contentType=None, cal
     if headers is None:
         headers = []
     headers.extend(["Connection: keep-alive", "Accept: " + accept, "Expect:"])
-    if callback: headers.append("Connection: close")
     if contentType and postbody: headers.append("Content-Type: " + contentType)
     if obj.runAsName: headers.append("x-masquerade-as-user: " + obj.runAsName)
     curl.setopt(pycurl.HTTPHEADER, headers)
     curl.setopt(pycurl.ENCODING, "") # which means 'any encoding that curl supports'
+    # Pooled handles may still carry the header function of a previous request.
+    curl.setopt(pycurl.HEADERFUNCTION, _ignoreHeader)
+
+def _startRequest(obj, method, url):
+    """
+    Tell the request hooks about the start of a request, returning the
+    RequestInfo to end it with, or None if there are no hooks.
+    """
+    hooks = requestHooks()
+    if not hooks:
+        return None
+    if not url.startswith("http:") and not url.startswith("https:"): url = obj.url + url
+    return RequestInfo(hooks, method, url)
+
+def _endRequest(info, curl, status=None, error=None):
+    """
+    Tell the request hooks that a request has ended. The curl handle
+    must not have been returned to the pool yet.
+    """
+    if info is not None:
+        info._measure(curl)
+        info._end(status, error)
+
+def _finishRequest(info, curl, status, body, finish):
+    """
+    Return finish(status, body), ending the request once the response
+    has been decoded by it.
+    """
+    if info is None:
+        return finish(status, body)
+    info._measure(curl)
+    start = time.time()
+    try:
+        return finish(status, body)
+    except Exception, error:
+        info.error = error
+        raise
+    finally:
+        info.decodeTime = time.time() - start
+        info._end(status)
+
+def makeRequest(obj, method, url, body=None, accept="*/*", contentType=None, callback=None, errCallback=None, headers=None,
+                finish=None):
+    """
+    Perform a request. With a callback, the response body is passed to
+    it in pieces as it arrives, or to errCallback(status, body) as a
+    whole if the request fails. Otherwise, return (status, body), or
+    finish(status, body) if finish is given.
+    """
+    pool = Pool.instance()
+    key = _poolKey(obj, url)
+    curl = pool.get(key)
+    # A streamed body has to be rewound to be sent again.
+    rewind = _rewinder(body) if hasattr(body, "read") else lambda: True
+    _setupCurl(curl, obj, method, url, body, accept, contentType, headers)
+    info = _startRequest(obj, method, url)
 
     def retrying_perform():
         retry = 0.1
@@ -152,12 +396,19 @@ def makeRequest(obj, method, url, body=None, accept="*/*", contentType=None, cal
                 break
             except pycurl.error, error:
                 if (error.args[0] == 7 and
-                    curl.getinfo(pycurl.OS_ERRNO) == errno.ECONNRESET): 
+                    curl.getinfo(pycurl.OS_ERRNO) == errno.ECONNRESET and
+                    rewind is not None and rewind()):
                     # Retry
                     time.sleep(retry)
                     retry *= 2
                     continue
    
+                _endRequest(info, curl, error=error)
+                pool.discard(curl)
+                raise
+            except BaseException, error:
+                _endRequest(info, curl, error=error)
+                pool.discard(curl)
                 raise
 
     if callback:
@@ -173,93 +424,748 @@ def makeRequest(obj, method, url, body=None, accept="*/*", contentType=None, cal
         curl.setopt(pycurl.WRITEFUNCTION, writefunc)
         curl.setopt(pycurl.HEADERFUNCTION, headerfunc)
         retrying_perform()
+        code = curl.getinfo(pycurl.RESPONSE_CODE)
+        _endRequest(info, curl, code)
+        pool.put(curl, key)
         if status[0] != 200:
-            errCallback(curl.getinfo(pycurl.RESPONSE_CODE), "".join(error))
+            errCallback(code, "".join(error))
     else:
         buf = StringIO.StringIO()
         curl.setopt(pycurl.WRITEFUNCTION, buf.write)
         retrying_perform()
         response = buf.getvalue().decode("utf-8")
         buf.close()
-        result = (curl.getinfo(pycurl.RESPONSE_CODE), response)
-        Pool.instance().put(curl)
-        return result
+        status = curl.getinfo(pycurl.RESPONSE_CODE)
+        if finish is not None:
+            try:
+                return _finishRequest(info, curl, status, response, finish)
+            finally:
+                pool.put(curl, key)
+        _endRequest(info, curl, status)
+        pool.put(curl, key)
+        return status, response
+
+def jsonRequest(obj, method, url, body=None, contentType="application/x-www-form-urlencoded", rowreader=None, accept="application/json", headers=None, stream=False,
+                raw=False, invalidates=None):
+    """
+    Perform a request and return its decoded JSON response (the body as
+    is for other accept types, or when raw is true). Unless invalidates
+    is False, a request that is not a GET empties the queryCache of obj,
+    if it has one, as it may have changed the store; a queued request
+    (see Future) empties it both when it is queued and when it is done.
+    """
+    if invalidates is None:
+        invalidates = method != "GET"
+    if not invalidates:
+        return _jsonRequest(obj, method, url, body, contentType, rowreader, accept, headers, stream, raw)
+    try:
+        result = _jsonRequest(obj, method, url, body, contentType, rowreader, accept, headers, stream, raw)
+    finally:
+        _invalidateQueryCache(obj)
+    return _invalidateWhenDone(obj, result)
 
-def jsonRequest(obj, method, url, body=None, contentType="application/x-www-form-urlencoded", rowreader=None, accept="application/json", headers=None):
+def _jsonRequest(obj, method, url, body, contentType, rowreader, accept, headers, stream, raw):
     # If there is a _saveFile and _saveAccept, they override the arguments
     callback = None if rowreader is None else rowreader.process
     if hasattr(obj, '_saveFile') and hasattr(obj, '_saveAccept'):
         accept = obj._saveAccept
         callback = obj._saveFile.write
+    elif stream and callback is None and accept in ('application/json', "application/x-quints+json"):
+        return RowStream(obj, method, url, body, accept, contentType, headers)
 
     if callback is None:
-        status, body = makeRequest(obj, method, url, body, accept, contentType, headers=headers)
-        if (status == 200):
-            if accept in ('application/json', 'text/integer', "application/x-quints+json"):
-                body = cjson.decode(body)
-            return body
-        else: raise RequestError(status, body)
+        decode = None if raw else accept
+        batch = _batchOf(obj)
+        if batch is not None:
+            return batch.add(obj, method, url, body, accept, contentType, headers,
+                                  lambda status, body: _jsonResult(status, body, decode))
+        return makeRequest(obj, method, url, body, accept, contentType, headers=headers,
+                           finish=lambda status, body: _jsonResult(status, body, decode))
     else:
         def raiseErr(status, message): raise RequestError(status, message)
         makeRequest(obj, method, url, body, accept, contentType, callback=callback, errCallback=raiseErr, headers=headers)
 
-def nullRequest(obj, method, url, body=None, contentType="application/x-www-form-urlencoded"):
+def _jsonResult(status, body, accept):
+    if (status == 200):
+        return decodeResponse(body, accept)
+    else: raise RequestError(status, body)
+
+def decodeResponse(body, accept):
+    """
+    Decode the body of a successful response to a request with the given
+    accept header, as jsonRequest does.
+    """
+    if accept in ('application/json', 'text/integer', "application/x-quints+json"):
+        body = cjson.decode(body)
+    elif accept == "text/tab-separated-values":
+        body = decodeTSV(body)
+    elif accept == "text/csv":
+        body = decodeCSV(body)
+    return body
+
+# The RequestBatches opened by Service.batch in each thread, by the id of
+# the object they were opened on.
+_threadBatches = local()
+
+def _batchOf(obj):
+    """
+    Return what requests made through obj in this thread are queued on,
+    if anything: the RequestBatch this thread opened on it, or else the
+    RequestReactor of an asynchronous object.
+    """
+    batches = getattr(_threadBatches, 'batches', None)
+    if batches:
+        batch = batches.get(id(obj))
+        if batch is not None:
+            return batch
+    return getattr(obj, '_batch', None)
+
+def _invalidateQueryCache(obj):
+    cache = getattr(obj, 'queryCache', None)
+    if cache is not None:
+        cache.invalidate()
+
+def _invalidateWhenDone(obj, result):
+    """
+    Return result, making it empty the queryCache of obj once it is done
+    if it is a Future: a query answered while the request was queued
+    may have been cached from the store as it was before it.
+    """
+    if isinstance(result, Future):
+        result.addDoneCallback(lambda future: _invalidateQueryCache(obj))
+    return result
+
+def nullRequest(obj, method, url, body=None, contentType="application/x-www-form-urlencoded", compress=False):
+    """
+    Perform a request that has no result, and empty the queryCache of obj
+    (see jsonRequest).
+    """
+    try:
+        result = _nullRequest(obj, method, url, body, contentType, compress)
+    finally:
+        _invalidateQueryCache(obj)
+    return _invalidateWhenDone(obj, result)
+
+def _nullRequest(obj, method, url, body, contentType, compress):
+    batch = _batchOf(obj)
+    if batch is not None:
+        return batch.add(obj, method, url, body, "application/json", contentType, None, _nullResult)
+    if compress and _shouldCompress(obj, body):
+        position = _tell(body)
+        status, response = makeRequest(obj, method, url, _GzipReader(body), "application/json", contentType,
+                                       headers=["Content-Encoding: gzip"])
+        if not _encodingRejected(status, response):
+            return _nullResult(status, response)
+        # The server does not accept compressed bodies. Send the body as
+        # is, if it can be read again, and stop compressing if that works.
+        if hasattr(body, "read"):
+            if position is None:
+                raise RequestError(status, response)
+            body.seek(position)
+        status, body = makeRequest(obj, method, url, body, "application/json", contentType)
+        if 200 <= status <= 204:
+            obj.compressRequests = False
+        return _nullResult(status, body)
     status, body = makeRequest(obj, method, url, body, "application/json", contentType)
+    _nullResult(status, body)
+
+def _shouldCompress(obj, body):
+    if not getattr(obj, "compressRequests", False) or not body:
+        return False
+    if hasattr(body, "read"):
+        size = _remainingSize(body)
+        return size < 0 or size >= obj.compressThreshold
+    return len(body) >= obj.compressThreshold
+
+_ENCODING_ERROR = re.compile(r"gzip|content-encoding|compress", re.IGNORECASE)
+
+def _encodingRejected(status, response):
+    """
+    Whether a response says that the server does not take compressed
+    request bodies: 415 Unsupported Media Type, or a 400 Bad Request
+    that mentions the encoding, rather than, say, a syntax error.
+    """
+    return status == 415 or (status == 400 and bool(_ENCODING_ERROR.search(response or "")))
+
+def _tell(fileobj):
+    try:
+        return fileobj.tell()
+    except (AttributeError, EnvironmentError):
+        return None
+
+class _GzipReader(object):
+    """
+    File-like object that produces body (a string or a file-like
+    object) gzip-compressed, compressing a piece at a time as it is read.
+    It can be rewound (seek) if body can.
+    """
+    def __init__(self, body):
+        self.source = body if hasattr(body, "read") else StringIO.StringIO(body)
+        self.start = _tell(self.source)
+        self._restart()
+
+    def _restart(self):
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.buffer = ""
+        self.done = False
+        self.position = 0
+
+    def tell(self):
+        if self.start is None:
+            raise IOError("The body can not be rewound.")
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self.start is None or whence != os.SEEK_SET or offset > self.position:
+            raise IOError("The body can only be rewound.")
+        self.source.seek(self.start)
+        self._restart()
+        if offset:
+            self.read(offset)
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.buffer) < size) and not self.done:
+            data = self.source.read(65536)
+            if data:
+                self.buffer += self.compressor.compress(data)
+            else:
+                self.buffer += self.compressor.flush()
+                self.done = True
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.position += len(data)
+        return data
+
+def _nullResult(status, body):
     if (status < 200 or status > 204): raise RequestError(status, body)
 
-class RowReader:
+class RowReader(object):
+    """
+    Incremental parser for the row-producing JSON responses: either a
+    {"names": [...], "values": [[...], ...]} object or a bare array of
+    rows. process() is fed the response chunk by chunk as it arrives;
+    every byte is scanned once, and each row is decoded and passed to
+    callback(row, names) as soon as its closing bracket has been seen.
+
+    bytesParsed and rowsParsed report the progress made so far.
+    """
+    structural = re.compile(r'[\[\]{}"]')
+    stringSpecial = re.compile(r'["\\]')
+
     def __init__(self, callback):
+        self.callback = callback
         self.hasNames = None
         self.names = None
-        self.skipNextBracket = False
-        self.callback = callback
-        self.backlog = None
+        self.depth = 0
+        self.inString = False
+        self.escaped = False
+        # The last key seen in the top-level object, and the pieces
+        # of a key that is still being read.
+        self.key = None
+        self.keyParts = None
+        # The depth at which the row currently being read started,
+        # and the pieces of it taken from previous chunks.
+        self.rowDepth = None
+        self.rowParts = []
+        self.bytesParsed = 0
+        self.rowsParsed = 0
 
     def process(self, string):
+        self.bytesParsed += len(string)
         if self.hasNames is None:
-            self.hasNames = string[0] == "{"
-            if not self.hasNames: self.skipNextBracket = True
+            stripped = string.lstrip()
+            if not stripped: return
+            self.hasNames = stripped[0] == "{"
 
-        ln = len(string)
-        if self.backlog: string = self.backlog + string
-        pos = [0]
-
-        def useArray(arr):
-            if self.hasNames:
-                if self.names:
-                    self.callback(arr, self.names)
+        rowStart = 0 if self.rowDepth is not None else None
+        pos, end = 0, len(string)
+        while pos < end:
+            if self.inString:
+                if self.escaped:
+                    if self.keyParts is not None: self.keyParts.append(string[pos])
+                    self.escaped = False
+                    pos += 1
+                    continue
+                match = self.stringSpecial.search(string, pos)
+                if match is None:
+                    if self.keyParts is not None: self.keyParts.append(string[pos:])
+                    break
+                at = match.start()
+                if string[at] == "\\":
+                    if self.keyParts is not None: self.keyParts.append(string[pos:at + 1])
+                    self.escaped = True
                 else:
-                    self.names = arr
-                    self.skipNextBracket = True
+                    self.inString = False
+                    if self.keyParts is not None:
+                        self.keyParts.append(string[pos:at])
+                        self.key = "".join(self.keyParts)
+                        self.keyParts = None
+                pos = at + 1
+                continue
+
+            match = self.structural.search(string, pos)
+            if match is None: break
+            at = match.start()
+            char = string[at]
+            if char == '"':
+                self.inString = True
+                if self.hasNames and self.depth == 1:
+                    self.keyParts = []
+            elif char == "[" or char == "{":
+                self.depth += 1
+                if self.rowDepth is None and self._startsRow():
+                    self.rowDepth = self.depth
+                    rowStart = at
+            elif self.rowDepth == self.depth:
+                self.rowParts.append(string[rowStart:at + 1])
+                row = "".join(self.rowParts)
+                self.rowParts = []
+                self.rowDepth = rowStart = None
+                self.depth -= 1
+                self._useRow(cjson.decode(row.decode("utf-8")))
             else:
-                self.callback(arr, None)
+                self.depth -= 1
+            pos = at + 1
 
-        def takeArrayAt(start):
-            scanned = start + 1
-            while True:
-                end = string.find("]", scanned)
-                if end == -1: return False
+        if self.rowDepth is not None:
+            self.rowParts.append(string[rowStart:])
+
+    def _startsRow(self):
+        if not self.hasNames:
+            return self.depth == 2
+        return ((self.depth == 2 and self.key == "names") or
+                (self.depth == 3 and self.key == "values"))
+
+    def _useRow(self, row):
+        if self.hasNames and self.key == "names":
+            self.names = row
+        else:
+            self.rowsParsed += 1
+            self.callback(row, self.names)
+
+class RowStream(object):
+    """
+    Iterates over the rows of a row-producing response while the
+    response is still being received, instead of buffering and
+    decoding the whole body first. The transfer is driven from next()
+    through a CurlMulti object, so no extra thread is involved.
+
+    close() aborts the transfer if it has not completed yet. rowCount
+    is None until the whole response has been received.
+    """
+    def __init__(self, obj, method, url, body=None, accept="application/json", contentType=None, headers=None):
+        self.rows = deque()
+        self.status = None
+        self.error = []
+        self.done = False
+        self.rowCount = None
+        self.reader = RowReader(self._addRow)
+        self.key = _poolKey(obj, url)
+        self.curl = Pool.instance().get(self.key)
+        _setupCurl(self.curl, obj, method, url, body, accept, contentType, headers)
+        self.info = _startRequest(obj, method, url)
+        self.curl.setopt(pycurl.WRITEFUNCTION, self._write)
+        self.curl.setopt(pycurl.HEADERFUNCTION, self._header)
+        self.multi = pycurl.CurlMulti()
+        self.multi.add_handle(self.curl)
+
+    def _header(self, string):
+        if self.status is None:
+            self.status = locale.atoi(string.split(" ")[1])
+        return len(string)
+
+    def _write(self, string):
+        if self.status == 200: self.reader.process(string)
+        else: self.error.append(string)
+
+    def _addRow(self, row, names):
+        self.rows.append(row)
+
+    def _step(self):
+        while True:
+            ret, active = self.multi.perform()
+            if ret != pycurl.E_CALL_MULTI_PERFORM: break
+        if active:
+            self.multi.select(1.0)
+            return
+
+        queued, ok, failed = self.multi.info_read()
+        status = self.curl.getinfo(pycurl.RESPONSE_CODE)
+        self.multi.remove_handle(self.curl)
+        self.multi.close()
+        self.done = True
+        if failed:
+            error = pycurl.error(failed[0][1], failed[0][2])
+            _endRequest(self.info, self.curl, error=error)
+            Pool.instance().discard(self.curl)
+            raise error
+        _endRequest(self.info, self.curl, status)
+        Pool.instance().put(self.curl, self.key)
+        self.rowCount = self.reader.rowsParsed
+        if status != 200:
+            raise RequestError(status, "".join(self.error).decode("utf-8"))
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while not self.rows:
+            if self.done: raise StopIteration
+            self._step()
+        return self.rows.popleft()
+
+    def getNames(self):
+        """
+        Return the variable names of a {names, values} response, reading
+        as much of the response as is needed to see them.
+        """
+        while self.reader.names is None and not self.rows and not self.done:
+            self._step()
+        return self.reader.names
+
+    def close(self):
+        if not self.done:
+            self.done = True
+            self.multi.remove_handle(self.curl)
+            self.multi.close()
+            _endRequest(self.info, self.curl, self.status,
+                        pycurl.error(pycurl.E_ABORTED_BY_CALLBACK, "Request aborted"))
+            # The rest of the response is still on the connection.
+            Pool.instance().discard(self.curl)
+        self.rows.clear()
+
+class Future(object):
+    """
+    The eventual outcome of a request that has been queued rather than
+    performed immediately. result() returns its value or raises the
+    error the request ended with. Futures of requests performed in the
+    background (see RequestReactor) can be waited for, and run the
+    functions given to addDoneCallback, in the thread that completes
+    them, once they are done.
+    """
+    def __init__(self, waitable=False):
+        self._done = False
+        self._value = None
+        self._error = None
+        self._callbacks = []
+        self._lock = Lock()
+        self._event = Event() if waitable else None
+
+    def done(self):
+        return self._done
+
+    def result(self, timeout=None):
+        if not self._done and self._event is not None:
+            self._event.wait(timeout)
+        if not self._done:
+            raise RuntimeError("The request has not been performed yet.")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def addDoneCallback(self, fn):
+        """
+        Call fn with this Future once it is done (immediately if it
+        already is).
+        """
+        with self._lock:
+            if not self._done:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def then(self, fn):
+        """
+        Return a Future for the result of applying fn to the value of
+        this one. Errors are passed on unchanged.
+        """
+        future = Future(self._event is not None)
+        def chain(source):
+            try:
+                future._setResult(fn(source.result()))
+            except Exception, error:
+                future._setError(error)
+        self.addDoneCallback(chain)
+        return future
+
+    def _setResult(self, value):
+        self._value = value
+        self._complete()
+
+    def _setError(self, error):
+        self._error = error
+        self._complete()
+
+    def _complete(self):
+        with self._lock:
+            self._done = True
+            callbacks, self._callbacks = self._callbacks, []
+        if self._event is not None:
+            self._event.set()
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                traceback.print_exc()
+
+def gatherFutures(futures):
+    """
+    Return a Future for the list of the values of futures, which fails
+    with the first error among them.
+    """
+    futures = list(futures)
+    gathered = Future(True)
+    remaining = [len(futures)]
+    lock = Lock()
+    def collect(future):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            try:
+                gathered._setResult([f.result() for f in futures])
+            except Exception, error:
+                gathered._setError(error)
+    if not futures:
+        gathered._setResult([])
+    for future in futures:
+        future.addDoneCallback(collect)
+    return gathered
+
+class _MultiDriver(object):
+    """
+    Bookkeeping shared by the classes that perform queued requests
+    through a CurlMulti object: multi, active (handle -> request) and
+    pending (requests waiting for a connection) are set up by them.
+    Unless waitForHandles is true, a request is left pending rather than
+    wait for a handle when the Pool has none to spare.
+    """
+    waitForHandles = True
+
+    def _start(self, request, retried):
+        """
+        Start a request, or fail its Future if it cannot be. Returns
+        False if it was not taken because there was no handle for it.
+        """
+        future, obj, method, url, body, accept, contentType, headers, finish = request
+        pool = Pool.instance()
+        key = _poolKey(obj, url)
+        try:
+            curl = pool.get(key, self.waitForHandles)
+        except Exception, error:
+            future._setError(error)
+            return True
+        if curl is None:
+            return False
+        info = _startRequest(obj, method, url)
+        try:
+            _setupCurl(curl, obj, method, url, body, accept, contentType, headers and list(headers))
+            buf = StringIO.StringIO()
+            curl.setopt(pycurl.WRITEFUNCTION, buf.write)
+            self.multi.add_handle(curl)
+        except Exception, error:
+            _endRequest(info, curl, error=error)
+            pool.discard(curl)
+            future._setError(error)
+            return True
+        self.active[curl] = (request, retried, key, buf, info)
+        return True
+
+    def _perform(self):
+        pool = Pool.instance()
+        while True:
+            ret, running = self.multi.perform()
+            if ret != pycurl.E_CALL_MULTI_PERFORM: break
+
+        while True:
+            queued, ok, failed = self.multi.info_read()
+            for curl in ok:
+                self.multi.remove_handle(curl)
+                request, retried, key, buf, info = self.active.pop(curl)
+                status = curl.getinfo(pycurl.RESPONSE_CODE)
+                future, finish = request[0], request[-1]
                 try:
-                    useArray(cjson.decode(string[start : end + 1].decode("utf-8")))
-                    pos[0] = end + 1
-                    return True
-                except cjson.DecodeError:
-                    scanned = end + 1
+                    value = _finishRequest(info, curl, status, buf.getvalue().decode("utf-8"), finish)
+                except Exception, error:
+                    future._setError(error)
+                else:
+                    future._setResult(value)
+                pool.put(curl, key)
+            for curl, code, message in failed:
+                self.multi.remove_handle(curl)
+                request, retried, key, buf, info = self.active.pop(curl)
+                reset = code == 7 and curl.getinfo(pycurl.OS_ERRNO) == errno.ECONNRESET
+                _endRequest(info, curl, error=pycurl.error(code, message))
+                pool.discard(curl)
+                # A streamed body has been read, and is not sent again.
+                if reset and not retried and not hasattr(request[4], "read"):
+                    self.pending.append((request, True))
+                else:
+                    request[0]._setError(pycurl.error(code, message))
+            if not queued: break
+
+    def _abort(self):
+        for curl, (request, retried, key, buf, info) in self.active.items():
+            self.multi.remove_handle(curl)
+            error = pycurl.error(pycurl.E_ABORTED_BY_CALLBACK, "Request aborted")
+            _endRequest(info, curl, error=error)
+            Pool.instance().discard(curl)
+            request[0]._setError(error)
+        self.active.clear()
+
+class RequestBatch(_MultiDriver):
+    """
+    Collects requests and performs them concurrently, over at most
+    maxConnections connections at a time, through a CurlMulti object.
+    add() returns a Future for each request; execute() performs them
+    all and returns the Futures in the order they were added.
+
+    Usually created through Service.batch().
+    """
+    def __init__(self, maxConnections=8):
+        self.maxConnections = maxConnections
+        self.requests = []
+
+    def add(self, obj, method, url, body=None, accept="*/*", contentType=None, headers=None, finish=None):
+        """
+        Queue a request. finish(status, body) turns the response into
+        the value of the returned Future, and may raise to fail it.
+        """
+        future = Future()
+        self.requests.append((future, obj, method, url, body, accept, contentType, headers, finish))
+        return future
+
+    def execute(self):
+        self.multi = pycurl.CurlMulti()
+        self.active = {}
+        self.pending = deque((request, False) for request in self.requests)
+        try:
+            while self.pending or self.active:
+                while self.pending and len(self.active) < self.maxConnections:
+                    self._start(*self.pending.popleft())
+                self._perform()
+                if self.active:
+                    self.multi.select(1.0)
+        finally:
+            self._abort()
+            self.multi.close()
+        return [request[0] for request in self.requests]
 
+reactorLock = Lock()
+reactor = None
+
+class RequestReactor(_MultiDriver):
+    """
+    Performs requests in a background thread that drives a CurlMulti
+    object, so the threads that make them are not blocked while they
+    are in flight. add() has the interface of RequestBatch.add, but
+    returns a Future that can be waited for and is completed (and runs
+    its callbacks) in the reactor thread as soon as the response is in.
+
+    At most maxConnections requests are in flight at a time; the
+    connections come from the Pool. The reactor never waits for the
+    Pool: while it has no handle to spare, requests stay queued.
+    """
+    maxConnections = 64
+    waitForHandles = False
+
+    @staticmethod
+    def instance():
+        global reactor
+        with reactorLock:
+            if reactor is None or reactor.pid != os.getpid():
+                reactor = RequestReactor()
+            return reactor
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = Lock()
+        self.incoming = deque()
+        self.pending = deque()
+        self.active = {}
+        self.multi = pycurl.CurlMulti()
+        self.wakeRead, self.wakeWrite = os.pipe()
+        thread = Thread(target=self._run, name="RequestReactor")
+        thread.setDaemon(True)
+        thread.start()
+
+    def add(self, obj, method, url, body=None, accept="*/*", contentType=None, headers=None, finish=None):
+        future = Future(True)
+        with self.lock:
+            self.incoming.append(((future, obj, method, url, body, accept, contentType, headers, finish), False))
+        os.write(self.wakeWrite, "x")
+        return future
+
+    def _run(self):
         while True:
-            start = string.find("[", pos[0])
-            if self.skipNextBracket:
-                self.skipNextBracket = False
-                pos[0] = start + 1
-            elif start == -1 or not takeArrayAt(start):
+            try:
+                self._step()
+            except Exception, error:
+                # Keep going for the requests to come: fail those in
+                # flight, which are in an unknown state, and start over
+                # with a new CurlMulti object.
+                traceback.print_exc()
+                self._fail(error)
+                time.sleep(0.1)
+
+    def _step(self):
+        with self.lock:
+            self.pending.extend(self.incoming)
+            self.incoming.clear()
+        starved = False
+        while self.pending and len(self.active) < self.maxConnections:
+            request = self.pending.popleft()
+            if not self._start(*request):
+                self.pending.appendleft(request)
+                starved = True
                 break
+        self._perform()
+        if self.pending and len(self.active) < self.maxConnections and not starved:
+            return
 
-        if pos[0] == 0:
-            self.backlog = string
-            return ln
-        else:
-            self.backlog = None
-            return pos[0]
+        # Wait for socket activity, a curl timeout, or new requests.
+        read, write, exc = self.multi.fdset()
+        timeout = None
+        if self.active:
+            timeout = self.multi.timeout()
+            timeout = 1.0 if timeout < 0 else min(timeout / 1000.0, 1.0)
+        if starved:
+            # Look for a handle put back in the Pool now and then.
+            timeout = 0.05 if timeout is None else min(timeout, 0.05)
+        # poll rather than select, which can not take descriptors of
+        # FD_SETSIZE (1024) or more. curl leaves those out of fdset, so
+        # when it gives fewer sockets than there are requests in flight,
+        # the missing ones are looked at again shortly.
+        events = {self.wakeRead: select.POLLIN}
+        for fds, event in ((read, select.POLLIN), (write, select.POLLOUT), (exc, select.POLLPRI)):
+            for fd in fds:
+                events[fd] = events.get(fd, 0) | event
+        if len(events) - 1 < len(self.active):
+            timeout = min(timeout, 0.01)
+        poller = select.poll()
+        for fd, event in events.iteritems():
+            poller.register(fd, event)
+        ready = poller.poll(None if timeout is None else timeout * 1000)
+        if [fd for fd, event in ready if fd == self.wakeRead]:
+            os.read(self.wakeRead, 4096)
+
+    def _fail(self, error):
+        pool = Pool.instance()
+        for curl, (request, retried, key, buf, info) in self.active.items():
+            try:
+                self.multi.remove_handle(curl)
+                _endRequest(info, curl, error=error)
+            except Exception:
+                pass
+            pool.discard(curl)
+            request[0]._setError(error)
+        self.active.clear()
+        try:
+            self.multi.close()
+        except Exception:
+            pass
+        self.multi = pycurl.CurlMulti()
 
 class SerialConstants:
     SO_VECTOR = '\x01'
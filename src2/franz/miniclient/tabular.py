@@ -0,0 +1,102 @@
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+"""
+Decoders for the SPARQL 1.1 tab and comma separated results formats.
+Both return the {names, values} object that a JSON response decodes to.
+"""
+
+import csv, re
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+# The first character of an N-Triples term.
+_TERM_START = frozenset([u'<', u'"', u'_'])
+
+_number = re.compile(ur'[+-]?(?:(\d+)|(\d*\.\d+)|((?:\d+\.?\d*|\.\d+)[eE][+-]?\d+))$')
+
+def _tsvCell(cell):
+    """
+    Convert a TSV cell that is not in N-Triples form, i.e. is empty (an
+    unbound value) or an abbreviated Turtle number or boolean.
+    """
+    if not cell:
+        return None
+    if cell in (u'true', u'false'):
+        return u'"%s"^^<%sboolean>' % (cell, XSD)
+    match = _number.match(cell)
+    if match is None:
+        return cell
+    integer, decimal, double = match.groups()
+    kind = "integer" if integer else "decimal" if decimal else "double"
+    return u'"%s"^^<%s%s>' % (cell, XSD, kind)
+
+def decodeTSV(body):
+    """
+    Decode a text/tab-separated-values response (as bytes or unicode).
+    The values are the N-Triples strings of the terms, or None for
+    unbound values, as in JSON responses.
+    """
+    if isinstance(body, str):
+        body = body.decode("utf-8")
+    # Tabs and line breaks in literals are escaped, so they only ever
+    # separate cells and rows.
+    if u'\r' in body:
+        body = body.replace(u'\r\n', u'\n')
+    header = body.find(u'\n')
+    if header < 0:
+        header = len(body)
+    names = [name.lstrip(u'?$') for name in body[:header].split(u'\t')] if header else []
+    lines = body[header + 1:].split(u'\n')
+    if lines[-1] == u'':
+        lines.pop()
+    if not names:
+        values = [[] for line in lines]
+    else:
+        start = _TERM_START
+        values = [[cell if cell[:1] in start else _tsvCell(cell) for cell in line.split(u'\t')]
+                  for line in lines]
+    return {"names": names, "values": values}
+
+class CSVValue(unicode):
+    """
+    The text of a value in a text/csv response, which is never in
+    N-Triples form, even when it looks like it (a literal's label may
+    be '<x>' or '_:b'), and stands for a plain literal.
+    """
+    __slots__ = ()
+
+def decodeCSV(body):
+    """
+    Decode a text/csv response (as bytes or unicode). The values are
+    the plain strings the format gives (an IRI, a literal's label, or
+    _:id for a blank node), as CSVValues, or None for unbound values
+    (and empty strings). The kind of term and the datatype and language
+    of literals are lost.
+    """
+    if '"' in body:
+        # The csv module reads bytes only.
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+        rows = [[CSVValue(cell.decode("utf-8")) if cell else None for cell in row]
+                for row in csv.reader(body.splitlines(True))]
+    else:
+        if isinstance(body, str):
+            body = body.decode("utf-8")
+        # Rows end with CRLF (or LF); unicode.splitlines would also split
+        # at the other line separators, which may occur in the values.
+        if u'\r' in body:
+            body = body.replace(u'\r\n', u'\n')
+        lines = body.split(u'\n')
+        if lines[-1] == u'':
+            lines.pop()
+        rows = [[CSVValue(cell) if cell else None for cell in line.split(u',')]
+                for line in lines]
+    if not rows:
+        return {"names": [], "values": []}
+    return {"names": [name or u'' for name in rows[0]], "values": rows[1:]}
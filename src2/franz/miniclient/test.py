@@ -6,9 +6,9 @@
 # http://www.eclipse.org/legal/epl-v10.html
 ###############################################################################
 
-import repository, re
+import repository, re, threading
 from os import environ
-from request import RequestError, encode, decode, serialize, deserialize
+from request import Pool, RequestError, RowReader, encode, decode, serialize, deserialize
 
 from nose.tools import with_setup, eq_ as eq
 
@@ -134,4 +134,92 @@ def test_stored_proc_args():
     enc = encode(serial)
     assert serial == decode(enc)
     assert orig == deserialize(serial)
-    
+
+def test_row_reader():
+    body = '{"names": ["s", "o"], "values": [["<a>", "\\"x]\\\\\\"[\\""], [["<l>"], null]]}'
+    for size in (1, 2, 7, len(body)):
+        rows = []
+        reader = RowReader(lambda row, names: rows.append((row, names)))
+        for i in range(0, len(body), size):
+            reader.process(body[i:i + size])
+        eq([(["<a>", '"x]\\"["'], ["s", "o"]), ([["<l>"], None], ["s", "o"])], rows)
+        eq(2, reader.rowsParsed)
+        eq(len(body), reader.bytesParsed)
+
+def test_pool():
+    class Handle(object):
+        closed = False
+        def getinfo(self, option): return -1
+        def close(self): self.closed = True
+    pool = Pool(Handle, 0)
+    pool.maxSize = 2
+    a, b = pool.get("x"), pool.get("y")
+    pool.put(a, "x")
+    pool.put(b, "y")
+    # Reuse within a partition only.
+    assert pool.get("x") is a
+    pool.put(a, "x")
+    # At capacity, the oldest idle handle of another partition is evicted.
+    c = pool.get("z")
+    assert c is not a and c is not b and b.closed
+    pool.discard(c)
+    pool.idleTimeout = -1
+    assert pool.get("x") is not a and a.closed
+    eq({"hits": 1, "misses": 4, "creations": 4, "evictions": 2, "size": 1, "idle": 0}, pool.stats())
+    # Without waiting, get() gives up when every handle is in use.
+    pool.idleTimeout = 60
+    d = pool.get("y")
+    assert pool.get("y", wait=False) is None
+    pool.put(d, "y")
+    assert pool.get("y", wait=False) is d
+
+def test_compress_fallback():
+    import request, tempfile
+    sent = []
+    def makeRequest(obj, method, url, body=None, accept="*/*", contentType=None, headers=None, **rest):
+        sent.append((headers, body.read()))
+        return (415, "") if headers else (204, "")
+    data = "<a> <p> <b> .\n" * 100
+    f = tempfile.TemporaryFile()
+    f.write(data)
+    f.seek(0)
+    progress = []
+    loader = repository.Repository(url + "/repositories/foo", compressRequests=True, compressThreshold=0)
+    original, request.makeRequest = request.makeRequest, makeRequest
+    try:
+        loader.loadFile(f, "ntriples", progress=lambda bytes, lines: progress.append((bytes, lines)))
+    finally:
+        request.makeRequest = original
+        f.close()
+    # The compressed body is refused, and the file sent again as is.
+    eq(["Content-Encoding: gzip"], sent[0][0])
+    eq((None, data), sent[1])
+    eq((len(data), 100), progress[-1])
+    eq(False, loader.compressRequests)
+
+@with_setup(cleanup)
+def testBatch():
+  rep.addStatement("<a>", "<p>", '"a"', "<c1>")
+  rep.addStatement("<b>", "<p>", '"b"', "<c2>")
+  with rep.batch(maxConnections=2):
+    c1 = rep.getStatements(context="<c1>")
+    c2 = rep.getStatements(context="<c2>")
+    rep.addStatement("<c>", "<p>", '"c"')
+    bad = rep.evalSparqlQuery("select nonsense")
+    # Other threads are not batched, and a nested batch runs on its own.
+    sizes = []
+    thread = threading.Thread(target=lambda: sizes.append(rep.getSize()))
+    thread.start()
+    thread.join()
+    eq([2], sizes)
+    with rep.batch():
+      inner = rep.getSize()
+    eq(2, inner.result())
+  eq([["<a>", "<p>", '"a"', "<c1>"]], c1.result())
+  eq([["<b>", "<p>", '"b"', "<c2>"]], c2.result())
+  eq(3, rep.getSize())
+  try:
+    bad.result()
+    assert False, "expected a RequestError"
+  except RequestError:
+    pass
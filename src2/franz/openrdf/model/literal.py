@@ -14,11 +14,10 @@ from __future__ import absolute_import
 
 from .value import Value, URI
 from ..exceptions import IllegalArgumentException
-from ..util import strings
+from ..util import ntriples
 from ..vocabulary.xmlschema import XMLSchema
-from ..util import strings
 
-import datetime
+import datetime, warnings
 from collections import defaultdict
 from copy import copy
 
@@ -63,61 +62,99 @@ def datatype_from_python(value, datatype):
     return unicode(value), datatype
 
 
+def _datatype_uri(datatype):
+    """
+    Return datatype, a URI or a URI string with or without angle
+    brackets, as a URI, or None.
+    """
+    if isinstance(datatype, basestring):
+        if datatype[0] == '<':
+            datatype = datatype[1:-1]
+        return _DATATYPES.get(datatype) or URI(datatype)
+    elif datatype is not None:
+        if not isinstance(datatype, URI):
+            return URI(datatype)
+        elif datatype.uri is None:
+            return None
+    return datatype
+
+def _deprecated_setter(name):
+    message = "Literal.%s is deprecated: Literals are immutable. Create a new Literal instead." % name
+    warnings.warn(message, DeprecationWarning, stacklevel=3)
+    # Changing a Literal in place would change it in every result that
+    # shares it through the term cache, and its hash.
+    raise AttributeError(message)
+
+## map of XML Schema datatype uri strings to URI objects:
+_DATATYPES = dict((uri.uri, uri) for uri in XMLSchema.uristr2obj.itervalues())
+
 class Literal(Value):
     """
-    Implementation of the Literal class.
+    Implementation of the Literal class.  Literals are immutable.
     """
-    
+    __slots__ = ('_label', '_datatype', '_language')
+
     def __init__(self, label, datatype=None, language=None):
-        Value.__init__(self)
-        
-        # Uses the properties to set the real values
-        self.label, self.datatype = datatype_from_python(label, datatype)
-        self.language = language
+        label, datatype = datatype_from_python(label, datatype)
+        self._label = label
+        self._datatype = _datatype_uri(datatype)
+        self._language = language.lower() if language else None
+
+    @staticmethod
+    def _fromParsed(label, datatype=None, language=None):
+        """
+        Make a Literal from the parts of an ntriples literal, as found in
+        data from the server: a label string, a datatype URI string or None,
+        and a lower case language tag or None.
+        """
+        literal = Literal.__new__(Literal)
+        literal._label = label
+        literal._datatype = datatype and (_DATATYPES.get(datatype) or URI(datatype))
+        literal._language = language
+        return literal
 
     def getDatatype(self):
         """The URI representing the datatype for this literal, if there is one""" 
         return self._datatype
     
     def setDatatype(self, datatype):
-        """Sets the datatype of the value"""
-        if isinstance(datatype, str):
-            if datatype[0] == '<':
-                datatype = datatype[1:-1]
-            datatype = XMLSchema.uristr2obj.get(datatype, None) or URI(datatype)
-        elif datatype is not None:
-            if not isinstance(datatype, URI):
-                datatype = URI(datatype)
-            elif datatype.uri is None:
-                datatype = None
-
-        self._datatype = datatype # pylint: disable-msg=W0201
+        """
+        Deprecated, and no longer works: Literals are immutable, and may
+        be shared through the term cache. Create a new Literal instead.
+        """
+        _deprecated_setter('setDatatype')
 
-    datatype = property(getDatatype, setDatatype)
+    datatype = property(getDatatype)
 
     def getLanguage(self):
         """The language for this Literal"""
         return self._language
     
     def setLanguage(self, language):
-        """Set the language for this Literal"""
-        self._language = language.lower() if language else None # pylint: disable-msg=W0201
+        """
+        Deprecated, and no longer works: Literals are immutable, and may
+        be shared through the term cache. Create a new Literal instead.
+        """
+        _deprecated_setter('setLanguage')
 
-    language = property(getLanguage, setLanguage)
+    language = property(getLanguage)
 
     def getLabel(self):
         """The label/value for this Literal"""
         return self._label
     
     def setLabel(self, label):
-        """Set the label for this Literal"""
-        self._label = label # pylint: disable-msg=W0201
-    
+        """
+        Deprecated, and no longer works: Literals are immutable, and may
+        be shared through the term cache. Create a new Literal instead.
+        """
+        _deprecated_setter('setLabel')
+
     def getValue(self):
         """The label/value"""
         return self.label
 
-    label = property(getLabel, setLabel)
+    label = property(getLabel)
     
     def __eq__(self, other):
         if not isinstance(other, Literal):
@@ -129,6 +166,9 @@ class Literal(Value):
     
     def __hash__(self):
         return hash(self._label)
+
+    def __reduce__(self):
+        return Literal, (self._label, self._datatype, self._language)
     
     def intValue(self):
         """Convert to int"""
@@ -144,7 +184,7 @@ class Literal(Value):
     
     def booleanValue(self):
         """Convert to bool"""
-        return bool(self._label.capitalize())
+        return self._label in ('true', '1')
     
     def dateValue(self):
         """Convert to date"""
@@ -177,17 +217,8 @@ class Literal(Value):
         """
         Return an NTriples representation for this Literal.
         """
-        sb = []
-        sb.append('"')
-        sb.append(strings.encode_ntriple_string(self.getLabel()))
-        sb.append('"')
-        if self.language:
-            sb.append('@')
-            sb.append(self.language)
-        if self.datatype:
-            sb.append("^^")
-            sb.append(self.datatype.toNTriples())
-        return ''.join(sb)
+        return ntriples.literal_to_ntriples(self._label, self._datatype and self._datatype.uri,
+                                            self._language)
 
 
 ###############################################################################
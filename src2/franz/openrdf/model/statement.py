@@ -14,12 +14,19 @@ from __future__ import absolute_import
 
 from .value import Value, URI, BNode
 from .literal import Literal
-from ..util import strings
+from ..util import ntriples
+from ...miniclient.tabular import CSVValue
+from ..util.cache import LRUCache
 
-class Statement:
+# Terms parsed by stringTermToTerm, by their ntriples string.
+_termCache = LRUCache(10000)
+
+class Statement(object):
     """
     Lightweight implementation of 'Statement'
     """
+    __slots__ = ('subject', 'predicate', 'object', 'context', 'string_tuple')
+
     def __init__(self, subject, predicate, object, context=None):
         self.subject = subject
         self.predicate = predicate
@@ -46,6 +53,12 @@ class Statement:
     def __hash__(self):
         return 961 * self.getSubject().__hash__() + 31 * self.getPredicate().__hash__() + self.getObject().__hash__();
 
+    def __getstate__(self):
+        return (self.subject, self.predicate, self.object, self.context, self.string_tuple)
+
+    def __setstate__(self, state):
+        self.subject, self.predicate, self.object, self.context, self.string_tuple = state
+
     def __str__(self):
         sb= []
         sb.append("(")
@@ -125,20 +138,41 @@ class Statement:
         """
         Given a string representing a term in ntriples format, return
         a URI, Literal, or BNode.
+
+        Terms are cached (see setTermCacheSize), so the same object is
+        returned for a string that is seen repeatedly; it must not be
+        modified.
         """
         if not string_term:
             return string_term
-        
-        parsed = strings.uriref(string_term)
-        if parsed:
-            return URI(parsed)
+        if isinstance(string_term, CSVValue):
+            return Literal(unicode(string_term))
+        return _termCache.get(string_term, Statement._parseTerm)
 
-        parsed = strings.literal(string_term)
-        if parsed:
-            return Literal(*parsed)
+    @staticmethod
+    def _parseTerm(string_term):
+        parsed = ntriples.parse_term(string_term)
+        if parsed is None:
+            return Literal(string_term)
+        kind = parsed[0]
+        if kind == ntriples.URI:
+            return URI(parsed[1])
+        if kind == ntriples.LITERAL:
+            return Literal._fromParsed(*parsed[1:])
+        return BNode(parsed[1])
 
-        parsed = strings.nodeid(string_term)
-        if parsed:
-            return BNode(parsed)
+    @staticmethod
+    def setTermCacheSize(size):
+        """
+        Set the number of parsed terms kept for stringTermToTerm, which is
+        shared by all results. 0 disables the cache.
+        """
+        _termCache.resize(size)
 
-        return Literal(string_term)
+    @staticmethod
+    def getTermCacheStats():
+        """
+        Return the hits, misses, hit rate and size of the term cache,
+        as a dictionary.
+        """
+        return _termCache.stats()
@@ -13,19 +13,24 @@
 from __future__ import absolute_import
 
 from ..exceptions import IllegalArgumentException
-from ..util import uris, strings
+from ..util import uris, ntriples
 
 class Value(object):
     """
     Top class in the org.openrdf.model interfaces.
     """
-    
+    __slots__ = ()
+
     def __str__(self):
         return self.toNTriples()
 
     def __eq__(self, other):
         return NotImplemented
 
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
     # Default to not-hashable
     __hash__ = None
 
@@ -37,12 +42,14 @@ class Value(object):
     
     
 class Resource(Value):
-    pass
+    __slots__ = ()
 
 class URI(Resource):
     """
-    Lightweight implementation of the class 'URI'.
+    Lightweight implementation of the class 'URI'.  URIs are immutable.
     """
+    __slots__ = ('_uri',)
+
     def __init__(self, uri=None, namespace=None, localname=None):
         if uri and not isinstance(uri, basestring):
             raise IllegalArgumentException("Object of type %s passed to URI constructor where string expected: %s"
@@ -57,10 +64,15 @@ class URI(Resource):
         self._uri = uri
     
     def __eq__(self, other):
+        if isinstance(other, URI):
+            return self._uri == other._uri
         return str(self) == str(other)
 
     def __hash__(self):
-        return hash(self.uri)
+        return hash(self._uri)
+
+    def __reduce__(self):
+        return URI, (self._uri,)
     
     def getURI(self):
         """
@@ -94,11 +106,13 @@ class URI(Resource):
         Return an NTriples representation of a resource, in this case, wrap
         it in angle brackets.
         """
-        return "<%s>" % strings.encode_ntriple_string(self.uri)
+        return ntriples.uri_to_ntriples(self._uri)
     
 class BNode(Resource):
     """
     """
+    __slots__ = ('id',)
+
     def __init__(self, id=None):
         self.id = id
         
@@ -115,6 +129,9 @@ class BNode(Resource):
     
     def __hash__(self):
         return hash(self.id)
+
+    def __reduce__(self):
+        return BNode, (self.id,)
     
     def toNTriples(self):
         return "_:%s" % self.id
@@ -11,26 +11,93 @@
 ###############################################################################
 
 from __future__ import absolute_import
+from __future__ import with_statement
 
 from .value import Value, BNode, URI
 from .literal import Literal, CompoundLiteral, RangeLiteral, GeoCoordinate
 from .statement import Statement
 from ..vocabulary.xmlschema import XMLSchema
 
+import threading
+
 class ValueFactory(object):
     """
     A factory for creating URIs, blank nodes, literals and statements.
+
+    Blank node ids are fetched from the server BLANK_NODE_AMOUNT at a
+    time at first. Each time they run out, twice as many are fetched
+    the next time, up to MAX_BLANK_NODE_AMOUNT. If PREFETCH_BLANK_NODES
+    is true, more ids are fetched in the background when only a quarter
+    of the current amount is left, so that they rarely run out; when
+    they do all the same, the amount is doubled as well.
     """
     BLANK_NODE_AMOUNT = 10    
+    MAX_BLANK_NODE_AMOUNT = 10000
+    PREFETCH_BLANK_NODES = False
     def __init__(self, store):
         self.store = store
         self.unusedBNodeIds = []
+        self.bnodeAmount = None
+        self.bnodeLock = threading.Condition()
+        self.refillingBNodeIds = False
+        self.bnodeStarved = False
         
     def getUnusedBNodeId(self):
-        if not self.unusedBNodeIds:
-            ## retrieve a set of bnode ids (they include leading '_:', which we strip off later:
-            self.unusedBNodeIds = self.store.mini_repository.getBlankNodes(amount=ValueFactory.BLANK_NODE_AMOUNT)
-        return self.unusedBNodeIds.pop()[2:] ## strip off leading '_:'
+        return self.getUnusedBNodeIds(1)[0]
+
+    def getUnusedBNodeIds(self, count):
+        """
+        Return a list of count unused blank node ids.
+        """
+        with self.bnodeLock:
+            unused = self.unusedBNodeIds
+            while len(unused) < count:
+                if self.refillingBNodeIds:
+                    # The refill came too late; make the next one larger.
+                    self.bnodeStarved = True
+                    self.bnodeLock.wait()
+                else:
+                    unused.extend(self._fetchBNodeIds(count - len(unused)))
+            ids = unused[len(unused) - count:]
+            del unused[len(unused) - count:]
+            if (ValueFactory.PREFETCH_BLANK_NODES and self.bnodeAmount and not self.refillingBNodeIds and
+                    len(unused) <= self.bnodeAmount // 4):
+                self.refillingBNodeIds = True
+                refill = threading.Thread(target=self._refillBNodeIds, name="BNodeIds")
+                refill.setDaemon(True)
+                refill.start()
+        ## strip off leading '_:'
+        return [id[2:] for id in ids]
+
+    def _fetchBNodeIds(self, minimum):
+        """
+        Fetch at least minimum blank node ids, and more the next time.
+        """
+        amount = self.bnodeAmount or ValueFactory.BLANK_NODE_AMOUNT
+        self._growBNodeAmount(amount)
+        ## retrieve a set of bnode ids (they include leading '_:', which we strip off later:
+        return self.store.mini_repository.getBlankNodes(amount=max(amount, minimum))
+
+    def _growBNodeAmount(self, amount):
+        self.bnodeAmount = min(amount * 2, max(ValueFactory.MAX_BLANK_NODE_AMOUNT, amount))
+
+    def _refillBNodeIds(self):
+        ids = []
+        try:
+            with self.bnodeLock:
+                amount = self.bnodeAmount
+            ids = self.store.mini_repository.getBlankNodes(amount=amount)
+        except Exception:
+            # The next fetch that is waited for reports the error.
+            pass
+        finally:
+            with self.bnodeLock:
+                self.unusedBNodeIds[:0] = ids
+                self.refillingBNodeIds = False
+                if self.bnodeStarved:
+                    self.bnodeStarved = False
+                    self._growBNodeAmount(self.bnodeAmount)
+                self.bnodeLock.notifyAll()
 
     def createBNode(self, nodeID=None):
         """
@@ -39,6 +106,13 @@ class ValueFactory(object):
         if not nodeID:
             nodeID = self.getUnusedBNodeId()
         return BNode(nodeID)
+
+    def createBNodes(self, count):
+        """
+        Create a list of count new blank nodes, fetching the ids
+        they need from the server in one request at most.
+        """
+        return [BNode(nodeID) for nodeID in self.getUnusedBNodeIds(count)]
     
     def createLiteral(self, value, datatype=None, language=None):
         """
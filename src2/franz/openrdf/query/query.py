@@ -11,10 +11,13 @@
 ###############################################################################
 
 from __future__ import absolute_import
+from __future__ import with_statement
 
 from ..exceptions import IllegalOptionException, QueryMissingFeatureException
 from .dataset import ALL_CONTEXTS, Dataset
 from .queryresult import GraphQueryResult, TupleQueryResult
+from .tuplequeryresultformat import TupleQueryResultFormat
+from ...miniclient.request import _batchOf, decodeResponse
 import datetime
 
 class QueryLanguage:
@@ -156,12 +159,35 @@ class Query(object):
         
     def _get_connection(self):
         return self.connection
+
+    def prepare(self):
+        """
+        Return a PreparedQuery that executes this (SPARQL) query with its
+        current dataset, settings and bindings, and per call bindings.
+        """
+        return PreparedQuery(self)
+
+    def _toResult(self, response):
+        """
+        Turn the server's response into what evaluate returns.
+        """
+        return response
     
-    def evaluate_generic_query(self, count=False, accept=None, analyze=False, analysisTechnique=None, analysisTimeout=None, update=False):
+    def evaluate_generic_query(self, count=False, accept=None, analyze=False, analysisTechnique=None, analysisTimeout=None, update=False, stream=False,
+                               limit=None, offset=None):
         """
         Evaluate a SPARQL or PROLOG query, which may be a 'select', 'construct', 'describe'
         or 'ask' query (in the SPARQL case).  Return an appropriate response.
 
+        If stream is True, row-producing responses are returned as a
+        RowStream that is read while the response arrives.
+
+        Limit and offset restrict a SPARQL query to a range of its results.
+
+        If the connection has a query cache (see
+        RepositoryConnection.enableQueryCache), the response is taken from
+        it when it holds the same query.
+
         If analysis is True it will perform query analysis for SPARQL queries.
         analysisTechnique defaults to "executed", which executes the query to perform dynamic analysis.
             "static" analysis is the other option.
@@ -180,18 +206,44 @@ class Query(object):
             for vbl, val in self.bindings.items():
                 bindings[vbl] = conn._convert_term_to_mini_term(val)
         mini = conn._get_mini_repository()
+        cache = mini.queryCache
+        if (cache is not None and not (update or stream or analyze) and
+            _batchOf(mini) is None and not hasattr(mini, '_saveFile')):
+            if accept is None:
+                accept = "text/integer" if count else "application/json"
+            key = (mini.url, str(self.queryLanguage), self.queryString,
+                   bindings and tuple(sorted(bindings.items())),
+                   regularContexts and tuple(regularContexts), namedContexts and tuple(namedContexts),
+                   self.includeInferred, self.checkVariables, count, accept, limit, offset)
+            response = cache.get(key)
+            if response is None:
+                generation = cache.generation
+                response = self._evaluate(mini, regularContexts, namedContexts, bindings, count, accept,
+                                          analyze, analysisTechnique, analysisTimeout, update, stream,
+                                          limit, offset, raw=True)
+                cache.put(key, response, generation)
+            return decodeResponse(response, accept)
+        return self._evaluate(mini, regularContexts, namedContexts, bindings, count, accept,
+                              analyze, analysisTechnique, analysisTimeout, update, stream, limit, offset)
+
+    def _evaluate(self, mini, regularContexts, namedContexts, bindings, count, accept, analyze,
+                  analysisTechnique, analysisTimeout, update, stream, limit, offset, raw=False):
         if self.queryLanguage == QueryLanguage.SPARQL:  
             response = mini.evalSparqlQuery(self.queryString, context=regularContexts, namedContext=namedContexts, 
                                             infer=self.includeInferred, bindings=bindings,
                                             checkVariables=self.checkVariables, count=count, accept=accept, analyze=analyze,
-                                            analysisTechnique=analysisTechnique, analysisTimeout=analysisTimeout, update=update)
+                                            analysisTechnique=analysisTechnique, analysisTimeout=analysisTimeout, update=update,
+                                            stream=stream, limit=limit, offset=offset, raw=raw)
         elif self.queryLanguage == QueryLanguage.PROLOG:
             if namedContexts:
                 raise QueryMissingFeatureException("Prolog queries do not support the datasets (named graphs) option.")
             if analyze:
                 raise QueryMissingFeatureException("Prolog queries do not support analysis.")
+            if offset is not None:
+                raise QueryMissingFeatureException("Prolog queries do not support offsets.")
             # evalPrologQuery is already always done as if update=True
-            response = mini.evalPrologQuery(self.queryString, infer=self.includeInferred, count=count, accept=accept)
+            response = mini.evalPrologQuery(self.queryString, infer=self.includeInferred, count=count, accept=accept,
+                                            stream=stream, raw=raw)
         return response
 
     @staticmethod
@@ -209,19 +261,61 @@ class Query(object):
        
   
 class TupleQuery(Query):
-    def evaluate(self, count=False):
+    def evaluate(self, count=False, stream=False, page_size=None, prefetch=1, format=None):
         """
         Execute the embedded query against the RDF store.  Return
         an iterator that produces for each step a tuple of values
         (resources and literals) corresponding to the variables
         or expressions in a 'select' clause (or its equivalent).
+
+        format is the TupleQueryResultFormat the server is asked to send
+        the results in, JSON by default. TSV is quicker to decode for
+        large results; see TupleQueryResultFormat for what CSV loses.
+        Only JSON results can be streamed.
+
+        If stream is True, rows are produced while the response is still
+        being received rather than after it has been decoded as a whole.
+        The result then has no length until it has been read completely,
+        and should be closed if it is abandoned early.
+
+        If page_size is given, the rows of a SPARQL query are requested
+        page_size at a time, with up to 'prefetch' pages fetched in the
+        background while one is read (see RepositoryConnection.
+        iterStatements). The query should have an ORDER BY for the pages
+        to fit together. Such a result has no length until it has been
+        read completely.
         """
-        response = self.evaluate_generic_query(count=count)
+        accept = None
+        if format is not None and format != TupleQueryResultFormat.JSON and not count:
+            if stream:
+                raise IllegalOptionException("Only JSON results can be streamed.")
+            accept = format.mime_type
+
+        if page_size and not count:
+            return self._evaluatePaged(page_size, prefetch, accept)
+
+        response = self.evaluate_generic_query(count=count, accept=accept, stream=stream and not count)
 
         if count:
             return response
-        
-        return TupleQueryResult(response['names'], response['values'])
+
+        return self._get_connection()._result(response, self._toResult)
+
+    def _toResult(self, response):
+        if isinstance(response, dict):
+            return TupleQueryResult(response['names'], response['values'])
+        return TupleQueryResult(response.getNames(), response)
+
+    def _evaluatePaged(self, page_size, prefetch, accept=None):
+        if self.queryLanguage != QueryLanguage.SPARQL:
+            raise QueryMissingFeatureException("Only SPARQL queries can be evaluated in pages.")
+        names = []
+        def fetch(offset, limit):
+            response = self.evaluate_generic_query(accept=accept, limit=limit, offset=offset)
+            names[:] = response['names']
+            return response['values']
+        pages = self._get_connection()._pages(fetch, page_size, prefetch)
+        return TupleQueryResult(list(names), pages)
 
     def analyze(self, analysisTechnique=None, analysisTimeout=None):
         """
@@ -243,14 +337,23 @@ class UpdateQuery(Query):
         """
         return self.evaluate_generic_query(update=True)
 
+    def prepare(self):
+        return PreparedQuery(self, update=True)
+
 class GraphQuery(Query):
     
-    def evaluate(self):
+    def evaluate(self, stream=False):
         """
         Execute the embedded query against the RDF store.  Return
         a graph.
+
+        If stream is True, statements are produced while the response
+        is still being received (see TupleQuery.evaluate).
         """
-        response = self.evaluate_generic_query()
+        response = self.evaluate_generic_query(stream=stream)
+        return self._get_connection()._result(response, GraphQueryResult)
+
+    def _toResult(self, response):
         return GraphQueryResult(response)
 
 class BooleanQuery(Query):
@@ -263,3 +366,76 @@ class BooleanQuery(Query):
         return self.evaluate_generic_query()
 
 
+#############################################################################
+##
+#############################################################################
+
+class PreparedQuery(object):
+    """
+    A SPARQL query whose request is built once, to be executed many
+    times with different bindings. The query text, dataset, inference
+    and variable checking settings and bindings of the Query it is made
+    from are encoded when it is created; later changes to the Query do
+    not affect it.
+
+    Obtained through Query.prepare().
+    """
+    def __init__(self, query, update=False):
+        if query.queryLanguage != QueryLanguage.SPARQL:
+            raise QueryMissingFeatureException("Only SPARQL queries can be prepared.")
+        conn = query._get_connection()
+        self.query = query
+        self.connection = conn
+        self.update = update
+        namedContexts = conn._contexts_to_ntriple_contexts(
+            query.dataset.getNamedGraphs() if query.dataset else None)
+        regularContexts = conn._contexts_to_ntriple_contexts(
+            query.dataset.getDefaultGraphs() if query.dataset else ALL_CONTEXTS)
+        mini = conn._get_mini_repository()
+        self.params = mini.encodeSparqlQuery(query.queryString, infer=query.includeInferred,
+            context=regularContexts, namedContext=namedContexts, checkVariables=query.checkVariables)
+        self.bindings = mini.encodeBindings(self._convertBindings(query.bindings))
+
+    def _convertBindings(self, bindings):
+        conn = self.connection
+        converted = {}
+        for name, value in bindings.iteritems():
+            if isinstance(value, str):
+                value = conn.createLiteral(value)
+            converted[name] = conn._convert_term_to_mini_term(value)
+        return converted
+
+    def _encodeBindings(self, bindings):
+        encoded = self.bindings
+        if bindings:
+            encoded += self.connection._get_mini_repository().encodeBindings(self._convertBindings(bindings))
+        return encoded
+
+    def _request(self, bindings):
+        mini = self.connection._get_mini_repository()
+        return mini.evalEncodedQuery(self.params, self._encodeBindings(bindings), update=self.update)
+
+    def execute(self, **bindings):
+        """
+        Execute the query with the given variables bound to values (or to
+        literals, for strings), in addition to the bindings of the Query,
+        and return what the Query's evaluate would.
+        """
+        return self.connection._result(self._request(bindings), self.query._toResult)
+
+    def executeMany(self, bindingsList, maxConnections=8):
+        """
+        Execute the query once for each dictionary of bindings in
+        bindingsList, with up to maxConnections requests in flight at a
+        time, and return the list of results in the same order.
+        """
+        mini = self.connection._get_mini_repository()
+        toResult = self.query._toResult
+        if _batchOf(mini) is not None:
+            # An asynchronous connection or a batch; its requests overlap anyway.
+            responses = [self._request(bindings) for bindings in bindingsList]
+        else:
+            futures = mini.evalEncodedQueries(self.params, [self._encodeBindings(bindings) for bindings in bindingsList],
+                                              update=self.update, maxConnections=maxConnections)
+            responses = [future.result() for future in futures]
+        return self.connection._results(responses, lambda responses: [toResult(r) for r in responses])
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+"""
+A client side cache of query responses.
+"""
+
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import threading, time
+
+class QueryCache(object):
+    """
+    Holds the responses to up to 'size' queries, as they were received
+    from the server, for 'ttl' seconds each. When it is full the least
+    recently used response is dropped.
+
+    A cache is set on a connection with
+    RepositoryConnection.enableQueryCache. Every request a connection
+    makes that may change the store (adding, removing, clearing,
+    committing, rolling back, SPARQL updates) empties the cache, so the
+    same cache can be given to several connections to the same
+    repository to have each of them see the others' changes.
+    Changes made by other clients are only seen once the ttl expires.
+    """
+    def __init__(self, size=1000, ttl=60):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.uses = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Return the response cached for key, or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.uses += 1
+            entry[2] = self.uses
+            return entry[1]
+
+    def put(self, key, response, generation):
+        """
+        Cache response for key, unless the cache has been invalidated
+        since 'generation' was read, as the response may then be out of
+        date already.
+        """
+        with self.lock:
+            if generation != self.generation or not self.size:
+                return
+            self.uses += 1
+            self.entries[key] = [time.time() + self.ttl, response, self.uses]
+            if len(self.entries) > self.size:
+                oldest = min(self.entries.iteritems(), key=lambda item: item[1][2])[0]
+                del self.entries[oldest]
+
+    def invalidate(self):
+        """
+        Drop all cached responses.
+        """
+        with self.lock:
+            self.entries = {}
+            self.generation += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.generation += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """
+        Return a dictionary with the number of hits, misses and
+        invalidations, the hit rate, the number of responses held and
+        allowed, and the ttl.
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self),
+                "size": self.size,
+                "ttl": self.ttl}
@@ -12,14 +12,20 @@
 
 
 #from franz.openrdf.exceptions import 
-from ..model import Statement
+from ..model import Literal, Statement
 from ..repository.repositoryresult import RepositoryResult
+from ..vocabulary.xmlschema import XMLSchema
 
 try:
     from collections import namedtuple
 except ImportError:
     from ..util.namedtuple import namedtuple
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 #############################################################################
 ##
 #############################################################################
@@ -53,8 +59,17 @@ class TupleQueryResult(QueryResult):
     free any resources it keeps hold of.
     """
     def __init__(self, variable_names, string_tuples):
+        """
+        'string_tuples' is either a list of rows or, for results that
+        are streamed while the response is still arriving, an iterator
+        over them (a miniclient RowStream).
+        """
         QueryResult.__init__(self)
-        if not isinstance(variable_names, list):
+        self.stream = None
+        if not isinstance(string_tuples, (list, tuple)):
+            self.stream = string_tuples
+            string_tuples = []
+        elif not isinstance(variable_names, list):
             variable_names = [variable_names]
             string_tuples = [string_tuples]
         self.variable_names = variable_names
@@ -67,16 +82,23 @@ class TupleQueryResult(QueryResult):
         return self
     
     def next(self):
-        if self.cursor >= self.tuple_count:
-            raise StopIteration()
-
         bset = self.binding_set
-        bset._reset(self.string_tuples[self.cursor])
+        if self.stream is not None:
+            bset._reset(self.stream.next())
+        elif self.cursor >= self.tuple_count:
+            raise StopIteration()
+        else:
+            bset._reset(self.string_tuples[self.cursor])
         self.cursor += 1
         return bset        
 
     def close(self):
-        pass    
+        """
+        Release the result. A streaming result that has not been fully
+        read aborts its transfer.
+        """
+        if self.stream is not None:
+            self.stream.close()
 
     def getBindingNames(self):
         """
@@ -85,11 +107,68 @@ class TupleQueryResult(QueryResult):
         return self.variable_names
         
     def __len__(self):
+        if self.stream is not None:
+            if self.stream.rowCount is None:
+                raise TypeError("The length of a streaming result is only known "
+                                "once it has been read completely.")
+            return self.stream.rowCount
         return self.tuple_count
     
     def rowCount(self):
         return len(self)
 
+    def toColumns(self):
+        """
+        Read the rest of the result and return it as a dictionary mapping
+        each binding name to the list of its values, in row order.
+
+        Literals are converted as by Literal.toPython (a column of
+        numbers of a single datatype in one go, from the labels), URIs
+        and blank nodes are given as terms and unbound values as None.
+        """
+        return dict((name, _columnToList(cells))
+                    for name, cells in zip(self.variable_names, self._readColumns()))
+
+    def toArrays(self, dtypes=None):
+        """
+        Like toColumns, but return a NumPy array per binding name.
+
+        A column of literals of a single numeric, boolean, date or
+        dateTime datatype is converted to an array of the matching NumPy
+        type directly from the labels; other columns are object arrays
+        of the values toColumns gives. 'dtypes' optionally maps binding
+        names to the NumPy dtype to use instead.
+
+        If NumPy is not installed, this returns toColumns().
+        """
+        if numpy is None:
+            return self.toColumns()
+        dtypes = dtypes or {}
+        arrays = {}
+        for name, cells in zip(self.variable_names, self._readColumns()):
+            dtype = dtypes.get(name)
+            typed = _typedLabels(cells)
+            array = None
+            if typed:
+                datatype, labels = typed
+                array = _labelsToArray(labels, dtype or _COLUMN_TYPES[datatype][1])
+            if array is None:
+                array = numpy.array(_columnToList(cells, typed), dtype=dtype or object)
+            arrays[name] = array
+        return arrays
+
+    def _readColumns(self):
+        """
+        Read the rest of the result, returning a sequence of ntriples
+        strings per binding name.
+        """
+        if self.stream is not None:
+            rows = list(self.stream)
+        else:
+            rows = self.string_tuples[self.cursor:]
+        self.cursor += len(rows)
+        return zip(*rows) or [()] * len(self.variable_names)
+
 
 class ListBindingSet(object):
     """
@@ -101,6 +180,8 @@ class ListBindingSet(object):
     ListBindingSet emulates a Sesame BindingSet, a Python dictionary and a list simultaneously.
     The internal datastructure is a pair of lists.  
     """
+    __slots__ = ('variable_names', 'string_tuple', 'value_cache')
+
     def __init__(self, variable_names):
         self.variable_names = variable_names
         self.string_tuple = None
@@ -211,6 +292,76 @@ class ListBindingSet(object):
         return unicode(self._toDict(strings_dict=True))
     
 
+#############################################################################
+## Columns
+#############################################################################
+
+# For the datatypes whose columns are converted as a whole: the function
+# giving the Python value of a label (None to go through toPython) and
+# the NumPy type of an array of them.
+_COLUMN_TYPES = {
+    XMLSchema.INT.uri: (int, 'int64'),
+    XMLSchema.LONG.uri: (int, 'int64'),
+    XMLSchema.INTEGER.uri: (long, 'int64'),
+    XMLSchema.FLOAT.uri: (float, 'float64'),
+    XMLSchema.DOUBLE.uri: (float, 'float64'),
+    XMLSchema.BOOLEAN.uri: (None, 'bool'),
+    XMLSchema.DATETIME.uri: (None, 'datetime64[us]'),
+    XMLSchema.DATE.uri: (None, 'datetime64[D]'),
+}
+
+def _typedLabels(cells):
+    """
+    If all cells are literals of the same datatype in _COLUMN_TYPES,
+    return the datatype's URI string and the list of their labels.
+    """
+    if not cells or not cells[0]:
+        return None
+    literal = Statement.stringTermToTerm(cells[0])
+    if not isinstance(literal, Literal) or literal.datatype is None:
+        return None
+    datatype = literal.datatype.uri
+    if datatype not in _COLUMN_TYPES:
+        return None
+    first = cells[0]
+    suffix = first[first.rindex('"'):]
+    for cell in cells:
+        if not cell or not cell.endswith(suffix):
+            return None
+    end = -len(suffix)
+    return datatype, [cell[1:end] for cell in cells]
+
+def _termValue(cell):
+    term = Statement.stringTermToTerm(cell)
+    if isinstance(term, Literal):
+        return term.toPython()
+    return term
+
+def _columnToList(cells, typed=None):
+    typed = typed or _typedLabels(cells)
+    if typed:
+        function = _COLUMN_TYPES[typed[0]][0]
+        if function:
+            return map(function, typed[1])
+    return map(_termValue, cells)
+
+def _labelsToArray(labels, dtype):
+    """
+    Convert a list of literal labels to an array of dtype, or return
+    None if they do not all convert.
+    """
+    dtype = numpy.dtype(dtype)
+    labels = numpy.array(labels)
+    if dtype.kind == 'b':
+        return (labels == 'true') | (labels == '1')
+    if dtype.kind == 'M':
+        # NumPy takes times without a zone as UTC; the server gives UTC.
+        labels = numpy.char.rstrip(labels, 'Z')
+    try:
+        return labels.astype(dtype)
+    except (ValueError, OverflowError, TypeError):
+        return None
+
 #############################################################################
 ##
 #############################################################################
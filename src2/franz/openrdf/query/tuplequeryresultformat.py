@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+## The formats a TupleQuery can ask the server to send its results in
+## (see TupleQuery.evaluate). JSON is the default. TSV holds the same
+## N-Triples terms without JSON's quoting, so it is smaller and quicker
+## to decode. CSV is smaller still, but only holds the text of each
+## value: IRIs, typed and language tagged literals all come back as
+## plain literals.
+class TupleQueryResultFormat(object):
+    JSON = None
+    TSV = None
+    CSV = None
+    def __init__(self, formatName, mimeType, fileExtensions=[]):
+        self.name = formatName
+        self.mime_type = mimeType
+        self.file_extensions = fileExtensions
+
+    def __str__(self):
+        return self.name
+
+TupleQueryResultFormat.JSON = TupleQueryResultFormat("JSON", "application/json", fileExtensions=["json"])
+
+TupleQueryResultFormat.TSV = TupleQueryResultFormat("TSV", "text/tab-separated-values", fileExtensions=["tsv"])
+
+TupleQueryResultFormat.CSV = TupleQueryResultFormat("CSV", "text/csv", fileExtensions=["csv"])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+from __future__ import absolute_import
+
+from .repositoryconnection import RepositoryConnection
+from ..exceptions import IllegalOptionException
+from ..query.dataset import ALL_CONTEXTS
+from ...miniclient.request import gatherFutures
+
+class AsyncRepositoryConnection(RepositoryConnection):
+    """
+    A RepositoryConnection whose requests are performed in the background
+    by the miniclient RequestReactor, so the calling thread is never
+    blocked on the network.
+
+    Methods that talk to the server (getStatements, size, getContextIDs,
+    getNamespaces, addTriple(s), removeTriples, removeQuads, commit,
+    rollback, and the evaluate methods of queries prepared on this
+    connection) return a miniclient Future for what the corresponding
+    RepositoryConnection method returns. Its result() waits for the
+    value; addDoneCallback and then run code when it arrives, in the
+    reactor thread. Streaming and paged results are not available.
+
+    Obtain one through Repository.getAsyncConnection().
+    """
+    def __init__(self, repository):
+        RepositoryConnection.__init__(self, repository)
+        self.mini_repository = repository.mini_repository.asynchronous()
+
+    def _result(self, response, convert):
+        return response.then(convert)
+
+    def _results(self, responses, convert):
+        return gatherFutures(responses).then(convert)
+
+    def getStatements(self, subject, predicate,  object, contexts=ALL_CONTEXTS, includeInferred=False,
+                      limit=None, offset=None, tripleIDs=False, stream=False):
+        if stream:
+            raise IllegalOptionException("Streaming results are not available on an AsyncRepositoryConnection.")
+        return RepositoryConnection.getStatements(self, subject, predicate, object, contexts,
+            includeInferred=includeInferred, limit=limit, offset=offset, tripleIDs=tripleIDs)
+
+    def _pages(self, fetch, page_size, prefetch):
+        raise IllegalOptionException("Paged results are not available on an AsyncRepositoryConnection.")
+
+    def openSession(self, autocommit=False, lifetime=None, loadinitfile=False):
+        """
+        Open a session. Unlike the other methods this waits for the
+        server, since every later request depends on its outcome.
+        """
+        mini = self._get_mini_repository()
+        reactor = mini._batch
+        del mini._batch
+        try:
+            return RepositoryConnection.openSession(self, autocommit, lifetime, loadinitfile)
+        finally:
+            mini._batch = reactor
+
+    def closeSession(self):
+        mini = self._get_mini_repository()
+        reactor = mini._batch
+        del mini._batch
+        try:
+            return RepositoryConnection.closeSession(self)
+        finally:
+            mini._batch = reactor
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from ..exceptions import IllegalArgumentException
+from ..model import Statement, Value
+from ..query.dataset import ALL_CONTEXTS
+
+import threading, time
+
+def _size(quads):
+    """
+    The number of bytes of ntriples in quads.
+    """
+    size = 0
+    for quad in quads:
+        for term in quad:
+            if term: size += len(term)
+    return size
+
+class BufferedWriter(object):
+    """
+    Collects the statements added to and removed from a connection, and
+    sends them to the server in batches: every run of consecutive adds
+    as a single addStatements request (honoring the connection's
+    add_commit_size) and every run of consecutive removes as a single
+    deleteStatements request, in the order they were made.
+
+    The buffer is flushed when it holds batch_size statements or
+    max_bytes bytes of ntriples, every flush_interval seconds (from a
+    background thread) if that is not None, and by flush() and close().
+
+    Removes that are patterns rather than statements (a None subject,
+    predicate or object, or all contexts) can not be batched; they
+    flush the buffer and are performed immediately.
+
+    Use RepositoryConnection.bufferedWriter() to create one.
+    """
+    def __init__(self, connection, batch_size=1000, max_bytes=4 * 1024 * 1024, flush_interval=None):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        # Runs of [adding, quads], oldest first.
+        self.runs = []
+        self.queued = 0
+        self.queued_bytes = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+        self.last_flush_time = 0.0
+        self.max_queue_depth = 0
+        self.closed = threading.Event()
+        if flush_interval:
+            flusher = threading.Thread(target=self._flushPeriodically, name="BufferedWriter")
+            flusher.setDaemon(True)
+            flusher.start()
+
+    def add(self, arg0, arg1=None, arg2=None, contexts=None):
+        """
+        Queue a triple of values, a Statement or an iterable of Statements
+        for addition, like RepositoryConnection.add.
+        """
+        if contexts and not isinstance(contexts, list):
+            contexts = [contexts]
+        if isinstance(arg0, Value):
+            self.addTriple(arg0, arg1, arg2, contexts=contexts)
+        elif isinstance(arg0, Statement):
+            self.addStatement(arg0, contexts=contexts)
+        elif hasattr(arg0, '__iter__'):
+            for s in arg0:
+                self.addStatement(s, contexts=contexts)
+        else:
+            raise IllegalArgumentException("Illegal first argument to 'add'.  Expected a Value, Statement, or iterator.")
+
+    def addTriple(self, subject, predicate, object, contexts=None):
+        """
+        Queue a triple for addition to one or more contexts (the null
+        context by default), like RepositoryConnection.addTriple.
+        """
+        cxts = self.connection._contexts_to_ntriple_contexts(contexts, none_is_mini_null=True)
+        self._queue(True, self.connection._to_mini_quads(
+            [(subject, predicate, object, cxt) for cxt in cxts]))
+
+    def addStatement(self, statement, contexts=None):
+        self.addTriple(statement.getSubject(), statement.getPredicate(), statement.getObject(),
+                       contexts=contexts)
+
+    def addTriples(self, triples_or_quads, context=ALL_CONTEXTS, ntriples=False):
+        """
+        Queue triples or quads for addition, like RepositoryConnection.addTriples.
+        """
+        self._queue(True, self.connection._to_mini_quads(triples_or_quads, context, ntriples))
+
+    def removeTriples(self, subject, predicate, object, contexts=ALL_CONTEXTS):
+        """
+        Queue the removal of a triple from the given contexts. Patterns
+        are performed immediately (see the class documentation).
+        """
+        if subject is None or predicate is None or object is None or contexts == ALL_CONTEXTS:
+            self.flush()
+            self.connection.removeTriples(subject, predicate, object, contexts)
+            return
+        cxts = self.connection._contexts_to_ntriple_contexts(contexts, none_is_mini_null=True)
+        self._queue(False, self.connection._to_mini_quads(
+            [(subject, predicate, object, cxt) for cxt in cxts]))
+
+    def removeStatement(self, statement, contexts=None):
+        """
+        Queue the removal of a statement, from the given contexts or
+        else from its own context.
+        """
+        if contexts is None:
+            contexts = statement.getContext() or ALL_CONTEXTS
+        self.removeTriples(statement.getSubject(), statement.getPredicate(), statement.getObject(),
+                           contexts=contexts)
+
+    def removeQuads(self, quads, ntriples=False):
+        """
+        Queue the removal of quads, like RepositoryConnection.removeQuads.
+        """
+        self._queue(False, self.connection._to_mini_quads(quads, ALL_CONTEXTS, ntriples))
+
+    def _queue(self, adding, quads):
+        size = _size(quads)
+        with self.lock:
+            if self.runs and self.runs[-1][0] == adding:
+                self.runs[-1][1].extend(quads)
+            else:
+                self.runs.append([adding, quads])
+            self.queued += len(quads)
+            self.queued_bytes += size
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+            if self.queued >= self.batch_size or self.queued_bytes >= self.max_bytes:
+                self.flush()
+
+    def flush(self):
+        """
+        Send everything that is queued to the server. If a request fails,
+        the runs that were not sent stay queued.
+        """
+        with self.lock:
+            if not self.runs:
+                return
+            runs, self.runs = self.runs, []
+            self.queued, self.queued_bytes = 0, 0
+            mini = self.connection._get_mini_repository()
+            start = time.time()
+            for i, (adding, quads) in enumerate(runs):
+                try:
+                    if adding:
+                        mini.addStatements(quads, commitEvery=self.connection.add_commit_size)
+                    else:
+                        mini.deleteStatements(quads)
+                except:
+                    self.runs = runs[i:] + self.runs
+                    self.queued += sum(len(unsent) for _, unsent in runs[i:])
+                    self.queued_bytes += sum(_size(unsent) for _, unsent in runs[i:])
+                    raise
+                self.flushed += len(quads)
+            elapsed = time.time() - start
+            self.flushes += 1
+            self.flush_time += elapsed
+            self.last_flush_time = elapsed
+            self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    def close(self):
+        """
+        Flush the buffer and stop the periodic flushing.
+        """
+        self.closed.set()
+        self.flush()
+
+    def stats(self):
+        """
+        Return a dictionary describing the work done so far: the number of
+        flushes and of statements flushed, the latency (in seconds) of the
+        last flush, the mean and the slowest one, and the current and the
+        largest number of queued statements.
+        """
+        with self.lock:
+            return {"flushes": self.flushes,
+                    "flushed": self.flushed,
+                    "last_flush_time": self.last_flush_time,
+                    "mean_flush_time": self.flush_time / self.flushes if self.flushes else 0.0,
+                    "max_flush_time": self.max_flush_time,
+                    "queue_depth": self.queued,
+                    "max_queue_depth": self.max_queue_depth}
+
+    def _flushPeriodically(self):
+        while not self.closed.wait(self.flush_interval) and not self.closed.isSet():
+            try:
+                self.flush()
+            except Exception:
+                # The statements stay queued; the next flush from the
+                # writing thread reports the error.
+                pass
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from ..query.dataset import ALL_CONTEXTS
+
+from Queue import Queue
+import cjson, itertools, threading, time
+
+class PipelinedLoader(object):
+    """
+    Loads an arbitrarily long iterator of triples or quads in chunks of
+    chunk_size statements. The calling thread converts and encodes a
+    chunk while up to 'uploads' earlier chunks are being sent by worker
+    threads. At most queue_size encoded chunks wait for an upload; when
+    the server falls behind, encoding blocks until one is taken, so
+    memory use stays bounded by the size of the pipeline.
+
+    The first error an upload ends with stops the load and is raised by
+    load(). Chunks are committed separately (see the connection's
+    add_commit_size), so a failed load may have added some of them.
+
+    Use RepositoryConnection.loadPipelined() to run one.
+    """
+    def __init__(self, connection, chunk_size=10000, uploads=4, queue_size=None):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.uploads = uploads
+        self.queue_size = queue_size or 2 * uploads
+        self.chunks = 0
+        self.statements = 0
+        self.encode_time = 0.0
+        self.wait_time = 0.0
+        self.upload_time = 0.0
+
+    def load(self, triples_or_quads, context=ALL_CONTEXTS, ntriples=False):
+        """
+        Load triples_or_quads, which are converted as by addTriples, and
+        return their number.
+        """
+        queue = Queue(self.queue_size)
+        errors = []
+        lock = threading.Lock()
+        mini = self.connection._get_mini_repository()
+        commitEvery = self.connection.add_commit_size
+
+        def upload():
+            while True:
+                body = queue.get()
+                if body is None:
+                    return
+                if errors:
+                    # Keep draining the queue so the loading thread is not blocked.
+                    continue
+                start = time.time()
+                try:
+                    mini.addEncodedStatements(body, commitEvery)
+                except Exception, error:
+                    errors.append(error)
+                else:
+                    with lock:
+                        self.upload_time += time.time() - start
+
+        workers = [threading.Thread(target=upload, name="PipelinedLoader-%d" % i)
+                   for i in range(self.uploads)]
+        for worker in workers:
+            worker.setDaemon(True)
+            worker.start()
+
+        try:
+            statements = iter(triples_or_quads)
+            while not errors:
+                chunk = list(itertools.islice(statements, self.chunk_size))
+                if not chunk:
+                    break
+                start = time.time()
+                body = cjson.encode(self.connection._to_mini_quads(chunk, context, ntriples))
+                queued = time.time()
+                queue.put(body)
+                self.wait_time += time.time() - queued
+                self.encode_time += queued - start
+                self.chunks += 1
+                self.statements += len(chunk)
+        finally:
+            for worker in workers:
+                queue.put(None)
+            for worker in workers:
+                worker.join()
+
+        if errors:
+            raise errors[0]
+        return self.statements
+
+    def stats(self):
+        """
+        Return a dictionary with the number of chunks and statements sent,
+        and the seconds spent encoding, waiting for room in the pipeline
+        (a slow server) and uploading (summed over the upload threads).
+        """
+        return {"chunks": self.chunks, "statements": self.statements,
+                "encode_time": self.encode_time, "wait_time": self.wait_time,
+                "upload_time": self.upload_time}
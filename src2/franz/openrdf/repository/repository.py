@@ -16,6 +16,7 @@ from franz import miniclient
 from ..exceptions import IllegalArgumentException
 from ..model import URI, ValueFactory
 from .repositoryconnection import RepositoryConnection
+from .asyncrepositoryconnection import AsyncRepositoryConnection
 from ..vocabulary.xmlschema import XMLSchema
 
 import re, urllib
@@ -131,6 +132,14 @@ class Repository(object):
         """
         return RepositoryConnection(self)
 
+    def getAsyncConnection(self):
+        """
+        Opens a connection to this store whose methods perform their
+        requests in the background and return Futures (see
+        AsyncRepositoryConnection).
+        """
+        return AsyncRepositoryConnection(self)
+
     def getValueFactory(self):
         """
         Return a ValueFactory for this store
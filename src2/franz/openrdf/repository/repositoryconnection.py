@@ -13,15 +13,20 @@
 from __future__ import absolute_import
 from __future__ import with_statement
 
+from .bufferedwriter import BufferedWriter
+from .pipelinedloader import PipelinedLoader
 from .repositoryresult import RepositoryResult
+from .transaction import Transaction
 
 from ..exceptions import IllegalOptionException, IllegalArgumentException
-from ..model import Statement, Value, URI
+from ..model import BNode, Literal, Statement, Value, URI
 from ..model.literal import RangeLiteral, GeoCoordinate, GeoSpatialRegion, GeoBox, GeoCircle, GeoPolygon
 from ..query.dataset import ALL_CONTEXTS, MINI_NULL_CONTEXT
 from ..query.query import Query, TupleQuery, UpdateQuery, GraphQuery, BooleanQuery, QueryLanguage
+from ..query.querycache import QueryCache
 from ..rio.rdfformat import RDFFormat
-from ..util import uris
+from ..util import ntriples, uris
+from ..util.prefetch import PageIterator
 from ..vocabulary import RDF, RDFS, OWL, XMLSchema
 
 try:
@@ -32,9 +37,30 @@ except ImportError:
 class PrefixFormat(namedtuple('EncodedIdPrefix', 'prefix format')):
     __slots__ = ()
 
-import copy, datetime, os, sys, warnings
+import copy, datetime, itertools, os, sys, warnings
 from contextlib import contextmanager
 
+_SEQUENCE_TYPES = frozenset([list, tuple])
+_STATEMENT_TYPES = frozenset([Statement])
+
+def _typed_literal(datatype):
+    template = u'"%%s"^^<%s>' % datatype.uri
+    return lambda value: template % value
+
+## Encoders of the objects of statements that need neither a Literal
+## nor a check, by type. The literals are those Literal(value) makes.
+_OBJECT_ENCODERS = {
+    URI: URI.toNTriples,
+    BNode: BNode.toNTriples,
+    Literal: Literal.toNTriples,
+    str: ntriples.literal_to_ntriples,
+    unicode: ntriples.literal_to_ntriples,
+    bool: lambda value: u'"%s"^^<%s>' % (value and u'true' or u'false', XMLSchema.BOOLEAN.uri),
+    int: _typed_literal(XMLSchema.LONG),
+    long: _typed_literal(XMLSchema.INTEGER),
+    float: _typed_literal(XMLSchema.DOUBLE),
+}
+
 # RepositoryConnection is the main interface for updating data in and performing
 # queries on a repository.
 #
@@ -56,6 +82,20 @@ class RepositoryConnection(object):
 
     def _get_mini_repository(self):
         return self.mini_repository
+
+    def _result(self, response, convert):
+        """
+        Turn a response of the mini repository into the value a method
+        returns. Overridden by AsyncRepositoryConnection, whose responses
+        are Futures.
+        """
+        return convert(response)
+
+    def _results(self, responses, convert):
+        """
+        Like _result, for a method that makes several requests.
+        """
+        return convert(responses)
         
     def getValueFactory(self):
         return self.repository.getValueFactory()
@@ -135,10 +175,8 @@ class RepositoryConnection(object):
         the triple store.  Omit the default context, since no one had the intelligence to
         make it a first-class object.
         """                         
-        contexts = []
-        for cxt in self._get_mini_repository().listContexts():
-            contexts.append(self.createURI(cxt))
-        return contexts
+        return self._result(self._get_mini_repository().listContexts(),
+                            lambda contexts: [self.createURI(cxt) for cxt in contexts])
 
     def size(self, contexts=ALL_CONTEXTS):
         """
@@ -151,17 +189,14 @@ class RepositoryConnection(object):
         elif len(cxts) == 1:
             return self._get_mini_repository().getSize(cxts[0])
         else:
-            total = 0
-            for cxt in cxts:
-                total += self._get_mini_repository().getSize(cxt)
-            return total
+            return self._results([self._get_mini_repository().getSize(cxt) for cxt in cxts], sum)
 
     def isEmpty(self):
         """
         Returns <tt>true</tt> if this repository does not contain any (explicit)
         statements.
         """
-        return self.size() == 0
+        return self._result(self.size(), lambda size: size == 0)
     
     def _context_to_ntriples(self, context, none_is_mini_null=False):
         if context is None:
@@ -246,12 +281,17 @@ class RepositoryConnection(object):
             return self._to_ntriples(term)
     
     def getStatements(self, subject, predicate,  object, contexts=ALL_CONTEXTS, includeInferred=False,
-                       limit=None, offset=None, tripleIDs=False):
+                       limit=None, offset=None, tripleIDs=False, stream=False):
         """
         Gets all statements with a specific subject, predicate and/or object from
         the repository. The result is optionally restricted to the specified set
         of named contexts.  Returns a RepositoryResult that produces a 'Statement'
         each time that 'next' is called.
+
+        If stream is True, statements are produced while the response is
+        still being received instead of after the whole response has been
+        buffered. Such a result has no length until it has been read
+        completely, and closing it early aborts the transfer.
         """
         subj = self._convert_term_to_mini_term(subject)
         pred = self._convert_term_to_mini_term(predicate)
@@ -261,15 +301,42 @@ class RepositoryConnection(object):
             return self._getStatementsInRegion(subj, pred, obj, cxt, limit=limit, offset=offset)
 
         stringTuples = self._get_mini_repository().getStatements(subj, pred, obj, cxt,
-            infer=includeInferred, limit=limit, offset=offset, tripleIDs=tripleIDs)
-        return RepositoryResult(stringTuples, tripleIDs=tripleIDs)
+            infer=includeInferred, limit=limit, offset=offset, tripleIDs=tripleIDs, stream=stream)
+        return self._result(stringTuples, lambda rows: RepositoryResult(rows, tripleIDs=tripleIDs))
+
+    def iterStatements(self, subject, predicate, object, contexts=ALL_CONTEXTS, includeInferred=False,
+                       tripleIDs=False, page_size=10000, prefetch=1):
+        """
+        Like getStatements, but fetch the statements page_size at a time
+        (with the limit and offset of getStatements), so only a few pages
+        are held at once. While a page is being read, up to 'prefetch'
+        following ones are fetched in the background.
+
+        The pages are requested separately, so statements added or removed
+        while iterating may be skipped or returned twice.
+        """
+        subj = self._convert_term_to_mini_term(subject)
+        pred = self._convert_term_to_mini_term(predicate)
+        obj = self._convert_term_to_mini_term(object, predicate)
+        cxt = self._contexts_to_ntriple_contexts(contexts)
+        mini = self._get_mini_repository()
+        def fetch(offset, limit):
+            return mini.getStatements(subj, pred, obj, cxt, infer=includeInferred,
+                                      limit=limit, offset=offset, tripleIDs=tripleIDs)
+        return RepositoryResult(self._pages(fetch, page_size, prefetch), tripleIDs=tripleIDs)
+
+    def _pages(self, fetch, page_size, prefetch):
+        """
+        Return a PageIterator over the rows fetch(offset, limit) returns.
+        """
+        return PageIterator(fetch, page_size, prefetch)
 
     def getStatementsById(self, ids):
         """
         Return all statements whose triple ID matches an ID in the list 'ids'.
         """
         stringTuples = self._get_mini_repository().getStatementsById(ids)
-        return RepositoryResult(stringTuples, tripleIDs=False)
+        return self._result(stringTuples, lambda rows: RepositoryResult(rows, tripleIDs=False))
     
     def _getStatementsInRegion(self, subject, predicate,  region, contexts, limit=None, offset=None):
         geoType = region.geoType
@@ -297,7 +364,7 @@ class RepositoryConnection(object):
                                         self._convert_term_to_mini_term(region.getResource()),
                                         limit=limit, offset=offset)
         else: pass ## can't happen
-        return RepositoryResult(stringTuples, subjectFilter=subject)            
+        return self._result(stringTuples, lambda rows: RepositoryResult(rows, subjectFilter=subject))
     
     def add(self, arg0, arg1=None, arg2=None, contexts=None, base=None, format=None, serverSide=False):
         """
@@ -324,11 +391,18 @@ class RepositoryConnection(object):
         else:
             raise IllegalArgumentException("Illegal first argument to 'add'.  Expected a Value, Statement, File, or string.")
             
-    def addFile(self, filePath, base=None, format=None, context=None, serverSide=False):
+    def addFile(self, filePath, base=None, format=None, context=None, serverSide=False,
+                chunk_size=None, progress=None):
         """
         Load the file or file path 'filePath' into the store.  'base' optionally defines a base URI,
         'format' is RDFFormat.NTRIPLES or RDFFormat.RDFXML, and 'context' optionally specifies
         which context the triples will be loaded into.
+
+        Unless 'serverSide' is True the file is streamed to the server, and
+        'filePath' may be any object with a read method. For ntriples,
+        'chunk_size' splits the load into requests of that many lines.
+        'progress', if given, is called with the number of bytes and lines
+        sent so far as the upload advances.
         """
         if isinstance(context, (list, tuple)):
             if len(context) > 1:
@@ -336,8 +410,11 @@ class RepositoryConnection(object):
             context = context[0] if context else None
         contextString = self._context_to_ntriples(context, none_is_mini_null=True)
 
-        if isinstance(filePath, file):
-            filePath = os.path.abspath(filePath.name)
+        fileName = filePath
+        if hasattr(filePath, 'read'):
+            fileName = getattr(filePath, 'name', '')
+            if serverSide:
+                filePath = os.path.abspath(fileName)
         elif isinstance(filePath, basestring):
             fileDrive = os.path.splitdrive(filePath)[0]
             if not filePath.startswith('/') and not fileDrive and not filePath[:5].lower() == "http:":
@@ -345,16 +422,16 @@ class RepositoryConnection(object):
                 ## If so, generate an absolute path name to enable AG server to read it:
                 testPath = os.path.abspath(os.path.expanduser(filePath))
                 if os.path.exists(testPath):
-                    filePath = testPath
-        fileExt = os.path.splitext(filePath)[1].lower()
+                    filePath = fileName = testPath
+        fileExt = os.path.splitext(fileName)[1].lower()
         if format == RDFFormat.NTRIPLES or fileExt in ['.nt', '.ntriples']:
             self._get_mini_repository().loadFile(filePath, 'ntriples', context=contextString, serverSide=serverSide,
-                commitEvery=self.add_commit_size)
+                commitEvery=self.add_commit_size, chunkSize=chunk_size, progress=progress)
         elif format == RDFFormat.RDFXML or fileExt in ['.rdf', '.owl']:
             self._get_mini_repository().loadFile(filePath, 'rdf/xml', context=contextString, baseURI=base,
-                serverSide=serverSide, commitEvery=self.add_commit_size)
+                serverSide=serverSide, commitEvery=self.add_commit_size, progress=progress)
         else:
-            raise Exception("Failed to specify a format for the file '%s'." % filePath)
+            raise Exception("Failed to specify a format for the file '%s'." % fileName)
         
     def addTriple(self, subject, predicate, object, contexts=None):
         """
@@ -363,9 +440,9 @@ class RepositoryConnection(object):
         """ 
         obj = self.getValueFactory().object_position_term_to_openrdf_term(object, predicate=predicate)
         cxts = self._contexts_to_ntriple_contexts(contexts, none_is_mini_null=True)
-        for cxt in cxts:
-            self._get_mini_repository().addStatement(self._to_ntriples(subject), self._to_ntriples(predicate),
-                        self._convert_term_to_mini_term(obj), cxt)
+        return self._results([self._get_mini_repository().addStatement(self._to_ntriples(subject),
+                        self._to_ntriples(predicate), self._convert_term_to_mini_term(obj), cxt)
+                        for cxt in cxts], lambda responses: None)
         
     def _to_ntriples(self, term):
         """
@@ -385,39 +462,170 @@ class RepositoryConnection(object):
         then the triples or quads are assumed to contain valid ntriples strings,
         and they are passed to the server with no conversion.        
         """
+        return self._get_mini_repository().addStatements(
+            self._to_mini_quads(triples_or_quads, context, ntriples), commitEvery=self.add_commit_size)
+
+    def addColumns(self, subjects, predicates, objects, contexts=None):
+        """
+        Add the statements whose subjects, predicates, objects and
+        (optionally) contexts are given as separate sequences of the same
+        length, such as the columns of a table. predicates and contexts
+        may also be a single term for all the statements. The terms are
+        as addTriple takes them; statements without a context go in the
+        null context.
+
+        This is the quickest way to add many statements from Python
+        values, since each column is converted in one go.
+        """
+        return self._get_mini_repository().addStatements(
+            self._columns_to_mini_quads(subjects, predicates, objects, contexts, None),
+            commitEvery=self.add_commit_size)
+
+    def loadPipelined(self, triples_or_quads, context=ALL_CONTEXTS, ntriples=False, chunk_size=10000, uploads=4):
+        """
+        Add the triples or quads produced by the iterable triples_or_quads,
+        converted as by addTriples, in chunks of chunk_size statements,
+        encoding each chunk while up to 'uploads' earlier ones are being
+        sent (see PipelinedLoader). Return the loader's stats().
+        """
+        loader = PipelinedLoader(self, chunk_size, uploads)
+        loader.load(triples_or_quads, context, ntriples)
+        return loader.stats()
+
+    def _to_mini_quads(self, triples_or_quads, context=ALL_CONTEXTS, ntriples=False):
+        """
+        Convert triples or quads, as taken by addTriples, to the lists of
+        ntriples strings the mini repository sends to the server.
+
+        Input made only of tuples (or lists) of the same length, or only
+        of Statements, is converted a column at a time (see
+        _columns_to_mini_quads); anything else a quad at a time.
+        """
+        if not isinstance(triples_or_quads, (list, tuple)):
+            triples_or_quads = list(triples_or_quads)
+        if not triples_or_quads:
+            return []
         ntripleContexts = self._contexts_to_ntriple_contexts(context, none_is_mini_null=True)
+        if ntriples:
+            return [[q[0], q[1], q[2], q[3] if len(q) == 4 and q[3] else ntripleContexts]
+                    for q in triples_or_quads]
+        kinds = set(map(type, triples_or_quads))
+        if kinds <= _SEQUENCE_TYPES:
+            lengths = set(map(len, triples_or_quads))
+            if lengths == set([3]):
+                subjects, predicates, objects = zip(*triples_or_quads)
+                return self._columns_to_mini_quads(subjects, predicates, objects, None, ntripleContexts)
+            if lengths == set([4]):
+                subjects, predicates, objects, contexts = zip(*triples_or_quads)
+                return self._columns_to_mini_quads(subjects, predicates, objects, contexts, ntripleContexts)
+        elif kinds == _STATEMENT_TYPES:
+            return self._statements_to_mini_quads(triples_or_quads, ntripleContexts)
         quads = []
         for q in triples_or_quads:
-            isQuad = len(q) == 4
-            quad = [None] * 4
-            if ntriples:
-                quad[0] = q[0]
-                quad[1] = q[1]
-                quad[2] = q[2]
-                quad[3] = q[3] if isQuad and q[3] else ntripleContexts
-            elif isinstance(quad, (list, tuple)):
-                predicate = q[1]
-                obj = self.getValueFactory().object_position_term_to_openrdf_term(q[2], predicate=predicate)
-                quad[0] = self._to_ntriples(q[0])
-                quad[1] = self._to_ntriples(predicate)
-                quad[2] = self._to_ntriples(obj)
-                quad[3] = self._to_ntriples(q[3]) if isQuad and q[3] else ntripleContexts
-            else: # must be a statement
-                predicate = q.getPredicate()
-                obj = self.getValueFactory().object_position_term_to_openrdf_term(q.getObject(), predicate=predicate)
-                quad[0] = self._to_ntriples(q.getSubject())
-                quad[1] = self._to_ntriples(predicate)
-                quad[2] = self._to_ntriples(obj)
-                quad[3] = self._to_ntriples(q.getContext()) if isQuad and q.getContext() else ntripleContexts
-            quads.append(quad)
-        self._get_mini_repository().addStatements(quads, commitEvery=self.add_commit_size)
-                
+            if isinstance(q, Statement):
+                quads.extend(self._statements_to_mini_quads([q], ntripleContexts))
+            else:
+                quads.extend(self._columns_to_mini_quads(
+                    [q[0]], [q[1]], [q[2]], [q[3]] if len(q) == 4 else None, ntripleContexts))
+        return quads
+
+    def _statements_to_mini_quads(self, statements, defaultContexts):
+        """
+        Convert Statements to the quads the mini repository sends. Those
+        that came from the server and whose terms have not been parsed
+        (or set) are sent as the ntriples strings they arrived as; the
+        others are converted by _columns_to_mini_quads.
+        """
+        quads = [None] * len(statements)
+        rest = []
+        for i, st in enumerate(statements):
+            terms = st.string_tuple
+            if terms is not None and st.subject is None and st.predicate is None \
+                    and st.object is None and st.context is None:
+                quads[i] = [terms[0], terms[1], terms[2],
+                            terms[3] if len(terms) > 3 and terms[3] else defaultContexts]
+            else:
+                rest.append(i)
+        if rest:
+            others = [statements[i] for i in rest]
+            # Parse what is left of the terms of statements from the
+            # server; the getters would fail on those made on the client.
+            for st in others:
+                if st.string_tuple is not None:
+                    st.getSubject(), st.getPredicate(), st.getObject(), st.getContext()
+            converted = self._columns_to_mini_quads(
+                [st.subject for st in others], [st.predicate for st in others],
+                [st.object for st in others], [st.context for st in others], defaultContexts)
+            for i, quad in itertools.izip(rest, converted):
+                quads[i] = quad
+        return quads
+
+    def _columns_to_mini_quads(self, subjects, predicates, objects, contexts, defaultContexts):
+        """
+        Convert columns of terms to the quads the mini repository sends.
+        predicates and contexts may also be a single term (a Value or an
+        ntriples string) for every row, and contexts None, in which case
+        the quads get defaultContexts, as do the rows with no context.
+
+        Predicates and contexts are few, so their encodings are looked up
+        in a dictionary. Objects that are plain Values or Python strings,
+        numbers and booleans are encoded by their type, without making a
+        Literal; the others are converted as by addTriple.
+        """
+        to_ntriples = self._to_ntriples
+        if isinstance(predicates, (Value, basestring)):
+            predicates = itertools.repeat(predicates, len(subjects))
+        if contexts is None or isinstance(contexts, (Value, basestring)):
+            contexts = itertools.repeat(contexts, len(subjects))
+
+        subjectColumn = []
+        append = subjectColumn.append
+        last = lastEncoded = None
+        for subject in subjects:
+            # Subjects mostly come in runs.
+            if subject is not last:
+                last = subject
+                lastEncoded = to_ntriples(subject)
+            append(lastEncoded)
+
+        predicates = list(predicates)
+        encoded = {}
+        predicateColumn = []
+        append = predicateColumn.append
+        for predicate in predicates:
+            term = encoded.get(predicate)
+            if term is None:
+                term = encoded[predicate] = to_ntriples(predicate)
+            append(term)
+
+        encoders = _OBJECT_ENCODERS
+        object_term = self.getValueFactory().object_position_term_to_openrdf_term
+        objectColumn = []
+        append = objectColumn.append
+        for obj, predicate in itertools.izip(objects, predicates):
+            encode = encoders.get(type(obj))
+            if encode is not None:
+                append(encode(obj))
+            else:
+                append(to_ntriples(object_term(obj, predicate=predicate)))
+
+        encoded = {}
+        contextColumn = []
+        append = contextColumn.append
+        for cxt in contexts:
+            term = encoded.get(cxt)
+            if term is None and cxt not in encoded:
+                term = encoded[cxt] = to_ntriples(cxt) if cxt else defaultContexts
+            append(term)
+
+        return map(list, itertools.izip(subjectColumn, predicateColumn, objectColumn, contextColumn))
+
     def addStatement(self, statement, contexts=None):
         """
         Add the supplied statement to the specified contexts in the repository.
         """        
-        self.addTriple(statement.getSubject(), statement.getPredicate(), statement.getObject(),
-                       contexts=contexts)      
+        return self.addTriple(statement.getSubject(), statement.getPredicate(), statement.getObject(),
+                              contexts=contexts)
 
     def remove(self, arg0, arg1=None, arg2=None, contexts=None):
         """
@@ -444,10 +652,10 @@ class RepositoryConnection(object):
         obj = self._to_ntriples(self.getValueFactory().object_position_term_to_openrdf_term(object))
         ntripleContexts = self._contexts_to_ntriple_contexts(contexts, none_is_mini_null=True)   
         if ntripleContexts is None or len(ntripleContexts) == 0:
-            self._get_mini_repository().deleteMatchingStatements(subj, pred, obj, None)
+            return self._get_mini_repository().deleteMatchingStatements(subj, pred, obj, None)
         else:
-            for cxt in ntripleContexts:
-                self._get_mini_repository().deleteMatchingStatements(subj, pred, obj, cxt)
+            return self._results([self._get_mini_repository().deleteMatchingStatements(subj, pred, obj, cxt)
+                                  for cxt in ntripleContexts], lambda responses: None)
 
     def removeQuads(self, quads, ntriples=False):
         """
@@ -456,43 +664,21 @@ class RepositoryConnection(object):
         then the  quads are assumed to contain valid ntriples strings,
         and they are passed to the server with no conversion.        
         """
-        removeQuads = []
-        for q in quads:
-            quad = [None] * 4
-            if ntriples:
-                quad[0] = q[0]
-                quad[1] = q[1]
-                quad[2] = q[2]
-                quad[3] = q[3]
-            elif isinstance(quad, (list, tuple)):
-                predicate = q[1]
-                obj = self.getValueFactory().object_position_term_to_openrdf_term(q[2], predicate=predicate)
-                quad[0] = self._to_ntriples(q[0])
-                quad[1] = self._to_ntriples(predicate)
-                quad[2] = self._to_ntriples(obj)
-                quad[3] = self._to_ntriples(q[3])
-            else: # must be a statement
-                predicate = q.getPredicate()
-                obj = self.getValueFactory().object_position_term_to_openrdf_term(q.getObject(), predicate=predicate)
-                quad[0] = self._to_ntriples(q.getSubject())
-                quad[1] = self._to_ntriples(predicate)
-                quad[2] = self._to_ntriples(obj)
-                quad[3] = self._to_ntriples(q.getContext())
-            removeQuads.append(quad)
-        self._get_mini_repository().deleteStatements(removeQuads)
+        return self._get_mini_repository().deleteStatements(
+            self._to_mini_quads(quads, ALL_CONTEXTS, ntriples))
 
     def removeQuadsByID(self, tids):
         """
         'tids' contains a list of triple/tuple IDs (integers).
         Remove all quads with matching IDs.
         """
-        self._get_mini_repository().deleteStatementsById(tids)
+        return self._get_mini_repository().deleteStatementsById(tids)
    
     def removeStatement(self, statement, contexts=None):
         """
         Removes the supplied statement(s) from the specified contexts in the repository.
         """
-        self.removeTriples(statement.getSubject(), statement.getPredicate(), statement.getContext(), contexts=contexts)
+        return self.removeTriples(statement.getSubject(), statement.getPredicate(), statement.getContext(), contexts=contexts)
 
     def clear(self, contexts=ALL_CONTEXTS):
         """
@@ -548,6 +734,39 @@ class RepositoryConnection(object):
         """
         self._get_mini_repository().enableTripleCache(size=size)
 
+    def enableQueryCache(self, size=1000, ttl=60, cache=None):
+        """
+        Keep the responses to up to 'size' queries for 'ttl' seconds, and
+        answer the same query (with the same bindings, dataset and
+        inference setting) from them while they last. Any change made
+        through this connection empties the cache. Pass a QueryCache as
+        'cache' to share it with other connections to this repository.
+        Returns the cache.
+
+        Queries that are streamed, analyzed or saved to a file are not
+        cached, nor are those of an asynchronous connection.
+        """
+        if cache is None:
+            cache = QueryCache(size, ttl)
+        if self._get_mini_repository() == self.repository.mini_repository:
+            # Don't set the cache on the shared mini_repository
+            self.mini_repository = copy.copy(self.repository.mini_repository)
+        self._get_mini_repository().queryCache = cache
+        return cache
+
+    def disableQueryCache(self):
+        """
+        Stop caching query responses (see 'enableQueryCache').
+        """
+        self._get_mini_repository().queryCache = None
+
+    def getQueryCacheStats(self):
+        """
+        Return the stats() of the query cache, or None if there is none.
+        """
+        cache = self._get_mini_repository().queryCache
+        return cache and cache.stats()
+
     ## Indexing control methods
 
     def listIndices(self):
@@ -599,6 +818,12 @@ class RepositoryConnection(object):
     def createBNode(self, nodeID=None):
         return self.getValueFactory().createBNode(nodeID=nodeID)
 
+    def createBNodes(self, count):
+        """
+        Create a list of count new blank nodes (see ValueFactory.createBNodes).
+        """
+        return self.getValueFactory().createBNodes(count)
+
     def createStatement(self, subject, predicate, object, context=None):
         """
         Create a new statement with the supplied subject, predicate and object
@@ -643,10 +868,8 @@ class RepositoryConnection(object):
         """
         Get all declared prefix/namespace pairs
         """
-        namespaces = {}
-        for pair in self._get_mini_repository().listNamespaces():
-            namespaces[pair['prefix']] = pair['namespace']
-        return namespaces        
+        return self._result(self._get_mini_repository().listNamespaces(),
+                            lambda pairs: dict((pair['prefix'], pair['namespace']) for pair in pairs))
 
     def getNamespace(self, prefix):
         """
@@ -658,14 +881,14 @@ class RepositoryConnection(object):
         """
         Sets the prefix for a namespace.
         """
-        self._get_mini_repository().addNamespace(prefix, name)
+        return self._get_mini_repository().addNamespace(prefix, name)
 
     def removeNamespace(self, prefix):
         """
         Removes a namespace declaration by removing the association between a
         prefix and a namespace name.
         """
-        self._get_mini_repository().deleteNamespace(prefix)
+        return self._get_mini_repository().deleteNamespace(prefix)
 
     def clearNamespaces(self, reset=True):
         """
@@ -673,7 +896,7 @@ class RepositoryConnection(object):
         `reset` argument of `True` is passed, the user's namespaces are reset
         to the default set of namespaces, otherwise all namespaces are cleared.
         """
-        self._get_mini_repository().clearNamespaces(reset)
+        return self._get_mini_repository().clearNamespaces(reset)
 
     #############################################################################################
     ## Geo-spatial
@@ -888,6 +1111,52 @@ class RepositoryConnection(object):
         """
         return self._get_mini_repository().runAsUser(username)
 
+    @contextmanager
+    def bufferedWriter(self, batch_size=1000, max_bytes=4 * 1024 * 1024, flush_interval=None):
+        """
+        A context manager for use with the 'with' statement that yields a
+        BufferedWriter for this connection:
+
+        with conn.bufferedWriter(batch_size=10000) as writer:
+            for s, p, o in triples:
+                writer.addTriple(s, p, o)
+
+        The statements added and removed through the writer are sent in
+        batches of up to batch_size statements or max_bytes bytes of
+        ntriples, and at least every flush_interval seconds if that is
+        given. Whatever is left is sent when the block ends.
+        """
+        writer = BufferedWriter(self, batch_size, max_bytes, flush_interval)
+        try:
+            yield writer
+        finally:
+            writer.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        A context manager for use with the 'with' statement that yields a
+        Transaction for this connection, which is best used in a session
+        with autocommit off:
+
+        with conn.session():
+            with conn.transaction() as tx:
+                tx.addTriple(s, p, o)
+                tx.removeTriples(s, p, old)
+
+        The adds and removes are kept on the client and sent when the
+        block ends, as one deleteStatements and one addStatements request
+        followed by a commit. If the block raises an exception, they are
+        dropped without contacting the server.
+        """
+        tx = Transaction(self)
+        try:
+            yield tx
+        except:
+            tx.rollback()
+            raise
+        tx.commit()
+
     @contextmanager
     def saveResponse(self, fileobj, accept, raiseAll=False):
         """
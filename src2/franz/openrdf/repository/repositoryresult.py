@@ -38,6 +38,15 @@ from ..model import Statement, Value
 
 class RepositoryResult(object):  ## inherits IterationWrapper
     def __init__(self, string_tuples, subjectFilter=None, tripleIDs=False):
+        """
+        'string_tuples' is either a list of rows or, for results that
+        are streamed while the response is still arriving, an iterator
+        over them (a miniclient RowStream).
+        """
+        self.stream = None
+        if not isinstance(string_tuples, (list, tuple)):
+            self.stream = string_tuples
+            string_tuples = []
         self.string_tuples = string_tuples
         self.cursor = 0
         self.nonDuplicateSet = None
@@ -58,8 +67,10 @@ class RepositoryResult(object):  ## inherits IterationWrapper
     def close(self):
         """
         Shut down the iterator, to insure that resources are free'd up.
+        A streaming result that has not been fully read aborts its transfer.
         """
-        pass
+        if self.stream is not None:
+            self.stream.close()
 
     def next(self):
         """
@@ -80,8 +91,11 @@ class RepositoryResult(object):  ## inherits IterationWrapper
                 self.nonDuplicateSet = savedNonDuplicateSet
 #        elif self.limit and self.cursor >= self.limit:
 #            raise StopIteration
-        elif self.cursor < len(self.string_tuples):
-            stringTuple = self.string_tuples[self.cursor]
+        elif self.stream is not None or self.cursor < len(self.string_tuples):
+            if self.stream is not None:
+                stringTuple = self.stream.next()
+            else:
+                stringTuple = self.string_tuples[self.cursor]
             if self.triple_ids:
                 stringTuple = RepositoryResult.normalize_quint(stringTuple)
             self.cursor += 1
@@ -91,6 +105,28 @@ class RepositoryResult(object):  ## inherits IterationWrapper
         else:
             raise StopIteration
 
+    def iterTuples(self):
+        """
+        Iterate over the rest of the results as the tuples of ntriples
+        strings they arrived as, (subject, predicate, object) or with a
+        fourth element for the context (and, with tripleIDs, a fifth for
+        the id), without making Statements of them. subjectFilter
+        applies, the duplicate filter does not.
+        """
+        while True:
+            if self.stream is not None:
+                stringTuple = self.stream.next()
+            elif self.cursor < len(self.string_tuples):
+                stringTuple = self.string_tuples[self.cursor]
+            else:
+                return
+            self.cursor += 1
+            if self.triple_ids:
+                stringTuple = RepositoryResult.normalize_quint(stringTuple)
+            if self.subjectFilter and not stringTuple[0] == self.subjectFilter:
+                continue
+            yield stringTuple
+
 #     * Switches on duplicate filtering while iterating over objects. The
 #     * RepositoryResult will keep track of the previously returned objects in a
 #     * {@link java.util.Set} and on calling next()  will ignore any
@@ -121,6 +157,11 @@ class RepositoryResult(object):  ## inherits IterationWrapper
             else: collection.add(stmt)        
 
     def __len__(self):
+        if self.stream is not None:
+            if self.stream.rowCount is None:
+                raise TypeError("The length of a streaming result is only known "
+                                "once it has been read completely.")
+            return self.stream.rowCount
         return len(self.string_tuples)
 
     def rowCount(self):
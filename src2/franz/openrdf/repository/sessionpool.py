@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from ..exceptions import ServerException
+
+from contextlib import contextmanager
+import threading, time
+
+class SessionPool(object):
+    """
+    Hands out connections with an open session from a pool of at most
+    'size' of them, so that short jobs do not each pay for opening (and
+    closing) a session. The sessions are opened with the given
+    autocommit, lifetime and loadinitfile settings (see
+    RepositoryConnection.openSession), all of them up front if preopen
+    is true and otherwise when they are first needed.
+
+    A connection taken with getConnection is given back with
+    release(conn), which rolls back what was not committed, so that
+    the next user of the session starts afresh. session() does both
+    around a with statement:
+
+        with pool.session() as conn:
+            conn.add(...)
+            conn.commit()
+
+    Sessions are kept alive by the miniclient's SessionKeeper while
+    they are in the pool. A session that fails to roll back, or that
+    the SessionKeeper found to be lost (as after an outage long enough
+    for the server to expire it), is closed and replaced by a new one
+    when needed.
+    """
+    def __init__(self, repository, size=8, autocommit=False, lifetime=None, loadinitfile=False,
+                 preopen=False):
+        self.repository = repository
+        self.size = size
+        self.autocommit = autocommit
+        self.lifetime = lifetime
+        self.loadinitfile = loadinitfile
+        self.lock = threading.Condition()
+        self.idle = []
+        self.open = 0
+        self.closed = False
+        if preopen:
+            self.idle = [self._openSession() for i in range(size)]
+            self.open = size
+
+    def _openSession(self):
+        conn = self.repository.getConnection()
+        conn.openSession(self.autocommit, self.lifetime, self.loadinitfile)
+        return conn
+
+    def getConnection(self, timeout=None):
+        """
+        Return a connection with an open session, waiting for up to
+        timeout seconds (forever if None) for one to be released when
+        'size' of them are in use. Raises ServerException if none could
+        be had in time.
+        """
+        deadline = timeout is not None and time.time() + timeout
+        while True:
+            with self.lock:
+                while not self.idle and self.open >= self.size:
+                    if self.closed:
+                        raise ServerException("The session pool has been closed.")
+                    if deadline is not False:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            raise ServerException("No session became available in %s seconds." % timeout)
+                        self.lock.wait(remaining)
+                    else:
+                        self.lock.wait()
+                if self.closed:
+                    raise ServerException("The session pool has been closed.")
+                if not self.idle:
+                    self.open += 1
+                    break
+                conn = self.idle.pop()
+            if not conn._get_mini_repository().sessionLost:
+                return conn
+            # Replace it; a new one can be opened in its place.
+            self._discard(conn)
+        try:
+            return self._openSession()
+        except:
+            with self.lock:
+                self.open -= 1
+                self.lock.notify()
+            raise
+
+    def release(self, conn):
+        """
+        Give back a connection taken with getConnection, rolling back
+        the changes in its session that were not committed.
+        """
+        try:
+            if not self.autocommit:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self.lock:
+            if not self.closed:
+                self.idle.append(conn)
+                self.lock.notify()
+                return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.closeSession()
+        except Exception:
+            pass
+        with self.lock:
+            self.open -= 1
+            self.lock.notify()
+
+    @contextmanager
+    def session(self, timeout=None):
+        """
+        A connection from getConnection for use in a with statement,
+        which releases it at the end.
+        """
+        conn = self.getConnection(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """
+        Close the idle sessions, and those in use as they are released.
+        """
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.open -= len(idle)
+            self.lock.notifyAll()
+        for conn in idle:
+            try:
+                conn.closeSession()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from ..exceptions import IllegalArgumentException
+from ..model import Statement, Value
+from ..query.dataset import ALL_CONTEXTS, MINI_NULL_CONTEXT
+
+import threading
+
+class Transaction(object):
+    """
+    Collects the statements added to and removed from a connection on
+    the client, and sends them all when commit() is called: the removes
+    as a single deleteStatements request, then the adds as a single
+    addStatements request, followed by a commit of the session. Nothing
+    is sent before then, so rollback() only has to forget them.
+
+    It is meant for a session with autocommit off (see
+    RepositoryConnection.openSession), where the two requests and the
+    commit make up one server transaction.
+
+    The changes are kept per statement (quad), so that they coalesce:
+    removing a statement that was added in the transaction cancels the
+    add, and the statement is removed from the store in case it was
+    already there. Adding it again after removing it leaves both the
+    remove and the add, which are sent in that order. Adding the same
+    statement twice adds it twice, as the connection would.
+
+    Only statements can be removed, not patterns: a None subject,
+    predicate or object, or ALL_CONTEXTS, raise IllegalArgumentException.
+    A Statement without a context is removed from the null context.
+
+    Use RepositoryConnection.transaction() to create one.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+        # Quad tuples mapped to the number of times they were added,
+        # and the set of the quads to remove.
+        self.added = {}
+        self.removed = set()
+
+    def add(self, arg0, arg1=None, arg2=None, contexts=None):
+        """
+        Add a triple of values, a Statement or an iterable of Statements,
+        like RepositoryConnection.add.
+        """
+        if contexts and not isinstance(contexts, list):
+            contexts = [contexts]
+        if isinstance(arg0, Value):
+            self.addTriple(arg0, arg1, arg2, contexts=contexts)
+        elif isinstance(arg0, Statement):
+            self.addStatement(arg0, contexts=contexts)
+        elif hasattr(arg0, '__iter__'):
+            for s in arg0:
+                self.addStatement(s, contexts=contexts)
+        else:
+            raise IllegalArgumentException("Illegal first argument to 'add'.  Expected a Value, Statement, or iterator.")
+
+    def addTriple(self, subject, predicate, object, contexts=None):
+        """
+        Add a triple to one or more contexts (the null context by
+        default), like RepositoryConnection.addTriple.
+        """
+        self._add(self.connection._to_mini_quads([(subject, predicate, object)], contexts))
+
+    def addStatement(self, statement, contexts=None):
+        self.addTriple(statement.getSubject(), statement.getPredicate(), statement.getObject(),
+                       contexts=contexts)
+
+    def addTriples(self, triples_or_quads, context=ALL_CONTEXTS, ntriples=False):
+        """
+        Add triples or quads, like RepositoryConnection.addTriples.
+        """
+        self._add(self.connection._to_mini_quads(triples_or_quads, context, ntriples))
+
+    def remove(self, arg0, arg1=None, arg2=None, contexts=None):
+        """
+        Remove a triple of values, a Statement or an iterable of
+        Statements, like RepositoryConnection.remove.
+        """
+        if contexts and not isinstance(contexts, list):
+            contexts = [contexts]
+        if isinstance(arg0, Value) or arg0 is None:
+            self.removeTriples(arg0, arg1, arg2, contexts=contexts)
+        elif isinstance(arg0, Statement):
+            self.removeStatement(arg0, contexts=contexts)
+        elif hasattr(arg0, '__iter__'):
+            for s in arg0:
+                self.removeStatement(s, contexts=contexts)
+        else:
+            raise IllegalArgumentException("Illegal first argument to 'remove'.  Expected a Value, Statement, or iterator.")
+
+    def removeTriples(self, subject, predicate, object, contexts=None):
+        """
+        Remove a triple from one or more contexts (the null context by
+        default).
+        """
+        if subject is None or predicate is None or object is None or contexts == ALL_CONTEXTS:
+            raise IllegalArgumentException("A transaction can only remove statements, not patterns.")
+        self._remove(self.connection._to_mini_quads([(subject, predicate, object)], contexts))
+
+    def removeStatement(self, statement, contexts=None):
+        """
+        Remove a statement from the given contexts, or else from its own
+        context.
+        """
+        if contexts is None:
+            contexts = statement.getContext()
+        self.removeTriples(statement.getSubject(), statement.getPredicate(), statement.getObject(),
+                           contexts=contexts)
+
+    def removeQuads(self, quads, ntriples=False):
+        """
+        Remove quads, like RepositoryConnection.removeQuads. A quad whose
+        context is None is removed from the null context.
+        """
+        self._remove(self.connection._to_mini_quads(quads, ALL_CONTEXTS, ntriples))
+
+    def _keys(self, quads):
+        """
+        The quads as hashable tuples, with the null context spelled out.
+        _to_mini_quads gives triples the list of contexts they go in,
+        which makes one quad per context.
+        """
+        for quad in quads:
+            cxts = quad[3]
+            if not isinstance(cxts, list):
+                cxts = [cxts]
+            for cxt in cxts:
+                yield (quad[0], quad[1], quad[2], cxt or MINI_NULL_CONTEXT)
+
+    def _add(self, quads):
+        with self.lock:
+            for key in self._keys(quads):
+                self.added[key] = self.added.get(key, 0) + 1
+
+    def _remove(self, quads):
+        with self.lock:
+            for key in self._keys(quads):
+                self.added.pop(key, None)
+                self.removed.add(key)
+
+    def _quads(self):
+        """
+        The lists of quads to remove and to add, as the mini repository
+        sends them.
+        """
+        def quad(key):
+            return [key[0], key[1], key[2], None if key[3] == MINI_NULL_CONTEXT else key[3]]
+        removes = [quad(key) for key in self.removed]
+        adds = []
+        for key, count in self.added.iteritems():
+            adds.extend([quad(key)] * count)
+        return removes, adds
+
+    def size(self):
+        """
+        The number of statements that commit() would add and remove.
+        """
+        with self.lock:
+            return sum(self.added.itervalues()) + len(self.removed)
+
+    def isEmpty(self):
+        return self.size() == 0
+
+    def commit(self):
+        """
+        Send the changes to the server and commit them. If that fails,
+        the server transaction is rolled back and the changes are kept,
+        so that commit() can be tried again.
+        """
+        with self.lock:
+            removes, adds = self._quads()
+            mini = self.connection._get_mini_repository()
+            try:
+                if removes:
+                    mini.deleteStatements(removes)
+                if adds:
+                    # No commitEvery: the adds must not be committed
+                    # before the removes and the rest of the adds.
+                    mini.addStatements(adds)
+                mini.commit()
+            except:
+                try:
+                    mini.rollback()
+                except Exception:
+                    pass
+                raise
+            self.added = {}
+            self.removed = set()
+
+    def rollback(self):
+        """
+        Forget the changes. Nothing is sent to the server.
+        """
+        with self.lock:
+            self.added = {}
+            self.removed = set()
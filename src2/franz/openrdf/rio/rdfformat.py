@@ -19,6 +19,7 @@
 class RDFFormat(object):
     RDFXML = None     ## The RDF/XML file format.
     NTRIPLES = None   ## The N-Triples file format.
+    NQUADS = None     ## The N-Quads file format.
     def __init__(self, formatName, mimeTypes=[], charSet="UTF-8", fileExtensions=[], 
                  supportsNamespaces=False, supportsContexts=False):
         self.name = formatName
@@ -35,4 +36,5 @@ RDFFormat.RDFXML = RDFFormat("RDF/XML", mimeTypes=["application/rdf+xml", "appli
 RDFFormat.NTRIPLES = RDFFormat("NTRIPLES", mimeTypes=["text/plain"], fileExtensions=["nt"], charSet="US-ASCII",
                      supportsNamespaces=False, supportsContexts=False)
 
-
+RDFFormat.NQUADS = RDFFormat("NQUADS", mimeTypes=["text/x-nquads"], fileExtensions=["nq"], charSet="UTF-8",
+                     supportsNamespaces=False, supportsContexts=True)
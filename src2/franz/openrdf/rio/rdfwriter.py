@@ -13,6 +13,9 @@
 from __future__ import absolute_import
 
 from .rdfformat import RDFFormat
+from ..model import Literal, Statement, Value
+
+import gzip, sys
 
 class RDFWriter(object):
     def __init__(self, rdfFormat, filePath=None):
@@ -25,15 +28,150 @@ class RDFWriter(object):
     def getFilePath(self):
         return self.file_path 
 
-            
+_STRINGS = (str, unicode)
+
+def _toNTriples(term):
+    """
+    The ntriples form of a term that is not a string already.
+    """
+    if isinstance(term, Value):
+        return term.toNTriples()
+    return Literal(term).toNTriples()
+
+def _statementTerms(statement):
+    """
+    The terms of a Statement: the ntriples strings it came from the
+    server with if none of its terms have been parsed (or set) yet,
+    otherwise its Values.
+    """
+    terms = statement.string_tuple
+    if terms is None:
+        return statement.subject, statement.predicate, statement.object, statement.context
+    if statement.subject is None and statement.predicate is None and statement.object is None \
+            and statement.context is None:
+        return terms
+    return (statement.getSubject(), statement.getPredicate(), statement.getObject(),
+            statement.getContext())
+
 class NTriplesWriter(RDFWriter):
     """
-    Records the format as
-    NTriples, and records the 'filePath' where the serialized RDF will
-    be output to.  If 'filePath' is None, output is to standard output.
-    
-    TODO: THERE IS A WRITER PROTOCOL IMPLEMENTED IN RDFXMLWriter THAT ISN'T
-    IMPLEMENTED HERE.  CONSIDER ADDING IT (OR NOT).
+    Writes statements as N-Triples to 'filePath', or to the file object
+    'fileobj', or else to standard output. The output is gzip-compressed
+    if 'compress' is true, or when it is None and filePath ends in .gz.
+
+    write(statements) takes any iterable of Statements or of tuples of
+    terms (subject, predicate, object and optionally context), such as
+    the rows of a RepositoryResult. Terms that are strings are taken to
+    be in ntriples form already and are written as they are; others are
+    Values (or Python values for objects). The statements of a
+    RepositoryResult, and Statements that came from the server and were
+    not looked into, are written from the strings they arrived as,
+    without parsing them. Lines are collected and written bufferSize
+    characters at a time, encoded as UTF-8.
+
+    The writer can be used in a with statement, or as the Sesame style
+    handler: startRDF(), handleStatement(statement)..., endRDF(). The
+    file it opened (but not fileobj) is closed at the end. It is also
+    the handler taken by the deprecated RepositoryConnection.export
+    methods, which only use its format and path.
     """
-    def __init__(self, filePath=None):
+    def __init__(self, filePath=None, fileobj=None, compress=None, bufferSize=64 * 1024):
         super(NTriplesWriter, self).__init__(RDFFormat.NTRIPLES, filePath)
+        self.fileobj = fileobj
+        if compress is None:
+            compress = filePath is not None and filePath.endswith('.gz')
+        self.compress = compress
+        self.buffer_size = bufferSize
+        self.out = None
+        self.opened = None
+        self.count = 0
+
+    def startRDF(self):
+        """
+        Open the output, unless that was done already.
+        """
+        if self.out is not None:
+            return
+        if self.fileobj is not None:
+            target = self.fileobj
+        elif self.file_path is not None:
+            target = self.opened = open(self.file_path, 'wb')
+        else:
+            target = sys.stdout
+        if self.compress:
+            target = gzip.GzipFile(fileobj=target, mode='wb', compresslevel=6)
+        self.out = target
+
+    def handleStatement(self, statement):
+        self.write((statement,))
+
+    def write(self, statements):
+        """
+        Write the statements, a RepositoryResult or an iterable of
+        Statements or term tuples, and return their number.
+        """
+        iterTuples = getattr(statements, 'iterTuples', None)
+        if iterTuples is not None:
+            statements = iterTuples()
+        self.startRDF()
+        quads = self.rdf_format.supportsContexts
+        strings = _STRINGS
+        lines = []
+        size = 0
+        count = 0
+        for row in statements:
+            if row.__class__ is Statement:
+                row = _statementTerms(row)
+            s, p, o = row[0], row[1], row[2]
+            if s.__class__ not in strings: s = _toNTriples(s)
+            if p.__class__ not in strings: p = _toNTriples(p)
+            if o.__class__ not in strings: o = _toNTriples(o)
+            c = quads and len(row) > 3 and row[3]
+            if c:
+                if c.__class__ not in strings: c = _toNTriples(c)
+                line = u'%s %s %s %s .\n' % (s, p, o, c)
+            else:
+                line = u'%s %s %s .\n' % (s, p, o)
+            lines.append(line)
+            size += len(line)
+            count += 1
+            if size >= self.buffer_size:
+                self.out.write(u''.join(lines).encode('utf-8'))
+                lines = []
+                size = 0
+        if lines:
+            self.out.write(u''.join(lines).encode('utf-8'))
+        self.count += count
+        return count
+
+    def endRDF(self):
+        """
+        Finish the output, closing the file it opened.
+        """
+        if self.out is None:
+            return
+        if self.compress:
+            self.out.close()
+        else:
+            self.out.flush()
+        if self.opened is not None:
+            self.opened.close()
+        self.out = self.opened = None
+
+    close = endRDF
+
+    def __enter__(self):
+        self.startRDF()
+        return self
+
+    def __exit__(self, *args):
+        self.endRDF()
+
+class NQuadsWriter(NTriplesWriter):
+    """
+    Writes statements as N-Quads, like NTriplesWriter, with their
+    contexts. Those in the null context are written as triples.
+    """
+    def __init__(self, filePath=None, fileobj=None, compress=None, bufferSize=64 * 1024):
+        super(NQuadsWriter, self).__init__(filePath, fileobj, compress, bufferSize)
+        self.rdf_format = RDFFormat.NQUADS
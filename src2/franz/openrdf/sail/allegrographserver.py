@@ -26,7 +26,8 @@ class AllegroGraphServer(object):
     """
     Connects to an AllegroGraph HTTP Server
     """
-    def __init__(self, host, port=10035, user=None, password=None, cainfo=None, sslcert=None, verifyhost=None, verifypeer=None, **options):
+    def __init__(self, host, port=10035, user=None, password=None, cainfo=None, sslcert=None, verifyhost=None, verifypeer=None,
+                 compressRequests=False, compressThreshold=16384, **options):
         """
         Defines the connection to the AllegroGraph HTTP server.
 
@@ -38,6 +39,11 @@ class AllegroGraphServer(object):
         See pycurl documentation for the meanings of cainfo, sslcert,
         verifyhost, verifypeer as those values are just passed 
         through to the Curl object's setopt function.
+
+        With compressRequests=True, the statements sent by addTriples,
+        addFile, removeQuads and the like are gzip-compressed when they
+        amount to at least compressThreshold bytes. Compression is switched
+        off again if the server does not accept it.
         """
         
         if re.match('^https?://', host):
@@ -47,7 +53,8 @@ class AllegroGraphServer(object):
         else:
             uri = 'http://%s:%d'
         
-        self._client = miniserver.Client(uri % (host, port), user, password, cainfo, sslcert, verifyhost, verifypeer)
+        self._client = miniserver.Client(uri % (host, port), user, password, cainfo, sslcert, verifyhost, verifypeer,
+                                         compressRequests, compressThreshold)
 
     @property
     def url(self):
@@ -9,7 +9,7 @@
 from __future__ import absolute_import
 from __future__ import with_statement
 
-from ..exceptions import RequestError
+from ..exceptions import IllegalArgumentException, IllegalOptionException, RequestError, ServerException
 from ..sail.allegrographserver import AllegroGraphServer
 from ..repository.repository import Repository
 from ...miniclient import repository
@@ -20,7 +20,7 @@ from ..vocabulary.owl import OWL
 from ..vocabulary.xmlschema import XMLSchema
 from ..query.dataset import Dataset
 from ..rio.rdfformat import RDFFormat
-from ..rio.rdfwriter import  NTriplesWriter
+from ..rio.rdfwriter import  NTriplesWriter, NQuadsWriter
 from ..rio.rdfxmlwriter import RDFXMLWriter
 from ..model import Literal, Statement, URI, ValueFactory
 
@@ -1469,6 +1469,33 @@ def test_blanknodes():
     assert node
     value_factory = conn.getValueFactory()
     assert len(value_factory.unusedBNodeIds) + 1 == ValueFactory.BLANK_NODE_AMOUNT
+
+def test_blanknodes_bulk():
+    """
+    Test creating many blank nodes, in bulk and from several threads
+    """
+    conn = connect()
+    nodes = conn.createBNodes(500)
+    eq_(500, len(set(node.getID() for node in nodes)))
+    value_factory = conn.getValueFactory()
+    amount = value_factory.bnodeAmount
+    for i in range(amount + 1):
+        nodes.append(conn.createBNode())
+    assert value_factory.bnodeAmount > amount
+
+    ValueFactory.PREFETCH_BLANK_NODES = True
+    try:
+        def create():
+            for i in range(1000):
+                nodes.append(conn.createBNode())
+        threads = [threading.Thread(target=create) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        ValueFactory.PREFETCH_BLANK_NODES = False
+    eq_(len(nodes), len(set(node.getID() for node in nodes)))
     
 def test_delete_repository():
     """
@@ -2375,3 +2402,581 @@ def test_materializer():
     print "There were", entailed, "entailed triples"
     assert conn.materializeEntailed(_with="all") >= 40
     assert conn.deleteMaterialized() >= 40
+
+def test_streaming_results():
+    conn = connect()
+    ex = "http://example.org/stream/"
+    p = conn.createURI(ex + "p")
+    for i in range(100):
+        conn.add(conn.createURI(ex + "s%d" % i), p, conn.createLiteral(i))
+
+    result = conn.getStatements(None, p, None, stream=True)
+    assert_raises(TypeError, len, result)
+    subjects = set(str(stmt.getSubject()) for stmt in result)
+    eq_(100, len(subjects))
+    eq_(100, len(result))
+
+    query = conn.prepareTupleQuery(QueryLanguage.SPARQL,
+        "select ?s ?o { ?s <%s> ?o } order by ?o" % p)
+    result = query.evaluate(stream=True)
+    eq_(['s', 'o'], result.getBindingNames())
+    eq_([0, 1, 2], [result.next().getValue('o').intValue() for _ in range(3)])
+    # Abandoning the result early aborts the transfer.
+    result.close()
+    assert_raises(TypeError, len, result)
+    eq_(100, len(list(query.evaluate(stream=True))))
+
+def test_async_connection():
+    conn = connect()
+    aconn = conn.repository.getAsyncConnection()
+    ex = "http://example.org/async/"
+    p = conn.createURI(ex + "p")
+    added = [aconn.addTriple(conn.createURI(ex + "s%d" % i), p, conn.createLiteral(i))
+             for i in range(10)]
+    for future in added:
+        future.result(10)
+    eq_(10, aconn.size().result(10))
+    eq_(False, aconn.isEmpty().result(10))
+
+    seen = []
+    statements = aconn.getStatements(None, p, None)
+    statements.addDoneCallback(lambda future: seen.append(len(future.result())))
+    eq_(10, len(statements.result(10)))
+    eq_([10], seen)
+
+    query = aconn.prepareTupleQuery(QueryLanguage.SPARQL, "select ?s { ?s <%s> ?o }" % p)
+    eq_(10, len(query.evaluate().result(10)))
+    assert_raises(RequestError, aconn.prepareTupleQuery(QueryLanguage.SPARQL, "select nonsense").evaluate().result, 10)
+
+def test_buffered_writer():
+    conn = connect()
+    ex = "http://example.org/buffered/"
+    p = conn.createURI(ex + "p")
+    g = conn.createURI(ex + "g")
+    with conn.bufferedWriter(batch_size=25) as writer:
+        for i in range(60):
+            writer.addTriple(conn.createURI(ex + "s%d" % i), p, conn.createLiteral(i), contexts=g)
+        # Removes keep their place relative to the adds around them.
+        writer.removeTriples(conn.createURI(ex + "s59"), p, conn.createLiteral(59), contexts=g)
+        writer.addTriple(conn.createURI(ex + "s59"), p, conn.createLiteral(59), contexts=g)
+        writer.removeTriples(conn.createURI(ex + "s0"), p, conn.createLiteral(0), contexts=g)
+        eq_(50, conn.size(g))
+    eq_(59, conn.size(g))
+    stats = writer.stats()
+    eq_(63, stats['flushed'])
+    eq_(0, stats['queue_depth'])
+    assert stats['max_queue_depth'] >= 25
+
+def test_pipelined_load():
+    conn = connect()
+    ex = "http://example.org/pipelined/"
+    p = conn.createURI(ex + "p")
+    triples = ((conn.createURI(ex + "s%d" % i), p, conn.createLiteral(i)) for i in xrange(2500))
+    stats = conn.loadPipelined(triples, chunk_size=100, uploads=3)
+    eq_(25, stats['chunks'])
+    eq_(2500, stats['statements'])
+    eq_(2500, conn.size())
+
+    bad = [("<%sx>" % ex, "<%sp>" % ex, "not ntriples")] * 10
+    assert_raises(RequestError, conn.loadPipelined, bad, ntriples=True, chunk_size=5)
+
+def test_streamed_file_upload():
+    conn = connect()
+    path = os.path.join(CURRENT_DIRECTORY, "kennedy.ntriples")
+    progress = []
+    conn.addFile(path, format=RDFFormat.NTRIPLES, chunk_size=500,
+                 progress=lambda bytes, lines: progress.append(lines))
+    eq_(1214, conn.size())
+    eq_([500, 1000, 1214], progress)
+
+    conn.clear()
+    with open(path) as f:
+        data = f.read()
+    # Any object with a read method will do, with the size unknown.
+    conn.addFile(StringIO.StringIO(data), format=RDFFormat.NTRIPLES)
+    eq_(1214, conn.size())
+
+def test_compressed_requests():
+    server = AllegroGraphServer(AG_HOST, AG_PORT, 'test', 'xyzzy', compressRequests=True, compressThreshold=0)
+    conn = server.openCatalog(CATALOG).getRepository(STORE, Repository.OPEN).getConnection()
+    conn.clear()
+    ex = "http://example.org/compressed/"
+    p = conn.createURI(ex + "p")
+    quads = [(conn.createURI(ex + "s%d" % i), p, conn.createLiteral(i)) for i in range(100)]
+    conn.addTriples(quads)
+    conn.addFile(os.path.join(CURRENT_DIRECTORY, "kennedy.ntriples"), format=RDFFormat.NTRIPLES)
+    conn.removeQuads(quads[:50])
+    eq_(1264, conn.size())
+
+def test_parallel_load():
+    from ..tools.parallel_load import ParallelLoader, split_file
+    path = os.path.join(CURRENT_DIRECTORY, "kennedy.ntriples")
+    chunks = split_file(path, 8192)
+    eq_(os.path.getsize(path), sum(chunk.size for chunk in chunks))
+    with open(path) as f:
+        for chunk in chunks[1:]:
+            f.seek(chunk.start - 1)
+            eq_("\n", f.read(1))
+
+    conn = connect()
+    lines = []
+    loader = ParallelLoader(AG_HOST, AG_PORT, 'test', 'xyzzy', CATALOG, STORE, workers=3,
+                            chunk_bytes=8192, interval=0, report=lines.append)
+    result = loader.load([path])
+    eq_(len(chunks), result['chunks'])
+    eq_([], result['failed'])
+    eq_(1214, result['lines'])
+    eq_(1214, conn.size())
+    assert lines
+
+def test_term_cache():
+    from ..util.cache import LRUCache
+    cache = LRUCache(4)
+    computed = []
+    def compute(key):
+        computed.append(key)
+        return key.upper()
+    for key in "abab":
+        eq_(key.upper(), cache.get(key, compute))
+    eq_(["a", "b"], computed)
+    eq_(2, cache.stats()["hits"])
+    for key in "cdefa":
+        cache.get(key, compute)
+    # 'a' fell out of the cache after the others were added.
+    eq_(["a", "b", "c", "d", "e", "f", "a"], computed)
+    assert len(cache) <= 4
+    cache.resize(0)
+    cache.get("a", compute)
+    cache.get("a", compute)
+    eq_(0, len(cache))
+
+    Statement.setTermCacheSize(100)
+    try:
+        uri = Statement.stringTermToTerm("<http://example.org/cached>")
+        assert uri is Statement.stringTermToTerm("<http://example.org/cached>")
+        eq_(Literal("x", language="en"), Statement.stringTermToTerm('"x"@en'))
+        stats = Statement.getTermCacheStats()
+        eq_(1, stats["hits"])
+        eq_(2, stats["misses"])
+    finally:
+        Statement.setTermCacheSize(10000)
+
+def test_immutable_terms():
+    import pickle
+    literal = Statement.stringTermToTerm('"5"^^<http://www.w3.org/2001/XMLSchema#int>')
+    assert literal.datatype is XMLSchema.INT
+    eq_(Literal(5, XMLSchema.INT), literal)
+    assert not literal != Literal(5, XMLSchema.INT)
+    assert_raises(AttributeError, setattr, literal, 'label', '6')
+    # The old setters are deprecated and fail like the properties.
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        assert_raises(AttributeError, literal.setLabel, "6")
+        assert_raises(AttributeError, literal.setLanguage, "en")
+        assert_raises(AttributeError, literal.setDatatype, XMLSchema.LONG)
+    eq_([DeprecationWarning] * 3, [w.category for w in caught])
+    eq_(Literal(5, XMLSchema.INT), literal)
+    uri = URI("http://example.org/a")
+    assert_raises(AttributeError, setattr, uri, 'uri', "http://example.org/b")
+    assert uri != URI("http://example.org/b")
+    # Terms and statements have no per instance dictionary.
+    statement = Statement(uri, uri, literal)
+    for value in (uri, literal, statement):
+        assert not hasattr(value, '__dict__')
+        eq_(value, pickle.loads(pickle.dumps(value)))
+
+def test_ntriples_codec():
+    # The single pass codec agrees with the regular expressions in strings...
+    from ..util import ntriples, strings
+    terms = ['<http://example.org/a>', r'<http://example.org/caf\u00E9>', '"plain"', '""',
+             r'"with \"quotes\", \\ and \n\t\r"', '"x"@en', '"x"@en-us', r'"\U0001F600"',
+             '"5"^^<http://www.w3.org/2001/XMLSchema#int>', '_:b1']
+    for term in terms:
+        parsed = ntriples.parse_term(term)
+        if parsed[0] == ntriples.URI:
+            eq_(strings.uriref(term), parsed[1])
+        elif parsed[0] == ntriples.LITERAL:
+            label, datatype, language = strings.literal(term)
+            eq_((label, datatype, language), parsed[1:])
+        else:
+            eq_(strings.nodeid(term), parsed[1])
+    labels = [u'', u'plain', u'tab\tnew\nline\r', u'"quoted" \\', u'caf\xe9', u'\u4e2d\u6587',
+              u'\x00\x7f', u'\U0001F600', u'!#[]~']
+    for label in labels:
+        eq_(strings.encode_ntriple_string(label), ntriples.escape(label))
+        eq_(label, ntriples.unescape(ntriples.escape(label)))
+        eq_((ntriples.LITERAL, label, None, 'en'),
+            ntriples.parse_term(ntriples.literal_to_ntriples(label, None, 'en')))
+
+    # ...and handles what they get wrong: non-ASCII text and UTF-8 bytes.
+    eq_((ntriples.LITERAL, u'caf\xe9', None, 'fr'), ntriples.parse_term(u'"caf\xe9"@FR'))
+    eq_((ntriples.LITERAL, u'caf\xe9', None, None), ntriples.parse_term('"caf\xc3\xa9"'))
+    eq_(u'"caf\\u00E9"', Literal('caf\xc3\xa9').toNTriples())
+    eq_(None, ntriples.parse_term('not a term'))
+
+def test_result_columns():
+    conn = connect()
+    ex = "http://example.org/columns/"
+    p = conn.createURI(ex + "p")
+    q = conn.createURI(ex + "q")
+    for i in range(10):
+        s = conn.createURI(ex + "s%d" % i)
+        conn.add(s, p, conn.createLiteral(i))
+        conn.add(s, q, conn.createLiteral(i % 2 == 0))
+
+    query = conn.prepareTupleQuery(QueryLanguage.SPARQL,
+        "select ?s ?i ?b { ?s <%s> ?i ; <%s> ?b } order by ?i" % (p, q))
+    columns = query.evaluate().toColumns()
+    eq_(range(10), columns['i'])
+    eq_([i % 2 == 0 for i in range(10)], columns['b'])
+    eq_(conn.createURI(ex + "s3"), columns['s'][3])
+
+    try:
+        import numpy
+    except ImportError:
+        raise SkipTest("NumPy is not installed.")
+    arrays = query.evaluate().toArrays(dtypes={'i': 'float64'})
+    eq_(numpy.dtype('float64'), arrays['i'].dtype)
+    eq_(numpy.dtype('bool'), arrays['b'].dtype)
+    eq_(object, arrays['s'].dtype)
+    eq_(45.0, arrays['i'].sum())
+
+def test_paged_results():
+    conn = connect()
+    ex = "http://example.org/paged/"
+    p = conn.createURI(ex + "p")
+    conn.addTriples([(conn.createURI(ex + "s%d" % i), p, conn.createLiteral(i)) for i in range(95)])
+
+    for prefetch in (0, 2):
+        result = conn.iterStatements(None, p, None, page_size=10, prefetch=prefetch)
+        assert_raises(TypeError, len, result)
+        eq_(95, len(set(str(stmt.getSubject()) for stmt in result)))
+        eq_(95, len(result))
+
+    query = conn.prepareTupleQuery(QueryLanguage.SPARQL,
+        "select ?o { ?s <%s> ?o } order by ?o" % p)
+    result = query.evaluate(page_size=20, prefetch=1)
+    eq_(['o'], result.getBindingNames())
+    eq_(range(95), [bindings.getValue('o').intValue() for bindings in result])
+
+    # Abandoning the result stops the fetching of pages.
+    result = conn.iterStatements(None, p, None, page_size=10)
+    result.next()
+    result.close()
+
+def test_prepared_query():
+    conn = connect()
+    ex = "http://example.org/prepared/"
+    p = conn.createURI(ex + "p")
+    subjects = [conn.createURI(ex + "s%d" % i) for i in range(5)]
+    conn.addTriples([(s, p, conn.createLiteral(i)) for i, s in enumerate(subjects)])
+
+    query = conn.prepareTupleQuery(QueryLanguage.SPARQL, "select ?o { ?s <%s> ?o }" % p)
+    prepared = query.prepare()
+    eq_([3], [bindings.getValue('o').intValue() for bindings in prepared.execute(s=subjects[3])])
+    results = prepared.executeMany([{'s': s} for s in subjects], maxConnections=2)
+    eq_(range(5), [result.next().getValue('o').intValue() for result in results])
+
+    # Bindings of the query itself are kept.
+    query = conn.prepareTupleQuery(QueryLanguage.SPARQL, "select ?s { ?s ?pred ?o }")
+    query.setBinding('pred', p)
+    eq_(1, len(query.prepare().execute(o=conn.createLiteral(2))))
+
+    ask = conn.prepareBooleanQuery(QueryLanguage.SPARQL, "ask { ?s <%s> ?o }" % p).prepare()
+    assert ask.execute(o=conn.createLiteral(4))
+    assert not ask.execute(o=conn.createLiteral(5))
+
+def test_query_cache():
+    conn = connect()
+    ex = "http://example.org/cache/"
+    p = conn.createURI(ex + "p")
+    conn.add(conn.createURI(ex + "a"), p, conn.createLiteral(1))
+    cache = conn.enableQueryCache(size=10, ttl=60)
+
+    query = conn.prepareTupleQuery(QueryLanguage.SPARQL, "select ?s { ?s <%s> ?o }" % p)
+    eq_(1, len(query.evaluate()))
+    eq_(1, len(query.evaluate()))
+    eq_(1, cache.stats()['hits'])
+    ask = conn.prepareBooleanQuery(QueryLanguage.SPARQL, "ask { ?s <%s> 2 }" % p)
+    assert not ask.evaluate()
+    assert not ask.evaluate()
+    eq_(2, cache.stats()['hits'])
+
+    # Adding through the connection empties the cache.
+    conn.add(conn.createURI(ex + "b"), p, conn.createLiteral(2))
+    eq_(2, len(query.evaluate()))
+    assert ask.evaluate()
+    conn.prepareUpdate(QueryLanguage.SPARQL, "delete where { ?s <%s> 2 }" % p).evaluate()
+    eq_(1, len(query.evaluate()))
+
+    # So does adding through another connection sharing the cache.
+    other = conn.repository.getConnection()
+    other.enableQueryCache(cache=cache)
+    eq_(1, len(other.prepareTupleQuery(QueryLanguage.SPARQL, "select ?s { ?s <%s> ?o }" % p).evaluate()))
+    other.add(conn.createURI(ex + "c"), p, conn.createLiteral(3))
+    eq_(2, len(query.evaluate()))
+    stats = conn.getQueryCacheStats()
+    eq_(3, stats['hits'])
+    assert stats['invalidations'] >= 3
+
+    conn.disableQueryCache()
+    eq_(None, conn.getQueryCacheStats())
+
+def test_query_cache_eviction():
+    from franz.openrdf.query.querycache import QueryCache
+    cache = QueryCache(size=2, ttl=60)
+    cache.put('a', 'A', cache.generation)
+    cache.put('b', 'B', cache.generation)
+    eq_('A', cache.get('a'))
+    cache.put('c', 'C', cache.generation)
+    eq_(None, cache.get('b'))
+    eq_('A', cache.get('a'))
+    # A response read before an invalidation is not kept.
+    generation = cache.generation
+    cache.invalidate()
+    cache.put('d', 'D', generation)
+    eq_(None, cache.get('d'))
+    expired = QueryCache(ttl=-1)
+    expired.put('a', 'A', expired.generation)
+    eq_(None, expired.get('a'))
+
+def test_result_formats():
+    from franz.openrdf.query.tuplequeryresultformat import TupleQueryResultFormat
+    conn = connect()
+    ex = "http://example.org/formats/"
+    p = conn.createURI(ex + "p")
+    conn.addTriples([(conn.createURI(ex + "a"), p, conn.createLiteral(u'tab\there "caf\xe9"', language="fr")),
+                     (conn.createURI(ex + "b"), p, conn.createLiteral(42)),
+                     (conn.createURI(ex + "c"), p, conn.createURI(ex + "d"))])
+    query = conn.prepareTupleQuery(QueryLanguage.SPARQL,
+        "select ?s ?o ?none { ?s <%s> ?o optional { ?s <%s> ?none } } order by ?s" % (p, ex + "none"))
+
+    def rows(format):
+        return [(b['s'], b['o'], b['none']) for b in query.evaluate(format=format)]
+    expected = rows(TupleQueryResultFormat.JSON)
+    eq_(3, len(expected))
+    eq_(expected, rows(TupleQueryResultFormat.TSV))
+    # CSV only keeps the text of the values.
+    def text(term):
+        return term.getLabel() if isinstance(term, Literal) else term.getURI()
+    eq_([(text(s), text(o)) for s, o, none in expected],
+        [(text(s), text(o)) for s, o, none in rows(TupleQueryResultFormat.CSV)])
+    assert_raises(IllegalOptionException, query.evaluate, stream=True, format=TupleQueryResultFormat.TSV)
+
+def test_tabular_decoders():
+    from franz.miniclient.tabular import decodeCSV, decodeTSV
+    eq_({'names': ['s', 'o', 'x'],
+         'values': [['<http://a>', '"a\\tb"@en', None],
+                    ['_:b1', '"42"^^<http://www.w3.org/2001/XMLSchema#integer>',
+                     '"true"^^<http://www.w3.org/2001/XMLSchema#boolean>']]},
+        decodeTSV('?s\t?o\t?x\r\n<http://a>\t"a\\tb"@en\t\r\n_:b1\t42\ttrue\r\n'))
+    eq_({'names': ['s', 'o'], 'values': [['http://a', 'x, "y"'], ['_:b', None]]},
+        decodeCSV('s,o\r\nhttp://a,"x, ""y"""\r\n_:b,\r\n'))
+    eq_({'names': ['s'], 'values': [[u'caf\xe9']]}, decodeCSV('s\ncaf\xc3\xa9\n'))
+    # Rows only end at line breaks, not at the other line separators.
+    eq_({'names': ['s'], 'values': [[u'a\u2028b\x0cc']]}, decodeCSV(u's\r\na\u2028b\x0cc\r\n'))
+    # Values that look like N-Triples terms are still plain literals.
+    values = decodeCSV('s,o\n<http://a>,_:b\n')['values'][0]
+    eq_([Literal('<http://a>'), Literal('_:b')], [Statement.stringTermToTerm(value) for value in values])
+
+def test_request_hooks():
+    from franz.miniclient.instrument import HistogramCollector, addRequestHook, removeRequestHook
+    conn = connect()
+    ended = []
+    class Hook(object):
+        def on_request_start(self, info):
+            ended.append(None)
+        def on_request_end(self, info):
+            ended[-1] = info
+    hook = Hook()
+    collector = HistogramCollector()
+    addRequestHook(hook)
+    addRequestHook(collector)
+    try:
+        conn.size()
+        conn.prepareTupleQuery(QueryLanguage.SPARQL, "select ?s { ?s ?p ?o } limit 1").evaluate()
+    finally:
+        removeRequestHook(hook)
+        removeRequestHook(collector)
+    conn.size()
+
+    eq_(2, len(ended))
+    info = ended[-1]
+    eq_(('GET', 200), (info.method, info.status))
+    assert info.path.endswith(STORE)
+    assert info.bytesDown > 0 and info.totalTime > 0 and info.decodeTime > 0
+    assert 0 <= info.phases()['wait'] <= info.totalTime
+    stats = collector.stats()
+    eq_(2, sum(endpoint['count'] for endpoint in stats.values()))
+    eq_(0, sum(endpoint['errors'] for endpoint in stats.values()))
+    assert 'GET' in collector.report()
+
+def test_session_pool():
+    from franz.openrdf.repository.sessionpool import SessionPool
+    from franz.miniclient.repository import SessionKeeper
+    conn = connect()
+    ex = "http://example.org/sessionpool/"
+    with SessionPool(conn.repository, size=2, lifetime=120, preopen=True) as pool:
+        eq_(2, pool.open)
+        assert len(SessionKeeper.instance()) >= 2
+        with pool.session() as first:
+            first.add(conn.createURI(ex + "a"), conn.createURI(ex + "p"), conn.createURI(ex + "b"))
+            first.commit()
+            first.add(conn.createURI(ex + "c"), conn.createURI(ex + "p"), conn.createURI(ex + "d"))
+            with pool.session() as second:
+                assert second is not first
+                assert_raises(ServerException, pool.getConnection, 0.1)
+        # The uncommitted add was rolled back, and the session is reused.
+        eq_(1, conn.size())
+        with pool.session() as again:
+            assert again in (first, second)
+            eq_(1, again.size())
+        eq_(2, len(pool.idle))
+        # A session the SessionKeeper could not ping is not handed out.
+        lost = pool.idle[-1]
+        lost._get_mini_repository().sessionLost = True
+        with pool.session() as other:
+            assert other is not lost
+        eq_(1, pool.open)
+        eq_([other], pool.idle)
+    eq_(0, len(pool.idle))
+    assert_raises(ServerException, pool.getConnection)
+
+def test_transaction():
+    from franz.miniclient.instrument import addRequestHook, removeRequestHook
+    from franz.openrdf.repository.transaction import Transaction
+    conn = connect()
+    ex = "http://example.org/transaction/"
+    p = conn.createURI(ex + "p")
+    g = conn.createURI(ex + "g")
+    a, b, c = [conn.createURI(ex + name) for name in "abc"]
+    conn.addTriple(a, p, b, contexts=g)
+    conn.openSession()
+    try:
+        requests = []
+        class Hook(object):
+            def on_request_start(self, info):
+                requests.append(info.path.rsplit('/', 1)[-1])
+            def on_request_end(self, info):
+                pass
+        hook = Hook()
+        addRequestHook(hook)
+        try:
+            with conn.transaction() as tx:
+                for i in range(20):
+                    tx.addTriple(conn.createURI(ex + "s%d" % i), p, conn.createLiteral(i), contexts=g)
+                # An add followed by a remove of the same quad cancels out.
+                tx.addTriple(a, p, c, contexts=g)
+                tx.removeTriples(a, p, c, contexts=g)
+                tx.removeTriples(a, p, b, contexts=g)
+                eq_(22, tx.size())
+                eq_([], requests)
+        finally:
+            removeRequestHook(hook)
+        eq_(['delete', 'statements', 'commit'], requests)
+        eq_(20, conn.size(g))
+
+        # Rolling back never contacts the server.
+        def fail():
+            with conn.transaction() as tx:
+                tx.addTriple(a, p, b, contexts=g)
+                raise ValueError()
+        assert_raises(ValueError, fail)
+        eq_(20, conn.size(g))
+        assert_raises(IllegalArgumentException, Transaction(conn).removeTriples, a, None, None)
+    finally:
+        conn.closeSession()
+
+def test_add_columns():
+    conn = connect()
+    ex = "http://example.org/columns/"
+    p, q = conn.createURI(ex + "p"), conn.createURI(ex + "q")
+    g = conn.createURI(ex + "g")
+    subjects = [conn.createURI(ex + "s%d" % (i // 2)) for i in range(10)]
+    objects = [1, u"caf\xe9", 1.5, True, conn.createURI(ex + "o")] * 2
+    conn.addColumns(subjects, p, objects)
+    conn.addColumns(subjects, [p, q] * 5, range(10), contexts=g)
+    eq_(20, conn.size())
+    eq_(10, conn.size(g))
+    eq_(15, len(conn.getStatements(None, p, None)))
+    eq_(2, len(conn.getStatements(None, p, conn.createLiteral(True))))
+    eq_(u"caf\xe9", conn.getStatements(subjects[0], p, conn.createLiteral(u"caf\xe9"))[0].getObject().getLabel())
+
+    # Statements, from the server or made here, go through addTriples
+    # unchanged, and so do mixed inputs.
+    statements = conn.getStatements(None, None, None, g)
+    conn.clear()
+    conn.addTriples(statements)
+    eq_(10, conn.size(g))
+    conn.addTriples([conn.createStatement(subjects[0], q, conn.createLiteral(42)),
+                     (subjects[2], q, 43, g), (subjects[4], q, 44)])
+    eq_(13, conn.size())
+    eq_(11, conn.size(g))
+    conn.removeQuads([(subjects[2], q, 43, g), conn.createStatement(subjects[0], q, conn.createLiteral(42))])
+    eq_(11, conn.size())
+
+def test_streaming_writers():
+    import gzip
+    conn = connect()
+    ex = "http://example.org/writers/"
+    s, p, g = [conn.createURI(ex + name) for name in ("s", "p", "g")]
+    conn.addTriple(s, p, conn.createLiteral(u"caf\xe9"))
+    conn.addTriple(s, p, conn.createLiteral(1), contexts=g)
+
+    out = StringIO.StringIO()
+    eq_(2, NQuadsWriter(fileobj=out).write(conn.getStatements(None, None, None)))
+    eq_(sorted(['<%ss> <%sp> "caf\xc3\xa9" .' % (ex, ex),
+                '<%ss> <%sp> "1"^^<%s> <%sg> .' % (ex, ex, XMLSchema.LONG.uri, ex)]),
+        sorted(out.getvalue().splitlines()))
+
+    # Statements made on the client and tuples of Values, and a
+    # compressed file, for N-Triples.
+    path = os.path.join(CURRENT_DIRECTORY, "writers.nt.gz")
+    try:
+        with NTriplesWriter(path) as writer:
+            writer.write([conn.createStatement(s, p, conn.createLiteral(2), g), (s, p, g)])
+            writer.write(conn.getStatements(None, None, None, g))
+        eq_(3, writer.count)
+        lines = gzip.open(path).read().splitlines()
+    finally:
+        os.remove(path)
+    eq_(['<%ss> <%sp> "2"^^<%s> .' % (ex, ex, XMLSchema.LONG.uri),
+         '<%ss> <%sp> <%sg> .' % (ex, ex, ex),
+         '<%ss> <%sp> "1"^^<%s> .' % (ex, ex, XMLSchema.LONG.uri)], lines)
+
+def test_parallel_export():
+    import gzip, hashlib, json, shutil
+    from franz.openrdf.tools.parallel_export import ParallelExporter, context_partitions, subject_partitions
+    conn = connect()
+    ex = "http://example.org/export/"
+    p = conn.createURI(ex + "p")
+    g1, g2 = conn.createURI(ex + "g1"), conn.createURI(ex + "g2")
+    conn.addTriples([(conn.createURI(ex + "s%d" % i), p, i, [None, g1, g2][i % 3]) for i in range(30)])
+
+    directory = os.path.join(CURRENT_DIRECTORY, "export")
+    try:
+        exporter = ParallelExporter(conn.repository, directory, workers=2, report=lambda line: None)
+        manifest = exporter.export(context_partitions(conn))
+        eq_(30, manifest['statements'])
+        eq_([], manifest['failed'])
+        eq_([[None], [g1.toNTriples()], [g2.toNTriples()]],
+            sorted(entry['contexts'] for entry in manifest['partitions']))
+        eq_(manifest, json.load(open(os.path.join(directory, "manifest.json"))))
+        for entry in manifest['partitions']:
+            eq_(10, entry['statements'])
+            data = gzip.open(os.path.join(directory, entry['file'])).read()
+            eq_(entry['sha256'], hashlib.sha256(data).hexdigest())
+            eq_(10, len(data.splitlines()))
+
+        shutil.rmtree(directory)
+        exporter = ParallelExporter(conn.repository, directory, format=RDFFormat.NTRIPLES,
+                                    compress=False, report=lambda line: None)
+        manifest = exporter.export(context_partitions(conn)[1:])
+        eq_(20, manifest['statements'])
+        lines = open(os.path.join(directory, manifest['partitions'][0]['file'])).read().splitlines()
+        eq_(10, len(lines))
+        assert lines[0].endswith('> .') and g1.toNTriples() not in lines[0]
+        partition, = subject_partitions([("<%ss0>" % ex, "<%ss9>" % ex)])
+        eq_(["<%ss0>" % ex, "<%ss9>" % ex], partition.describe()['subjects'])
+    finally:
+        shutil.rmtree(directory, True)
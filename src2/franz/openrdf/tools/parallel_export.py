@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+"""
+Usage: python -m franz.openrdf.tools.parallel_export --help
+
+Exports a repository into a directory, one file per partition of its
+statements, with several worker threads. The partitions are the default
+graph and each context (named graph), or given ranges of subjects. Each
+worker has a connection of its own, and saves the statements of a
+partition to its file as the server sends them (see saveResponse),
+without decoding them, gzip-compressed by default.
+
+A partition is written to a temporary file which is renamed when it is
+complete, and is tried again from scratch when it fails. The manifest
+(manifest.json) lists for each partition its file, the number of
+statements (lines) and bytes in it and the SHA-256 checksum of those
+bytes, all of the uncompressed data, and the partitions that failed.
+"""
+
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from .parallel_load import _number, _print
+from ..query.dataset import ALL_CONTEXTS, MINI_NULL_CONTEXT
+from ..repository.repository import Repository
+from ..rio.rdfformat import RDFFormat
+from ..sail.allegrographserver import AllegroGraphServer
+
+from Queue import Queue
+import copy, datetime, gzip, hashlib, json, locale, os, sys, threading, time, traceback
+
+MANIFEST = 'manifest.json'
+
+def _ntriples(term):
+    return term if term is None or isinstance(term, basestring) else term.toNTriples()
+
+class Partition(object):
+    """
+    The statements of the given contexts (ALL_CONTEXTS for all of them,
+    MINI_NULL_CONTEXT for the default graph) whose subjects are in the
+    range subjects, a (start, end) pair of URIs or ntriples strings, or
+    any subject if that is None.
+    """
+    def __init__(self, name, contexts=ALL_CONTEXTS, subjects=None):
+        self.name = name
+        self.contexts = contexts
+        self.subjects = subjects
+
+    def fetch(self, conn):
+        """
+        Get the statements through conn, whose response is being saved.
+        """
+        # RepositoryConnection.getStatements would take a pair of
+        # subjects as a list of them rather than a range.
+        subjects = self.subjects and tuple(_ntriples(term) for term in self.subjects)
+        conn._get_mini_repository().getStatements(subjects, None, None,
+            conn._contexts_to_ntriple_contexts(self.contexts))
+
+    def describe(self):
+        """
+        What the manifest says about the partition besides its file: its
+        contexts as ntriples strings, with None for the default graph,
+        or None for all of them, and its range of subjects.
+        """
+        if self.contexts == ALL_CONTEXTS:
+            contexts = None
+        elif self.contexts == MINI_NULL_CONTEXT:
+            contexts = [None]
+        else:
+            contexts = [_ntriples(cxt) for cxt in self.contexts]
+        return {'name': self.name,
+                'contexts': contexts,
+                'subjects': self.subjects and [_ntriples(term) for term in self.subjects]}
+
+    def __repr__(self):
+        return self.name
+
+def context_partitions(conn):
+    """
+    A Partition for the default graph and for each context of the
+    repository of conn.
+    """
+    partitions = [Partition('default graph', MINI_NULL_CONTEXT)]
+    for context in conn.getContextIDs():
+        partitions.append(Partition(context.toNTriples(), [context]))
+    return partitions
+
+def subject_partitions(ranges, contexts=ALL_CONTEXTS):
+    """
+    A Partition for each (start, end) range of subjects in ranges, as
+    the server orders them, which is meant for subjects that have an
+    order, such as encoded ids (see registerEncodedIdPrefix). The ranges
+    should not overlap, and the statements whose subjects are in none of
+    them are not exported.
+    """
+    return [Partition('%s - %s' % (start, end), contexts, (start, end)) for start, end in ranges]
+
+class _CountingFile(object):
+    """
+    Writes to fileobj, keeping the number of bytes and lines written
+    and their SHA-256 checksum.
+    """
+    def __init__(self, fileobj):
+        self.file = fileobj
+        self.bytes = 0
+        self.lines = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        self.lines += data.count('\n')
+        self.file.write(data)
+
+def _message(error):
+    return "".join(traceback.format_exception_only(type(error), error)).strip()
+
+class ParallelExporter(object):
+    """
+    Exports partitions of a repository (a Repository object) into files
+    in 'directory' with 'workers' threads; see the module documentation.
+
+    format is RDFFormat.NQUADS or RDFFormat.NTRIPLES (which leaves out
+    the contexts), compress whether the files are gzip-compressed and
+    retries the number of times a failed partition is tried again.
+
+    report(line) is called with a line of progress every 'interval'
+    seconds.
+    """
+    def __init__(self, repository, directory, workers=4, format=RDFFormat.NQUADS, compress=True,
+                 retries=3, interval=10, report=None):
+        self.repository = repository
+        self.directory = directory
+        self.workers = workers
+        self.format = format
+        self.compress = compress
+        self.retries = retries
+        self.interval = interval
+        self.report = report or _print
+
+    def _connection(self):
+        conn = self.repository.getConnection()
+        # saveResponse keeps the file it saves to in the mini repository,
+        # so each worker needs one of its own.
+        conn.mini_repository = copy.copy(self.repository.mini_repository)
+        return conn
+
+    def _fileName(self, index):
+        name = '%04d.%s' % (index, self.format.file_extensions[0])
+        return name + '.gz' if self.compress else name
+
+    def _export(self, conn, partition, path, current):
+        """
+        Save partition to path and return its manifest entry. current is
+        set to the _CountingFile being written, for the progress reports.
+        """
+        temp = path + '.part'
+        start = time.time()
+        with open(temp, 'wb') as raw:
+            out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if self.compress else raw
+            counter = current[0] = _CountingFile(out)
+            with conn.saveResponse(counter, self.format.mime_types[0], raiseAll=True):
+                partition.fetch(conn)
+            if self.compress:
+                out.close()
+        os.rename(temp, path)
+        entry = partition.describe()
+        entry.update({'file': os.path.basename(path), 'statements': counter.lines,
+                      'bytes': counter.bytes, 'sha256': counter.sha256.hexdigest(),
+                      'seconds': time.time() - start})
+        return entry
+
+    def _work(self, tasks, entries, failed, current, done):
+        conn = None
+        try:
+            conn = self._connection()
+            while True:
+                task = tasks.get()
+                if task is None:
+                    break
+                index, partition = task
+                path = os.path.join(self.directory, self._fileName(index))
+                for attempt in range(self.retries + 1):
+                    try:
+                        entries[index] = self._export(conn, partition, path, current)
+                        break
+                    except Exception, error:
+                        current[0] = None
+                        if os.path.exists(path + '.part'):
+                            os.remove(path + '.part')
+                        if attempt == self.retries:
+                            message = _message(error)
+                            failed.append({'name': partition.name, 'error': message})
+                            self.report("Partition %r failed: %s" % (partition, message))
+                        else:
+                            time.sleep(2 ** attempt)
+                current[0] = None
+                done.append(index)
+        except Exception, error:
+            # The partitions this worker did not get to are left to the
+            # others, or else reported by export().
+            self.report("Worker failed: %s" % _message(error))
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def export(self, partitions):
+        """
+        Export the partitions, write the manifest, and return it as a
+        dictionary with the entries of the partitions exported, those
+        that failed (including those left over when the workers failed),
+        and the number of statements and bytes exported and the time
+        taken.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        tasks = Queue()
+        for task in enumerate(partitions):
+            tasks.put(task)
+        entries = {}
+        failed = []
+        done = []
+        # The file each worker is writing, if any.
+        currents = [[None] for worker in range(self.workers)]
+        threads = []
+        for worker in range(self.workers):
+            tasks.put(None)
+            thread = threading.Thread(target=self._work, name="ParallelExporter-%d" % worker,
+                                      args=(tasks, entries, failed, currents[worker], done))
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+
+        begin = last = time.time()
+        reported = 0
+        while [thread for thread in threads if thread.isAlive()]:
+            threads[0].join(1)
+            now = time.time()
+            if now - last >= self.interval:
+                # With an interval of 0, now may still be last.
+                elapsed = max(now - last, 1e-6)
+                written = sum(entry['bytes'] for entry in entries.values())
+                written += sum(current[0].bytes for current in currents if current[0] is not None)
+                statements = sum(entry['statements'] for entry in entries.values())
+                statements += sum(current[0].lines for current in currents if current[0] is not None)
+                self.report("%s statements, %s bytes, %s bytes/s, %d of %d partitions" % (
+                    _number(statements), _number(written), _number((written - reported) / elapsed),
+                    len(done), len(partitions)))
+                reported = written
+                last = now
+            threads = [thread for thread in threads if thread.isAlive()]
+
+        for index, partition in enumerate(partitions):
+            if index not in entries and index not in done:
+                failed.append({'name': partition.name, 'error': 'Not exported: no worker was left to export it.'})
+                self.report("Partition %r was not exported." % (partition,))
+        seconds = time.time() - begin
+        exported = [entries[index] for index in sorted(entries)]
+        manifest = {'repository': self.repository.getDatabaseName(),
+                    'format': self.format.name,
+                    'mime_type': self.format.mime_types[0],
+                    'compressed': self.compress,
+                    'created': datetime.datetime.utcnow().isoformat() + 'Z',
+                    'partitions': exported,
+                    'failed': failed,
+                    'statements': sum(entry['statements'] for entry in exported),
+                    'bytes': sum(entry['bytes'] for entry in exported),
+                    'seconds': seconds}
+        with open(os.path.join(self.directory, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        self.report("Exported %s statements in %d partitions in %.1f seconds (%s bytes/s), %d partitions failed." % (
+            _number(manifest['statements']), len(exported), seconds,
+            _number(manifest['bytes'] / max(seconds, 1e-6)), len(failed)))
+        return manifest
+
+def read_ranges(path):
+    """
+    Read the subject ranges from path, a file with a start and an end
+    URI (in angle brackets) on each line.
+    """
+    ranges = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                start, end = line.split()
+                ranges.append((start, end))
+    return ranges
+
+def main(argv=None):
+    from optparse import OptionParser
+
+    locale.setlocale(locale.LC_ALL, '')
+    usage = ('Usage: %prog [options] directory\n\n'
+        'Exports a repository into files in directory, one for the default\n'
+        'graph and one for each context, or one for each range of subjects\n'
+        'given with --subjects, with several worker threads, and writes a\n'
+        'manifest of them.\n\n'
+        'Environment Variables Consulted:\n'
+        'AGRAPH_HOST [default=localhost]\n'
+        'AGRAPH_PORT [default=10035]\n'
+        'AGRAPH_USER [default=test]\n'
+        'AGRAPH_PASSWORD [default=xyzzy]')
+    parser = OptionParser(usage=usage)
+    parser.add_option('-w', '--workers', type='int', default=4,
+        help='number of exporting threads [default=%default]')
+    parser.add_option('-c', '--catalog', default=None,
+        help='catalog name on the server, the root catalog if not given')
+    parser.add_option('-r', '--repository', default='load_test',
+        help='repository name in the catalog [default=%default]')
+    parser.add_option('-s', '--subjects', default=None, metavar='FILE',
+        help='partition by the subject ranges in FILE, one "<start> <end>" pair per line, '
+            'instead of by context')
+    parser.add_option('-t', '--ntriples', action='store_true', default=False,
+        help='write N-Triples, without the contexts, rather than N-Quads')
+    parser.add_option('-u', '--uncompressed', action='store_true', default=False,
+        help='do not gzip the files')
+    parser.add_option('-n', '--retries', type='int', default=3,
+        help='number of times to retry a failed partition [default=%default]')
+    parser.add_option('-i', '--interval', type='int', default=10,
+        help='seconds between progress reports [default=%default]')
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('give one output directory')
+
+    server = AllegroGraphServer(os.environ.get('AGRAPH_HOST', 'localhost'),
+        int(os.environ.get('AGRAPH_PORT', '10035')), os.environ.get('AGRAPH_USER', 'test'),
+        os.environ.get('AGRAPH_PASSWORD', 'xyzzy'))
+    repository = server.openCatalog(options.catalog).getRepository(options.repository, Repository.OPEN)
+    if options.subjects:
+        partitions = subject_partitions(read_ranges(options.subjects))
+    else:
+        conn = repository.getConnection()
+        partitions = context_partitions(conn)
+        conn.close()
+    exporter = ParallelExporter(repository, args[0], workers=options.workers,
+        format=RDFFormat.NTRIPLES if options.ntriples else RDFFormat.NQUADS,
+        compress=not options.uncompressed, retries=options.retries, interval=options.interval)
+    result = exporter.export(partitions)
+    return 1 if result['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+"""
+Usage: python -m franz.openrdf.tools.parallel_load --help
+
+Loads N-Triples and RDF/XML files into a repository with several worker
+processes. N-Triples files are split into chunks of about the same
+number of bytes, on line boundaries, so that one large file is loaded
+by all the workers rather than one; RDF/XML files are loaded whole.
+Chunks are handed out largest first, so the work is scheduled by size
+rather than by file count.
+
+Each worker loads through its own session. A chunk is committed when
+it has been loaded and rolled back and retried when loading it fails,
+so a retried chunk is not added twice (unless a commit size splits it
+into several commits).
+"""
+
+from __future__ import absolute_import
+from __future__ import with_statement
+
+from ..repository.repository import Repository
+from ..rio.rdfformat import RDFFormat
+from ..sail.allegrographserver import AllegroGraphServer
+
+from multiprocessing import Process, Queue
+from Queue import Empty
+import locale, os, sys, time, traceback
+
+NTRIPLES_EXTENSIONS = ['.nt', '.ntriples']
+RDFXML_EXTENSIONS = ['.rdf', '.owl']
+
+class Chunk(object):
+    """
+    The byte range [start, end) of a file, which holds whole lines for
+    N-Triples and the whole file for RDF/XML.
+    """
+    def __init__(self, path, format, start, end):
+        self.path = path
+        self.format = format
+        self.start = start
+        self.end = end
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    def open(self):
+        return _RangeReader(self.path, self.start, self.end)
+
+    def __repr__(self):
+        return "%s[%d:%d]" % (self.path, self.start, self.end)
+
+class _RangeReader(object):
+    """
+    File-like object reading the bytes between start and end of a file.
+    """
+    def __init__(self, path, start, end):
+        self.name = path
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+def file_format(path):
+    """
+    The RDFFormat of path according to its extension, or None.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in NTRIPLES_EXTENSIONS:
+        return RDFFormat.NTRIPLES
+    if ext in RDFXML_EXTENSIONS:
+        return RDFFormat.RDFXML
+    return None
+
+def split_file(path, chunk_bytes):
+    """
+    Split the N-Triples file path into Chunks of about chunk_bytes bytes
+    that start and end on line boundaries.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        while bounds[-1] + chunk_bytes < size:
+            # Continue to the start of the line after the boundary.
+            f.seek(bounds[-1] + chunk_bytes - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [Chunk(path, RDFFormat.NTRIPLES, start, end)
+            for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def plan_chunks(paths, chunk_bytes):
+    """
+    Return the Chunks to load the given files in, largest first.
+    """
+    chunks = []
+    for path in paths:
+        format = file_format(path)
+        if format == RDFFormat.NTRIPLES:
+            chunks.extend(split_file(path, chunk_bytes))
+        elif format == RDFFormat.RDFXML:
+            chunks.append(Chunk(path, format, 0, os.path.getsize(path)))
+        else:
+            raise ValueError("Unknown file format for '%s'." % path)
+    chunks.sort(key=lambda chunk: chunk.size, reverse=True)
+    return chunks
+
+def _load_chunks(worker, settings, tasks, results):
+    """
+    The body of a worker process: load the (index, Chunk) pairs from
+    tasks until a None is found, posting progress to results.
+    """
+    server = AllegroGraphServer(settings['host'], settings['port'], settings['user'], settings['password'])
+    repository = server.openCatalog(settings['catalog']).getRepository(settings['repository'], Repository.OPEN)
+    conn = repository.getConnection()
+    conn.openSession(False, settings['lifetime'])
+    conn.add_commit_size = settings['commit_size']
+    context = settings['context'] and conn.createURI(settings['context'])
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        index, chunk = task
+        start = time.time()
+        for attempt in range(settings['retries'] + 1):
+            sent = [0, 0]
+            def progress(bytes, lines):
+                results.put(('progress', worker, lines - sent[1], bytes - sent[0]))
+                sent[:] = [bytes, lines]
+            reader = chunk.open()
+            try:
+                try:
+                    conn.addFile(reader, base=settings['base_uri'], format=chunk.format,
+                                 context=context, progress=progress)
+                finally:
+                    reader.close()
+                conn.commit()
+                results.put(('done', worker, index, sent[1], time.time() - start))
+                break
+            except Exception, error:
+                # Take back what this attempt reported.
+                results.put(('progress', worker, -sent[1], -sent[0]))
+                try:
+                    conn.rollback()
+                except Exception:
+                    # The session may be gone; start a new one.
+                    try:
+                        conn.closeSession()
+                    except Exception:
+                        pass
+                    conn.openSession(False, settings['lifetime'])
+                if attempt == settings['retries']:
+                    results.put(('failed', worker, index, "".join(traceback.format_exception_only(type(error), error))))
+                else:
+                    time.sleep(2 ** attempt)
+
+    conn.closeSession()
+    conn.close()
+    results.put(('exit', worker))
+
+class ParallelLoader(object):
+    """
+    Loads files into a repository with 'workers' processes, each with its
+    own session; see the module documentation.
+
+    chunk_bytes is the size N-Triples files are split at, retries the
+    number of times a failed chunk is tried again, and commit_size, if
+    given, the add_commit_size of the workers' connections. context
+    (a URI string) is the graph to load into, the default graph if None.
+
+    report(line) is called with a line of progress every 'interval'
+    seconds, giving the lines per second of each worker. Lines are what
+    the workers count as they send the files: one per triple in
+    N-Triples, but not in RDF/XML.
+    """
+    def __init__(self, host, port, user, password, catalog, repository, workers=4,
+                 chunk_bytes=64 * 1024 * 1024, retries=3, commit_size=None, context=None,
+                 base_uri=None, lifetime=3600, interval=10, report=None):
+        self.settings = {'host': host, 'port': port, 'user': user, 'password': password,
+                         'catalog': catalog, 'repository': repository, 'retries': retries,
+                         'commit_size': commit_size, 'context': context, 'base_uri': base_uri,
+                         'lifetime': lifetime}
+        self.workers = workers
+        self.chunk_bytes = chunk_bytes
+        self.interval = interval
+        self.report = report or _print
+
+    def load(self, paths):
+        """
+        Load the files in paths and return a dictionary with the number of
+        chunks loaded, the list of the (chunk, error) pairs that could not
+        be, including those left over when workers died, the number of
+        lines loaded and the time taken.
+        """
+        chunks = plan_chunks(paths, self.chunk_bytes)
+        tasks = Queue()
+        results = Queue()
+        for task in enumerate(chunks):
+            tasks.put(task)
+        for worker in range(self.workers):
+            tasks.put(None)
+
+        processes = [Process(target=_load_chunks, args=(worker, self.settings, tasks, results))
+                     for worker in range(self.workers)]
+        for process in processes:
+            process.start()
+
+        begin = last = time.time()
+        lines = [0] * self.workers
+        reported = [0] * self.workers
+        loaded = 0
+        failed = []
+        finished = set()
+        running = self.workers
+        while running:
+            try:
+                message = results.get(timeout=1)
+            except Empty:
+                message = None
+                if not [p for p in processes if p.is_alive()]:
+                    break
+            if message and message[0] == 'progress':
+                lines[message[1]] += message[2]
+            elif message and message[0] == 'done':
+                loaded += 1
+                finished.add(message[2])
+            elif message and message[0] == 'failed':
+                chunk = chunks[message[2]]
+                finished.add(message[2])
+                failed.append((chunk, message[3]))
+                self.report("Chunk %r failed: %s" % (chunk, message[3].strip()))
+            elif message and message[0] == 'exit':
+                running -= 1
+
+            now = time.time()
+            if now - last >= self.interval:
+                # With an interval of 0, now may still be last.
+                elapsed = max(now - last, 1e-6)
+                rates = ["%d: %s/s" % (worker, _number((lines[worker] - reported[worker]) / elapsed))
+                         for worker in range(self.workers)]
+                self.report("%s lines, %s/s [%s], %d of %d chunks" % (
+                    _number(sum(lines)), _number((sum(lines) - sum(reported)) / elapsed),
+                    ", ".join(rates), loaded, len(chunks)))
+                reported = list(lines)
+                last = now
+
+        for process in processes:
+            process.join()
+        # Chunks are left over when the workers die before loading them.
+        for index, chunk in enumerate(chunks):
+            if index not in finished:
+                failed.append((chunk, "Not loaded: no worker was left to load it.\n"))
+                self.report("Chunk %r was not loaded." % chunk)
+        seconds = time.time() - begin
+        self.report("Loaded %s lines in %d chunks in %.1f seconds (%s lines/s), %d chunks failed." % (
+            _number(sum(lines)), loaded, seconds, _number(sum(lines) / max(seconds, 1e-6)), len(failed)))
+        return {'chunks': loaded, 'failed': failed, 'lines': sum(lines), 'seconds': seconds}
+
+def _number(n):
+    return locale.format("%d", n, grouping=True)
+
+def _print(line):
+    print line
+    sys.stdout.flush()
+
+def find_files(paths, recurse=False):
+    """
+    Expand the directories in paths to the loadable files in them.
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirs, names in os.walk(path):
+            files.extend(os.path.join(root, name) for name in sorted(names) if file_format(name))
+            if not recurse:
+                del dirs[:]
+    return files
+
+def main(argv=None):
+    from optparse import OptionParser
+
+    locale.setlocale(locale.LC_ALL, '')
+    usage = ('Usage: %prog [options] file_or_directory ...\n\n'
+        'Loads .nt, .ntriples, .rdf and .owl files, and those in the given\n'
+        'directories, into a repository with several worker processes.\n\n'
+        'Environment Variables Consulted:\n'
+        'AGRAPH_HOST [default=localhost]\n'
+        'AGRAPH_PORT [default=10035]\n'
+        'AGRAPH_USER [default=test]\n'
+        'AGRAPH_PASSWORD [default=xyzzy]')
+    parser = OptionParser(usage=usage)
+    parser.add_option('-w', '--workers', type='int', default=4,
+        help='number of loading processes [default=%default]')
+    parser.add_option('-c', '--catalog', default=None,
+        help='catalog name on the server, the root catalog if not given')
+    parser.add_option('-r', '--repository', default='load_test',
+        help='repository name in the catalog [default=%default]')
+    parser.add_option('-s', '--chunk-size', type='int', default=64, dest='chunk_mb',
+        help='split N-Triples files into chunks of this many megabytes [default=%default]')
+    parser.add_option('-n', '--retries', type='int', default=3,
+        help='number of times to retry a failed chunk [default=%default]')
+    parser.add_option('-m', '--commit-size', type='int', default=None,
+        help='commit every this many triples within a chunk (chunks are then '
+            'no longer retried as a whole)')
+    parser.add_option('-g', '--graph', default=None,
+        help='URI of the graph to load into [default=the default graph]')
+    parser.add_option('-b', '--baseuri', default=None,
+        help='base URI for RDF/XML files')
+    parser.add_option('-i', '--interval', type='int', default=10,
+        help='seconds between progress reports [default=%default]')
+    parser.add_option('-R', '--recurse', action='store_true', default=False,
+        help='recurse into the directories given')
+    options, args = parser.parse_args(argv)
+    if not args:
+        parser.error('no files given')
+
+    loader = ParallelLoader(os.environ.get('AGRAPH_HOST', 'localhost'),
+        int(os.environ.get('AGRAPH_PORT', '10035')), os.environ.get('AGRAPH_USER', 'test'),
+        os.environ.get('AGRAPH_PASSWORD', 'xyzzy'), options.catalog, options.repository,
+        workers=options.workers, chunk_bytes=options.chunk_mb * 1024 * 1024,
+        retries=options.retries, commit_size=options.commit_size, context=options.graph,
+        base_uri=options.baseuri, interval=options.interval)
+    result = loader.load(find_files(args, options.recurse))
+    return 1 if result['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
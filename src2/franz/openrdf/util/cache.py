@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+"""
+A bounded cache for values that are expensive to compute from a key.
+"""
+
+from __future__ import absolute_import
+
+class LRUCache(object):
+    """
+    Maps keys to values, keeping about the 'size' most recently used
+    entries. A size of 0 disables the cache.
+
+    Recency is tracked in two generations rather than per entry: new
+    entries go to the young generation, and when it is full the old
+    generation is dropped and the young one takes its place. An old
+    entry that is used again moves back to the young generation. This
+    keeps lookups at a single dictionary access, and the dictionary
+    operations make it safe to share between threads.
+    """
+    def __init__(self, size=10000):
+        self.hits = 0
+        self.misses = 0
+        self.resize(size)
+
+    def resize(self, size):
+        """
+        Change the number of entries kept; this empties the cache.
+        """
+        self.size = size
+        self.young = {}
+        self.old = {}
+        self.limit = (size + 1) // 2
+
+    def clear(self):
+        self.resize(self.size)
+
+    def get(self, key, compute):
+        """
+        Return the value for key, calling compute(key) for it if it is not
+        in the cache.
+        """
+        value = self.young.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if not self.size:
+            return compute(key)
+
+        value = self.old.get(key)
+        if value is None:
+            self.misses += 1
+            value = compute(key)
+            if value is None:
+                return value
+        else:
+            self.hits += 1
+
+        young = self.young
+        if len(young) >= self.limit:
+            self.old, self.young = young, {}
+        self.young[key] = value
+        return value
+
+    def __len__(self):
+        return len(self.young) + len(self.old)
+
+    def stats(self):
+        """
+        Return a dictionary with the number of hits and misses, the hit
+        rate, and the number of entries held and allowed.
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+                "entries": len(self),
+                "size": self.size}
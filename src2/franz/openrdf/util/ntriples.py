@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+"""
+Parsing and serializing of single NTriples terms.
+
+Unlike the functions in strings, a term is parsed by a single regular
+expression whatever its kind, escape sequences are only decoded when
+there are any, and non-ASCII input is taken as text rather than bytes.
+Strings (str) are taken to be UTF-8.
+"""
+
+from __future__ import absolute_import
+
+import re
+
+URI, LITERAL, BNODE = 'uri', 'literal', 'bnode'
+
+def unescape(string):
+    """
+    Return string with its NTriples escape sequences decoded, as unicode.
+    """
+    if type(string) is str:
+        string = string.decode('utf-8')
+    if u'\\' not in string:
+        return string
+    # The raw encoding turns the characters past Latin-1 into \u escapes
+    # and leaves the backslashes alone, so the decoding only has escapes
+    # (and Latin-1 bytes, which it reads as Latin-1) to deal with.
+    return string.encode('raw_unicode_escape').decode('unicode_escape')
+
+_term = re.compile(r'<([^>]*)>$'
+                   r'|"(.*)"(?:@([A-Za-z]+(?:-[A-Za-z0-9]+)*)|\^\^<([^>]*)>)?$'
+                   r'|_:([A-Za-z][A-Za-z0-9]*)$', re.DOTALL)
+
+def parse_term(string):
+    """
+    Parse the NTriples term string and return one of (URI, uri),
+    (LITERAL, label, datatype uri or None, lower case language or None)
+    and (BNODE, id), or None if string is not a term.
+    """
+    if type(string) is str:
+        string = string.decode('utf-8')
+    match = _term.match(string)
+    if match is None:
+        return None
+    uri, label, language, datatype, bnode = match.groups()
+    if uri is not None:
+        return URI, unescape(uri)
+    if label is not None:
+        if datatype is not None:
+            datatype = unescape(datatype)
+        return LITERAL, unescape(label), datatype, language and language.lower()
+    return BNODE, bnode
+
+_needs_escape = re.compile(ur'[^\x20\x21\x23-\x5B\x5D-\x7E]')
+_ESCAPES = {u'\t': u'\\t', u'\n': u'\\n', u'\r': u'\\r', u'"': u'\\"', u'\\': u'\\\\'}
+
+def _escape_match(match):
+    char = match.group()
+    escaped = _ESCAPES.get(char)
+    if escaped is None:
+        code = ord(char)
+        escaped = u'\\u%04X' % code if code <= 0xFFFF else u'\\U%08X' % code
+    return escaped
+
+def escape(string):
+    """
+    Return string as unicode, with the characters that NTriples
+    requires (or that are not printable ASCII) escaped.
+    """
+    if isinstance(string, str):
+        string = string.decode('utf-8')
+    elif not isinstance(string, unicode):
+        string = unicode(string)
+    return _needs_escape.sub(_escape_match, string)
+
+def uri_to_ntriples(uri):
+    return u'<%s>' % escape(uri)
+
+def literal_to_ntriples(label, datatype=None, language=None):
+    """
+    Return the NTriples form of a literal; datatype is a URI string.
+    """
+    string = u'"%s"' % escape(label)
+    if language:
+        string += u'@' + language
+    if datatype:
+        string += u'^^<%s>' % escape(datatype)
+    return string
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable-msg=C0103
+
+###############################################################################
+# Copyright (c) 2006-2013 Franz Inc.
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+###############################################################################
+
+"""
+Iteration over results that are fetched a page at a time.
+"""
+
+from __future__ import absolute_import
+
+from Queue import Queue, Full
+import threading, weakref
+
+class PageIterator(object):
+    """
+    Iterates over the rows of a result that fetch(offset, limit) returns
+    a page of at a time, as a list of at most limit rows. The last page
+    is the first one with fewer than page_size rows.
+
+    The first page is fetched by the constructor, so errors in the
+    request are raised there. While the rows of a page are being read,
+    up to 'prefetch' of the following pages are fetched by a background
+    thread; with a prefetch of 0 each page is fetched when it is needed.
+
+    Like a miniclient RowStream, it can stand in for the rows of a
+    RepositoryResult or TupleQueryResult: rowCount is None until all
+    rows have been read, and close() stops the fetching of pages, as
+    does dropping the iterator.
+    """
+    def __init__(self, fetch, page_size, prefetch=1):
+        self.fetch = fetch
+        self.page_size = page_size
+        self.rowCount = None
+        self.count = 0
+        self.page = fetch(0, page_size)
+        self.index = 0
+        self.offset = page_size
+        self.closed = threading.Event()
+        self.pages = None
+        if prefetch and not self._isLast(self.page):
+            self.pages = Queue(prefetch)
+            # The fetcher must not keep the iterator alive: it stops
+            # when the iterator is closed or garbage collected.
+            closed = self.closed
+            owner = weakref.ref(self, lambda ref: closed.set())
+            fetcher = threading.Thread(target=_fetchPages, name="PageIterator",
+                                       args=(fetch, page_size, self.offset, self.pages, closed, owner))
+            fetcher.setDaemon(True)
+            fetcher.start()
+
+    def _isLast(self, page):
+        return len(page) < self.page_size
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.index >= len(self.page):
+            if self._isLast(self.page) or self.closed.isSet():
+                if self.rowCount is None and not self.closed.isSet():
+                    self.rowCount = self.count
+                raise StopIteration
+            self.page = self._nextPage()
+            self.index = 0
+            if not self.page:
+                return self.next()
+        row = self.page[self.index]
+        self.index += 1
+        self.count += 1
+        return row
+
+    def _nextPage(self):
+        if self.pages is None:
+            page = self.fetch(self.offset, self.page_size)
+            self.offset += self.page_size
+            return page
+        page = self.pages.get()
+        if isinstance(page, BaseException):
+            self.closed.set()
+            raise page
+        return page
+
+    def close(self):
+        """
+        Stop reading; pages that are still to be fetched are not.
+        """
+        self.closed.set()
+
+def _fetchPages(fetch, page_size, offset, pages, closed, owner):
+    """
+    The body of the fetcher thread of a PageIterator (owner, a weak
+    reference): put the pages from offset on, or the error that
+    fetching one raised, in pages until the last one.
+    """
+    while not closed.isSet() and owner() is not None:
+        try:
+            page = fetch(offset, page_size)
+        except BaseException, error:
+            page = error
+        # Wait for room, unless the iterator is closed meanwhile.
+        while not closed.isSet() and owner() is not None:
+            try:
+                pages.put(page, timeout=0.5)
+                break
+            except Full:
+                pass
+        if isinstance(page, BaseException) or len(page) < page_size:
+            return
+        offset += page_size